@@ -35,33 +35,54 @@ def unproject(depth, f, cx, cy):
     return np.stack([X, Y, depth], axis=-1)
 
 
-def fit_floor(pts, h, w, iters=600, tol=0.05, seed=0):
+def fit_floor(pts, h, w, iters=600, tol=0.05, seed=0, sample=20000, chunk=64, confidence=0.999):
     """RANSAC a plane, seeded from the bottom-centre where floor is likeliest.
-    Returns (normal, d) for  n . p + d = 0."""
+    Returns (normal, d) for  n . p + d = 0.
+
+    Batched: every hypothesis is drawn up front and scored in chunks as one
+    matrix product against a random `sample` of the band, instead of a Python
+    loop scoring each one against all ~300k band points. The winner is then
+    refined by least squares on its inliers in the same sample."""
     rng = np.random.default_rng(seed)
     band = pts[int(h * 0.62):, int(w * 0.15):int(w * 0.85)].reshape(-1, 3)
     band = band[np.isfinite(band).all(1)]
     if len(band) < 100:
         raise SystemExit("not enough points to fit a floor")
-
-    cands = []
-    for _ in range(iters):
-        p = band[rng.choice(len(band), 3, replace=False)]
-        n = np.cross(p[1] - p[0], p[2] - p[0])
-        norm = np.linalg.norm(n)
-        if norm < 1e-8:
-            continue
-        n = n / norm
-        # A floor's normal points mostly along the camera's Y axis (up/down).
-        if abs(n[1]) < 0.90:
-            continue
-        d = -n.dot(p[0])
-        inl = int((np.abs(band @ n + d) < tol).sum())
-        cands.append((inl, abs(d), n, d))
-
-    if not cands:
+    score = band if len(band) <= sample else band[rng.choice(len(band), sample, replace=False)]
+    score_t = score.T.astype(np.float32)
+
+    # All hypotheses at once. Repeated indices give a zero normal and drop out
+    # with the other degenerate triples.
+    p = band[rng.integers(0, len(band), size=(iters, 3))]
+    n = np.cross(p[:, 1] - p[:, 0], p[:, 2] - p[:, 0])
+    norm = np.linalg.norm(n, axis=1)
+    ok = norm >= 1e-8
+    n = n[ok] / norm[ok, None]
+    # A floor's normal points mostly along the camera's Y axis (up/down).
+    horiz = np.abs(n[:, 1]) >= 0.90
+    n, p0 = n[horiz], p[ok][horiz][:, 0]
+    ds = -(n * p0).sum(1)
+    if not len(n):
         raise SystemExit("no plausible floor plane found")
 
+    # EARLY EXIT. The selection below only ever considers planes holding at
+    # least 45% of the best plane's inliers, so once enough hypotheses are
+    # scored that EVERY such plane has been hit by an all-inlier triple with
+    # the given confidence, the rest are very unlikely to change the answer.
+    inl = np.zeros(len(n), dtype=np.int64)
+    scored = 0
+    while scored < len(n):
+        sl = slice(scored, scored + chunk)
+        inl[sl] = (np.abs(n[sl].astype(np.float32) @ score_t + ds[sl, None].astype(np.float32))
+                   < tol).sum(1)
+        scored = min(len(n), scored + chunk)
+        ratio = 0.45 * inl[:scored].max() / len(score)
+        if ratio >= 1.0:
+            break
+        if ratio > 0 and scored >= np.log(1 - confidence) / np.log(1 - ratio ** 3):
+            break
+    n, ds, inl = n[:scored], ds[:scored], inl[:scored]
+
     # THE FLOOR IS THE LOWEST BIG HORIZONTAL SURFACE, NOT THE MOST POPULOUS ONE.
     # Maximising inliers alone fit the COUNTERTOP in a galley kitchen: it read
     # 0.64m below the camera (i.e. counter height for a 1.5m tripod) with a
@@ -72,13 +93,29 @@ def fit_floor(pts, h, w, iters=600, tol=0.05, seed=0):
     # NEARER the camera. Among horizontal planes with a decent following, the
     # floor is the one FARTHEST below - so take the largest |d|, not the most
     # votes.
-    top = max(c[0] for c in cands)
-    strong = [c for c in cands if c[0] >= 0.45 * top]
-    inl, _, best_n, best_d = max(strong, key=lambda c: c[1])
+    strong = np.flatnonzero(inl >= 0.45 * inl.max())
+    best = strong[np.argmax(np.abs(ds[strong]))]
+    best_n, best_d = n[best], ds[best]
+
+    # Least-squares refinement: the plane through the winner's inliers, by the
+    # smallest principal axis of their scatter. Kept only while it stays a
+    # horizontal plane, and oriented like the winner.
+    for _ in range(2):
+        m = score[np.abs(score @ best_n + best_d) < tol]
+        if len(m) < 3:
+            break
+        c = m.mean(0)
+        rn = np.linalg.eigh((m - c).T @ (m - c))[1][:, 0]
+        if abs(rn[1]) < 0.90:
+            break
+        if rn @ best_n < 0:
+            rn = -rn
+        best_n, best_d = rn, -rn @ c
+    inl_full = int((np.abs(band @ best_n + best_d) < tol).sum())
 
     print(f"floor plane  normal=({best_n[0]:+.2f},{best_n[1]:+.2f},{best_n[2]:+.2f})  "
-          f"inliers={inl}/{len(band)} ({100*inl/len(band):.0f}% of lower band)  "
-          f"lowest of {len(strong)} strong horizontal planes")
+          f"inliers={inl_full}/{len(band)} ({100*inl_full/len(band):.0f}% of lower band)  "
+          f"lowest of {len(strong)} strong horizontal planes, {scored} hypotheses")
     return best_n, best_d
 
 
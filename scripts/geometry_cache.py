@@ -0,0 +1,144 @@
+"""Persisted per-photo geometry: depth, floor plane, masks and semantics.
+
+WHY THIS EXISTS
+---------------
+Everything stage_geometric.py knows about a room - metric depth, the fitted
+floor plane, which pixels are floor and which are standable, what every pixel
+IS - is a pure function of the crop's pixels and the models that read them.
+Yet a re-run after a prompt change, or a retry of a listing whose render was
+rejected, recomputed all of it: two dense models on the CPU plus a RANSAC fit,
+for an answer already worked out last time.
+
+KEYS. An entry is keyed by a hash of the image CONTENT (mode, size, pixels),
+not its path: base_*.png is rewritten on every run, and a crop that comes out
+the same is the same room. Under that key each result is stored by NAME, and
+the caller builds the name from the model id and every constant the result
+depends on - so a new model or a changed calibration is a miss, never a stale
+hit.
+
+FORMAT. One directory per (image, name) holding plain .npy arrays plus a
+meta.json. .npy is the one format numpy memory-maps directly, so a hit costs a
+page-cache read, not a decode. Depth is stored float16 (~1mm at room range,
+half the bytes), masks as bool, the ADE map as uint8. An entry is written to a
+temporary directory and renamed into place, so a reader sees all of it or
+none of it.
+
+EVICTION is least-recently-used under a size cap, by meta.json mtime, the same
+scheme as image_cache.py.
+
+  cache = GeometryCache()
+  key = cache.key(img)
+  hit = cache.load(key, "sem-segformer-b4")    # {"sem": memmap, "meta": {...}} or None
+  cache.save(key, "sem-segformer-b4", {"sem": sem})
+
+Env: STAGE_GEOMETRY_CACHE (default local-logs/geometry-cache, "off" disables),
+GEOMETRY_CACHE_MAX_MB (4096).
+"""
+import os, re, json, time, shutil, hashlib, pathlib, threading
+
+import numpy as np
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+DEFAULT_DIR = ROOT / "local-logs" / "geometry-cache"
+
+
+class GeometryCache:
+    def __init__(self, root=None, max_bytes=None):
+        self.root = pathlib.Path(root or os.getenv("STAGE_GEOMETRY_CACHE") or DEFAULT_DIR)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes or int(float(os.getenv("GEOMETRY_CACHE_MAX_MB", "4096")) * 1024 * 1024)
+        self._size = None
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    # ---------------------------------------------------------------- keys --
+    @staticmethod
+    def key(img):
+        """Content hash of a PIL image (or an array)."""
+        h = hashlib.sha1()
+        if isinstance(img, np.ndarray):
+            h.update("{}|{}".format(img.dtype, img.shape).encode())
+            h.update(np.ascontiguousarray(img).data)
+        else:
+            h.update("{}|{}x{}".format(img.mode, *img.size).encode())
+            h.update(img.tobytes())
+        return h.hexdigest()[:32]
+
+    def _dir(self, key, name):
+        return self.root / key[-2:] / key / re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+
+    # ---------------------------------------------------------------- read --
+    def has(self, key, name):
+        return (self._dir(key, name) / "meta.json").exists()
+
+    def load(self, key, name, mmap=True):
+        """{"<array>": ndarray, ..., "meta": dict} or None. Arrays are
+        read-only memory maps unless mmap=False."""
+        d = self._dir(key, name)
+        try:
+            with open(d / "meta.json", encoding="utf-8") as fh:
+                meta = json.load(fh)
+            out = {a: np.load(d / (a + ".npy"), mmap_mode="r" if mmap else None)
+                   for a in meta.get("arrays", [])}
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            os.utime(d / "meta.json")
+        except OSError:
+            pass
+        out["meta"] = meta
+        return out
+
+    # --------------------------------------------------------------- write --
+    def save(self, key, name, arrays, meta=None):
+        d = self._dir(key, name)
+        tmp = d.with_name("{}.{}.tmp".format(d.name, threading.get_ident()))
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        size = 0
+        for a, arr in arrays.items():
+            np.save(tmp / (a + ".npy"), np.ascontiguousarray(arr))
+            size += (tmp / (a + ".npy")).stat().st_size
+        with open(tmp / "meta.json", "w", encoding="utf-8") as fh:
+            json.dump(dict(meta or {}, arrays=sorted(arrays), created=time.time()), fh)
+        try:
+            os.replace(tmp, d)
+        except OSError:
+            # Another process stored the same entry first; theirs is as good.
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self._grow(size, keep=d)
+
+    # ------------------------------------------------------------ eviction --
+    def _entries(self):
+        for d in self.root.glob("??/*/*"):
+            if d.name.endswith(".tmp"):
+                continue
+            try:
+                mtime = (d / "meta.json").stat().st_mtime
+                size = sum(p.stat().st_size for p in d.iterdir())
+            except FileNotFoundError:
+                continue            # evicted by another run mid-scan
+            yield mtime, size, d
+
+    def _grow(self, n, keep=None):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(s for _, s, _ in self._entries())
+            else:
+                self._size += n
+            if self._size <= self.max_bytes:
+                return
+            target = int(self.max_bytes * 0.9)
+            for _, size, d in sorted(self._entries()):
+                if self._size <= target:
+                    break
+                if d == keep:
+                    continue
+                shutil.rmtree(d, ignore_errors=True)
+                self._size -= size
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "root": str(self.root)}
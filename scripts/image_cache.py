@@ -0,0 +1,206 @@
+"""Content-addressed on-disk cache for listing photos and the agent headshot.
+
+WHY THIS EXISTS
+---------------
+The content run (src/content/lux.py) pulled every full-size MLS JPEG again each
+time it ran, and stage_geometric.py fetched the same Cloudinary headshot twice
+per PHOTO - once for the reaction path, once for the action path. None of those
+bytes ever change under the same URI, so all of that was network time spent
+re-learning something already on disk.
+
+KEYS. An entry is keyed by the photo's Id (when the caller has one) PLUS a hash
+of the URI. The Id makes the file findable by a human; the URI hash is what
+keeps it honest - Spark re-issues URIs when a photo is replaced, so a changed
+photo under the same Id is a new key and is fetched, never served stale.
+
+DERIVATIVES. Resized variants (the 1080x1350 staging size, thumbnails) are
+rendered from the cached original the first time a caller asks for one and
+stored beside it, so a repeat request neither downloads nor resizes.
+
+READS are memory-mapped: PIL decodes straight from the page cache instead of
+copying the whole JPEG into a Python bytes object first.
+
+EVICTION is least-recently-used under a size cap. A hit touches the file's
+mtime, so "oldest mtime" is "least recently used" without any index to keep in
+sync between concurrent runs.
+
+  cache = ImageCache()
+  img = cache.image(url, photo_id="2024...")           # PIL image, fetched once
+  cache.derivative(url, "staging", photo_id="2024...")   # path to 1080x1350 jpg
+
+Env: IMAGE_CACHE_DIR (default local-logs/image-cache), IMAGE_CACHE_MAX_MB (2048).
+"""
+import os, re, io, json, mmap, time, hashlib, pathlib, threading
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+DEFAULT_DIR = ROOT / "local-logs" / "image-cache"
+
+# name -> (width, height, fit). "cover" crops to fill exactly, like the staging
+# crop; "contain" only shrinks, keeping the whole frame.
+PRESETS = {
+    "staging": (1080, 1350, "cover"),
+    "thumb": (320, 400, "contain"),
+}
+
+
+class ImageCache:
+    def __init__(self, root=None, max_bytes=None):
+        self.root = pathlib.Path(root or os.getenv("IMAGE_CACHE_DIR") or DEFAULT_DIR)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes or int(float(os.getenv("IMAGE_CACHE_MAX_MB", "2048")) * 1024 * 1024)
+        self._size = None          # bytes on disk, computed lazily on first write
+        self._lock = threading.Lock()
+        self._session = None
+        self.hits = self.misses = 0
+
+    # ---------------------------------------------------------------- keys --
+    @staticmethod
+    def key(url, photo_id=None):
+        h = hashlib.sha1(url.encode("utf-8")).hexdigest()[:20]
+        if photo_id:
+            return "{}-{}".format(re.sub(r"[^A-Za-z0-9_.-]", "_", str(photo_id))[:64], h)
+        return h
+
+    def _path(self, key, suffix):
+        # Shard by the URI hash, not the Id: Spark Ids share long prefixes.
+        return self.root / key[-2:] / (key + suffix)
+
+    # --------------------------------------------------------------- fetch --
+    def _fetch(self, url, timeout=60):
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        r = self._session.get(url, timeout=timeout)
+        r.raise_for_status()
+        return r.content
+
+    def _write(self, path, data):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name("{}.{}.tmp".format(path.name, threading.get_ident()))
+        with open(tmp, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp, path)       # a concurrent reader never sees half a JPEG
+        self._grow(len(data), keep=path)
+
+    def path(self, url, photo_id=None, timeout=60):
+        """Local path of the original, downloading it only on the first call."""
+        p = self._path(self.key(url, photo_id), ".orig")
+        if p.exists():
+            self.hits += 1
+            self._touch(p)
+            return p
+        self.misses += 1
+        self._write(p, self._fetch(url, timeout))
+        return p
+
+    # ---------------------------------------------------------------- read --
+    @staticmethod
+    def open_image(path, mode="RGB"):
+        """Decode an image straight from a memory map of the file."""
+        from PIL import Image
+        with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            img = Image.open(mm)
+            img.load()              # decode now; the map closes on exit
+            return img.convert(mode) if mode else img
+
+    def image(self, url, photo_id=None, mode="RGB"):
+        return self.open_image(self.path(url, photo_id), mode)
+
+    def read_bytes(self, url, photo_id=None):
+        with open(self.path(url, photo_id), "rb") as fh, \
+                mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return mm[:]
+
+    def copy_to(self, url, dest, photo_id=None):
+        """Place the original at dest: a hardlink where the filesystem allows
+        it (no bytes copied), a copy otherwise."""
+        src, dest = self.path(url, photo_id), pathlib.Path(dest)
+        if dest.exists():
+            dest.unlink()
+        try:
+            os.link(src, dest)
+        except OSError:
+            import shutil
+            shutil.copyfile(src, dest)
+        return dest
+
+    # --------------------------------------------------------- derivatives --
+    def derivative(self, url, size="staging", photo_id=None, quality=90):
+        """Path to a resized JPEG of the image, rendered once and then served
+        from disk. size is a PRESETS name or (w, h, fit)."""
+        w, h, fit = PRESETS[size] if isinstance(size, str) else size
+        key = self.key(url, photo_id)
+        p = self._path(key, ".{}x{}.{}.jpg".format(w, h, fit))
+        if p.exists():
+            self.hits += 1
+            self._touch(p)
+            return p
+        from PIL import Image, ImageOps
+        img = self.image(url, photo_id)
+        if fit == "cover":
+            img = ImageOps.fit(img, (w, h), Image.LANCZOS)
+        else:
+            img.thumbnail((w, h), Image.LANCZOS)
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=quality, optimize=True)
+        self._write(p, buf.getvalue())
+        return p
+
+    # ------------------------------------------------------------ metadata --
+    def manifest(self, name, fetch, max_age=86400):
+        """Small JSON document (e.g. a listing's photo list) cached for
+        max_age seconds, so a repeat run need not ask the API again either."""
+        p = self.root / "manifests" / (re.sub(r"[^A-Za-z0-9_.-]", "_", str(name)) + ".json")
+        if p.exists() and time.time() - p.stat().st_mtime < max_age:
+            with open(p, encoding="utf-8") as fh:
+                return json.load(fh)
+        data = fetch()
+        if data:
+            p.parent.mkdir(parents=True, exist_ok=True)
+            tmp = p.with_name(p.name + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump(data, fh)
+            os.replace(tmp, p)
+        return data
+
+    # ------------------------------------------------------------ eviction --
+    @staticmethod
+    def _touch(path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _entries(self):
+        for p in self.root.glob("??/*"):
+            if p.suffix != ".tmp":
+                try:
+                    st = p.stat()
+                except FileNotFoundError:
+                    continue        # evicted by another run mid-scan
+                yield st.st_mtime, st.st_size, p
+
+    def _grow(self, n, keep=None):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(s for _, s, _ in self._entries())
+            else:
+                self._size += n
+            if self._size <= self.max_bytes:
+                return
+            # Evict oldest-used first, down to 90% so the next write does not
+            # immediately trigger another full scan.
+            target = int(self.max_bytes * 0.9)
+            for _, size, p in sorted(self._entries()):
+                if self._size <= target:
+                    break
+                if p == keep:
+                    continue
+                try:
+                    p.unlink()
+                    self._size -= size
+                except FileNotFoundError:
+                    pass
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "root": str(self.root)}
@@ -24,7 +24,7 @@ Depth is what makes it trustworthy rather than lucky: a fitted floor PLANE says
 where feet may land, and metric depth says exactly how tall a 1.78m person is
 at that distance. Both become numeric accept/reject gates instead of prompts.
 """
-import os, sys, io, re, json, base64, warnings, pathlib
+import os, sys, io, re, json, time, base64, hashlib, warnings, pathlib, threading
 warnings.filterwarnings("ignore")
 
 import numpy as np
@@ -129,19 +129,216 @@ FEATURE_WEIGHTS = {"pooltable": 6.0, "bar": 5.0, "island": 5.0, "fireplace": 4.5
                    "windowpane": 2.0, "coffeetable": 1.0, "table": 1.0}
 
 
+# ------------------------------------------------------------------ models --
+# LOAD EACH MODEL ONCE PER PROCESS. semantic(), person_mask() and analyse() each
+# used to call from_pretrained and move weights to the device on every call, so
+# one stage_one loaded Segformer-B4 three or four times and --batch paid that
+# again for every photo and every take - on the CPU-only VPS that was most of
+# the wall clock. Everything now comes out of one registry, loaded lazily on
+# first use, and the room map and the person mask share ONE Segformer (they
+# were always the same model asked the same question).
+#
+# STAGE_MODEL_EXPORT=torchscript additionally traces Segformer on CPU and keeps
+# the frozen graph under local-logs/model-cache, so later processes skip the
+# transformers model build entirely (but runs one image at a time - see
+# _batched). Depth stays eager: its processor keeps the photo's aspect ratio,
+# so the input shape changes per photo and a trace would bake in the first one.
+SEG_MODEL = "nvidia/segformer-b4-finetuned-ade-512-512"
+DEPTH_MODEL = "depth-anything/Depth-Anything-V2-Metric-Indoor-Base-hf"
+MODEL_EXPORT = os.environ.get("STAGE_MODEL_EXPORT", "").lower()
+MODEL_CACHE = pathlib.Path(os.environ.get(
+    "STAGE_MODEL_CACHE", pathlib.Path(__file__).resolve().parent.parent / "local-logs" / "model-cache"))
+_MODELS = {}
+_MODELS_LOCK = threading.Lock()
+
+# ONE FORWARD PASS AT A TIME. Each model is set up to use every core on its
+# own (_tune_torch, onnxruntime's default pool), and run_batch gates one
+# photo's takes on a pipeline worker while this thread plans the next photo -
+# so without a lock Segformer, Depth-Anything and the face models would run
+# side by side, each with a thread per core, and the VPS would spend the
+# difference context-switching. Every local inference call holds this lock;
+# the network waits, numpy geometry and compositing do not.
+_INFER_LOCK = threading.Lock()
+
+
+def _device():
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def _tune_torch():
+    """Intra-op threads = cores (or STAGE_THREADS); no inter-op pool, since
+    _INFER_LOCK lets one model call run at a time."""
+    torch.set_num_threads(int(os.environ.get("STAGE_THREADS", os.cpu_count() or 1)))
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass                         # already fixed once any parallel work ran
+
+
+def _torchscript(name, build, example):
+    """Frozen TorchScript graph for a fixed-input-size model, traced once."""
+    path = MODEL_CACHE / "{}.torchscript.pt".format(name)
+    if path.exists():
+        return torch.jit.load(str(path), map_location="cpu").eval()
+    with torch.no_grad():
+        ts = torch.jit.freeze(torch.jit.trace(build().eval(), example, strict=False).eval())
+    path.parent.mkdir(parents=True, exist_ok=True)
+    ts.save(str(path))
+    print("  traced {} -> {}".format(name, path), file=sys.stderr)
+    return ts
+
+
+def _load_segformer():
+    from transformers import SegformerImageProcessor, SegformerForSemanticSegmentation
+    dev = _device()
+    if dev == "cpu":
+        _tune_torch()
+    proc = SegformerImageProcessor.from_pretrained(SEG_MODEL)
+    if MODEL_EXPORT == "torchscript" and dev == "cpu":
+        ts = _torchscript(
+            "segformer-b4-ade",
+            lambda: SegformerForSemanticSegmentation.from_pretrained(SEG_MODEL, torchscript=True),
+            torch.zeros(1, 3, 512, 512))
+        # Traced at batch 1, and a trace may have baked that in: feed it
+        # the batch one image at a time.
+        return proc, (lambda px: torch.cat([ts(p[None])[0] for p in px])), dev
+    model = SegformerForSemanticSegmentation.from_pretrained(SEG_MODEL).to(dev).eval()
+    if dev == "cpu":
+        model = model.to(memory_format=torch.channels_last)
+    return proc, (lambda px: model(pixel_values=px).logits), dev
+
+
+def _load_depth():
+    from transformers import AutoImageProcessor, AutoModelForDepthEstimation
+    dev = _device()
+    proc = AutoImageProcessor.from_pretrained(DEPTH_MODEL)
+    model = AutoModelForDepthEstimation.from_pretrained(DEPTH_MODEL).to(dev).eval()
+    if dev == "cpu":
+        _tune_torch()
+        model = model.to(memory_format=torch.channels_last)
+    return proc, (lambda px: model(pixel_values=px).predicted_depth), dev
+
+
+def _load_insightface():
+    from insightface.app import FaceAnalysis
+    a = FaceAnalysis(name="buffalo_l",
+                     providers=["CUDAExecutionProvider", "CPUExecutionProvider"])
+    a.prepare(ctx_id=0, det_size=(640, 640))
+    return a
+
+
+_LOADERS = {"segformer": _load_segformer, "depth": _load_depth, "insightface": _load_insightface}
+
+
+def _model(key):
+    """The resident instance of a model, loading it on first use."""
+    m = _MODELS.get(key)
+    if m is None:
+        with _MODELS_LOCK:
+            m = _MODELS.get(key)
+            if m is None:
+                m = _MODELS[key] = _LOADERS[key]()
+    return m
+
+
+# BATCH, DON'T LOOP. A listing is 10-25 photos and every staging crop is the
+# same 1080x1350, so the dense models can take the whole listing as a few
+# stacked tensors instead of one forward pass per photo: fewer Python round
+# trips, and the CPU kernels get batches big enough to use every core. On CPU
+# the weights and inputs are also switched to channels-last, the layout the
+# oneDNN convolutions run fastest in. Images of different sizes (originals,
+# single-photo runs) are grouped by size, so the helpers below are exact for
+# any input - semantic() and estimate_depth() are just batches of one.
+STAGE_BATCH = max(1, int(os.environ.get("STAGE_BATCH", "4")))
+
+
+def _batched(key, imgs, post):
+    if not imgs:
+        return []
+    proc, net, dev = _model(key)
+    out = [None] * len(imgs)
+    groups = {}
+    for i, im in enumerate(imgs):
+        groups.setdefault(im.size, []).append(i)
+    for idx in groups.values():
+        for k in range(0, len(idx), STAGE_BATCH):
+            chunk = idx[k:k + STAGE_BATCH]
+            px = proc(images=[imgs[i] for i in chunk], return_tensors="pt")["pixel_values"].to(dev)
+            if dev == "cpu":
+                px = px.contiguous(memory_format=torch.channels_last)
+            with _INFER_LOCK, torch.no_grad():
+                y = net(px)
+                for j, i in enumerate(chunk):
+                    out[i] = post(y[j:j + 1], imgs[i].size[::-1])
+    return out
+
+
+def semantic_batch(imgs):
+    """ADE20K class maps (uint8) for a list of images."""
+    return _batched("segformer", imgs, lambda logits, hw: torch.nn.functional.interpolate(
+        logits, size=hw, mode="bilinear", align_corners=False
+    ).argmax(1)[0].to(torch.uint8).cpu().numpy())
+
+
+def estimate_depth_batch(imgs):
+    """Metric depth maps (metres, uncalibrated) for a list of images."""
+    return _batched("depth", imgs, lambda pred, hw: torch.nn.functional.interpolate(
+        pred.unsqueeze(1), size=hw, mode="bicubic", align_corners=False
+    )[0, 0].cpu().numpy())
+
+
 def semantic(img):
     """ADE20K semantic map of the room (not the render) - what everything IS."""
-    from transformers import SegformerImageProcessor, SegformerForSemanticSegmentation
-    dev = "cuda" if torch.cuda.is_available() else "cpu"
-    mid = "nvidia/segformer-b4-finetuned-ade-512-512"
-    proc = SegformerImageProcessor.from_pretrained(mid)
-    model = SegformerForSemanticSegmentation.from_pretrained(mid).to(dev).eval()
-    inp = proc(images=img, return_tensors="pt").to(dev)
-    with torch.no_grad():
-        logits = model(**inp).logits
-    up = torch.nn.functional.interpolate(
-        logits, size=img.size[::-1], mode="bilinear", align_corners=False)
-    return up.argmax(1)[0].cpu().numpy()
+    return semantic_batch([img])[0]
+
+
+def estimate_depth(img):
+    """Metric depth (metres, uncalibrated) at the image's own resolution."""
+    return estimate_depth_batch([img])[0]
+
+
+# ---------------------------------------------------------- geometry cache --
+# Depth, the floor fit, the masks and the room's semantic map depend only on
+# the crop's pixels, the models and the calibration constants - not on the
+# prompt, the take or the run. They are kept in geometry_cache.py under the
+# crop's content hash, so a retried take or a re-run after a prompt change
+# goes straight to spot finding. Bump GEOMETRY_VERSION whenever analyse() or
+# fit_floor() changes what they compute.
+GEOMETRY_VERSION = 2
+FLOOR_TAG = "floor-{}-cam{}-v{}".format(DEPTH_MODEL.split("/")[-1], ASSUMED_CAM_H, GEOMETRY_VERSION)
+SEM_TAG = "sem-" + SEG_MODEL.split("/")[-1]
+_GEOM_CACHE = None
+
+
+def geometry_cache():
+    """The process's GeometryCache, or None with STAGE_GEOMETRY_CACHE=off."""
+    global _GEOM_CACHE
+    if _GEOM_CACHE is None:
+        if os.environ.get("STAGE_GEOMETRY_CACHE", "").lower() in ("off", "0", "none"):
+            return None
+        from geometry_cache import GeometryCache
+        _GEOM_CACHE = GeometryCache()
+    return _GEOM_CACHE
+
+
+def _floor_name(f):
+    return "{}-f{:.2f}".format(FLOOR_TAG, f)
+
+
+def room_semantic(img, key=None, sem=None):
+    """semantic() for a ROOM photograph, through the geometry cache. Renders
+    go to semantic() directly - they are never seen twice."""
+    gc = geometry_cache()
+    if gc is None:
+        return sem if sem is not None else semantic(img)
+    key = key or gc.key(img)
+    hit = gc.load(key, SEM_TAG)
+    if hit is not None:
+        return hit["sem"]
+    if sem is None:
+        sem = semantic(img)
+    gc.save(key, SEM_TAG, {"sem": sem}, {"model": SEG_MODEL})
+    return sem
 
 
 # --------------------------------------------------------------- identity --
@@ -151,45 +348,103 @@ def semantic(img):
 # "slightly idealised"; the number called it a different man. Publishing that
 # would put someone else's face on the agent's own marketing, so identity is a
 # GATE with a threshold, not a line of hopeful prompt text.
-_FACE_APP = None
-_REF_EMB = None
+#
+# WHAT THE GATE COSTS. FaceAnalysis.get() runs detection on the whole frame and
+# then FIVE models on every face it finds (landmarks 2D and 3D, gender/age,
+# recognition), of which the gate uses one. So the gate calls the detector and
+# ArcFace directly: detection on the crop of the figure that person_mask()
+# already isolated (a hallucinated bystander can no longer be the "largest
+# face"), and ONE batched ArcFace call for however many takes are being
+# checked together. The reference embedding is computed once per headshot,
+# ever: it is kept in the geometry cache under the headshot's content hash.
+FACE_MODEL = "buffalo_l"
+ARCFACE_TAG = "arcface-" + FACE_MODEL
+_REF = {}                    # headshot hash -> (normed embedding, bbox)
+_DETECT = object()           # "no precomputed face: detect it"
 
 
 def _face_app():
-    global _FACE_APP
-    if _FACE_APP is None:
-        from insightface.app import FaceAnalysis
-        a = FaceAnalysis(name="buffalo_l",
-                         providers=["CUDAExecutionProvider", "CPUExecutionProvider"])
-        a.prepare(ctx_id=0, det_size=(640, 640))
-        _FACE_APP = a
-    return _FACE_APP
-
-
-def _largest_face(img):
-    im = np.array(img.convert("RGB"))[:, :, ::-1]
-    faces = _face_app().get(im)
-    if not faces:
+    return _model("insightface")
+
+
+def _figure_box(pm, pad=0.08):
+    """(x0, y0, x1, y1) of the person mask, padded by a share of its height."""
+    ys, xs = np.where(pm)
+    if not len(ys):
         return None
-    return max(faces, key=lambda f: (f.bbox[2] - f.bbox[0]) * (f.bbox[3] - f.bbox[1]))
+    p = int((ys.max() - ys.min()) * pad) + 8
+    H, W = pm.shape
+    return (max(0, xs.min() - p), max(0, ys.min() - p),
+            min(W, xs.max() + 1 + p), min(H, ys.max() + 1 + p))
+
+
+def face_embeddings(imgs, boxes=None):
+    """Largest face in each image (searched inside boxes[i] when given) ->
+    (normed ArcFace embedding, bbox in image pixels), or None where no face is
+    found. All faces go through ArcFace as one batch."""
+    from insightface.utils import face_align
+    app = _face_app()
+    det, rec = app.det_model, app.models["recognition"]
+    found, aligned = [], []
+    for i, img in enumerate(imgs):
+        a = np.asarray(img.convert("RGB"))[:, :, ::-1]
+        ox = oy = 0
+        if boxes is not None and boxes[i] is not None:
+            x0, y0, x1, y1 = boxes[i]
+            a, ox, oy = a[y0:y1, x0:x1], x0, y0
+        with _INFER_LOCK:
+            bb, kps = det.detect(np.ascontiguousarray(a), max_num=0, metric="default")
+        if bb is None or not len(bb):
+            found.append(None)
+            continue
+        j = int(np.argmax((bb[:, 2] - bb[:, 0]) * (bb[:, 3] - bb[:, 1])))
+        aligned.append(face_align.norm_crop(a, landmark=kps[j], image_size=rec.input_size[0]))
+        found.append((len(aligned) - 1, bb[j, :4] + np.array([ox, oy, ox, oy], np.float32)))
+    with _INFER_LOCK:
+        feats = rec.get_feat(aligned) if aligned else []
+    out = []
+    for hit in found:
+        if hit is None:
+            out.append(None)
+        else:
+            e = feats[hit[0]]
+            out.append((e / np.linalg.norm(e), hit[1]))
+    return out
+
+
+def _ref_face(headshot):
+    """(embedding, bbox) of the headshot: memory, then the geometry cache,
+    then ArcFace."""
+    from geometry_cache import GeometryCache
+    gc = geometry_cache()
+    key = GeometryCache.key(headshot)
+    if key in _REF:
+        return _REF[key]
+    hit = gc.load(key, ARCFACE_TAG) if gc is not None else None
+    if hit is not None:
+        _REF[key] = (np.array(hit["emb"]), tuple(hit["meta"]["bbox"]))
+        return _REF[key]
+    face = face_embeddings([headshot])[0]
+    if face is None:
+        raise RuntimeError("no face found in the reference headshot")
+    emb, bbox = face
+    _REF[key] = (emb, tuple(float(v) for v in bbox))
+    if gc is not None:
+        gc.save(key, ARCFACE_TAG, {"emb": emb.astype(np.float32)},
+                {"model": FACE_MODEL, "bbox": list(_REF[key][1])})
+    return _REF[key]
 
 
 def face_ref(headshot):
-    """Cache the reference embedding once per run."""
-    global _REF_EMB
-    if _REF_EMB is None:
-        f = _largest_face(headshot)
-        if f is None:
-            raise RuntimeError("no face found in the reference headshot")
-        _REF_EMB = f.normed_embedding
-    return _REF_EMB
+    """The reference embedding, computed once per headshot and persisted."""
+    return _ref_face(headshot)[0]
 
 
 def face_similarity(img, ref):
-    f = _largest_face(img)
+    f = face_embeddings([img])[0]
     if f is None:
         return None
-    return float(np.dot(ref, f.normed_embedding))
+    return float(np.dot(ref, f[0]))
 
 
 def face_plate(headshot, size=768):
@@ -199,10 +454,10 @@ def face_plate(headshot, size=768):
     the face large in frame the model has little facial detail to work from and
     drifts toward a generic handsome face. Handing it the face big and sharp
     gives it something to actually copy."""
-    f = _largest_face(headshot)
-    if f is None:
+    try:
+        x0, y0, x1, y1 = _ref_face(headshot)[1]
+    except RuntimeError:
         return headshot
-    x0, y0, x1, y1 = f.bbox
     cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
     half = max(x1 - x0, y1 - y0) * 0.85
     W, H = headshot.size
@@ -212,6 +467,164 @@ def face_plate(headshot, size=768):
                                      Image.LANCZOS)
 
 
+# -------------------------------------------------------------- transport --
+# EVERY VISION CALL GOES THROUGH _post_json. A re-run of --batch on the same
+# listing used to pay for every planning call again, although the same photo
+# and the same prompt get the same answer. Responses are stored under
+# local-logs/stage-cache (STAGE_CACHE) keyed by a hash of the model id and the
+# whole request body - prompt text and image bytes included - so any change
+# to either is a miss. STAGE_CACHE_MODE:
+#
+#   plan    (default) planning calls (read_photo, choose_spot) are cached and
+#           served locally; renders always go out
+#   all     renders are recorded too, for a later replay - but never served
+#           back here: a take is a fresh sample, and the process-local #1,
+#           #2 ... numbering would re-serve a rejected take on every run
+#   replay  no network at all: everything from the cache, a miss is an error
+#   off     no cache
+#
+# Renders are never shared between takes: an identical body sent three times
+# is three samples, so each repeat gets its own key (#1, #2, ...) and a replay
+# in the same order hands back the same three. Identical PLANNING calls in
+# flight at once are de-duplicated - the second waits for the first and gets
+# its answer, whether or not the mode stores it.
+#
+# ONLY ANSWERS ARE KEPT. A caller that has to make sense of the reply passes
+# parse=; the reply is stored (and handed to twins) only once that has
+# succeeded, so a blocked reply or one with no JSON is never cached. An entry
+# that no longer parses - written before this check, or by an older parser -
+# is deleted and asked for again instead of failing the photo on every run.
+#
+# TRANSPORT is the HTTP layer, (url, body, timeout) -> response JSON.
+# Swap it (or point GEMINI_BASE_URL at a local stub server) to test.
+GEMINI_BASE_URL = os.environ.get(
+    "GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta/models/")
+TEXT_MODEL = "gemini-2.5-flash"
+IMAGE_MODEL = "gemini-2.5-flash-image"
+STAGE_CACHE = pathlib.Path(os.environ.get(
+    "STAGE_CACHE", pathlib.Path(__file__).resolve().parent.parent / "local-logs" / "stage-cache"))
+STAGE_CACHE_MODE = os.environ.get("STAGE_CACHE_MODE", "plan").lower()
+CACHE_STATS = {"hits": 0, "calls": 0, "shared": 0}
+_SESSION = None
+_INFLIGHT = {}
+_REPEATS = {}
+_CACHE_LOCK = threading.Lock()
+
+
+def _http_post(url, body, timeout):
+    global _SESSION
+    if _SESSION is None:
+        import requests
+        _SESSION = requests.Session()
+    r = _SESSION.post(url, params={"key": os.environ["GEMINI_API_KEY"]}, json=body, timeout=timeout)
+    r.raise_for_status()
+    return r.json()
+
+
+TRANSPORT = _http_post
+
+
+def _cache_path(k):
+    return STAGE_CACHE / k[:2] / (k + ".json")
+
+
+def _post_json(model, body, timeout=120, plan=False, parse=None):
+    """POST a generateContent body to `model`, through the response cache.
+    plan=True marks a deterministic planning call (cached by default). With
+    parse, returns parse(response), and a response is only cached once parse
+    accepts it."""
+    k = hashlib.sha256(model.encode() + json.dumps(body, sort_keys=True).encode()).hexdigest()
+    with _CACHE_LOCK:
+        if not plan:
+            n = _REPEATS[k] = _REPEATS.get(k, 0) + 1
+            k = "{}-{}".format(k[:56], n)
+    read = STAGE_CACHE_MODE == "replay" or (plan and STAGE_CACHE_MODE in ("plan", "all"))
+    write = STAGE_CACHE_MODE == "all" or (plan and STAGE_CACHE_MODE == "plan")
+    path = _cache_path(k)
+    if read and path.exists():
+        with open(path, encoding="utf-8") as fh:
+            resp = json.load(fh)["response"]
+        try:
+            out = parse(resp) if parse else resp
+        except Exception as e:
+            if STAGE_CACHE_MODE == "replay":
+                raise
+            print("  dropping unusable cached {} response ({}): {}".format(model, k[:12], str(e)[:120]))
+            path.unlink(missing_ok=True)
+        else:
+            with _CACHE_LOCK:
+                CACHE_STATS["hits"] += 1
+            return out
+    if STAGE_CACHE_MODE == "replay":
+        raise RuntimeError("replay: no cached {} response ({})".format(model, k[:12]))
+
+    # One planning request in flight per key; a twin waits for its answer.
+    owner = False
+    if plan:
+        with _CACHE_LOCK:
+            slot = _INFLIGHT.get(k)
+            if slot is None:
+                owner, slot = True, {"done": threading.Event()}
+                _INFLIGHT[k] = slot
+        if not owner:
+            slot["done"].wait()
+            if "response" in slot:
+                with _CACHE_LOCK:
+                    CACHE_STATS["shared"] += 1
+                return parse(slot["response"]) if parse else slot["response"]
+            # The owner failed: try again on our own, without taking its place
+    try:
+        with _CACHE_LOCK:
+            CACHE_STATS["calls"] += 1
+        resp = TRANSPORT(GEMINI_BASE_URL + model + ":generateContent", body, timeout)
+        out = parse(resp) if parse else resp
+        if write:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name("{}.{}.tmp".format(path.name, threading.get_ident()))
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump({"model": model, "created": time.time(), "response": resp}, fh)
+            os.replace(tmp, path)
+        if owner:
+            slot["response"] = resp
+        return out
+    finally:
+        if owner:
+            with _CACHE_LOCK:
+                _INFLIGHT.pop(k, None)
+            slot["done"].set()
+
+
+def _reply_parts(resp):
+    """The parts of the first candidate; RuntimeError for a blocked or empty reply."""
+    cands = resp.get("candidates")
+    if not cands or "content" not in cands[0]:
+        raise RuntimeError("no reply ({})".format(
+            (resp.get("promptFeedback") or {}).get("blockReason")
+            or (cands[0].get("finishReason") if cands else "no candidates")))
+    return cands[0]["content"].get("parts", [])
+
+
+def _response_text(resp):
+    return "".join(p.get("text", "") for p in _reply_parts(resp))
+
+
+def _json_reply(resp, missing):
+    """The JSON object in a text reply; RuntimeError(missing) if there is none."""
+    m = re.search(r"\{[\s\S]*\}", _response_text(resp))
+    if not m:
+        raise RuntimeError(missing)
+    return json.loads(m.group(0))
+
+
+def _response_image(resp):
+    for part in _reply_parts(resp):
+        d = part.get("inlineData") or part.get("inline_data")
+        if d and d.get("data"):
+            return Image.open(io.BytesIO(base64.b64decode(d["data"]))).convert("RGB").resize(
+                (OUT_W, OUT_H), Image.LANCZOS)
+    raise RuntimeError("no image returned")
+
+
 # ------------------------------------------------------------------- read --
 def read_photo(img):
     """UNDERSTAND THE PHOTOGRAPH FIRST, on the full uncropped original.
@@ -227,7 +640,6 @@ def read_photo(img):
     room is selling, and roughly where a person belongs to show that off.
     Geometry then proves a spot inside that region; the crop serves the plan
     instead of constraining it."""
-    import requests
     buf = io.BytesIO()
     img.convert("RGB").save(buf, format="JPEG", quality=90)
     prompt = (
@@ -287,21 +699,11 @@ def read_photo(img):
         + "stand_region must be floor he can occupy for that action - beside or at the "
           "object he is using, not across the room from it."
     )
-    r = requests.post(
-        "https://generativelanguage.googleapis.com/v1beta/models/"
-        "gemini-2.5-flash:generateContent",
-        params={"key": os.environ["GEMINI_API_KEY"]},
-        json={"contents": [{"role": "user", "parts": [
-            {"inline_data": {"mime_type": "image/jpeg",
-                             "data": base64.b64encode(buf.getvalue()).decode()}},
-            {"text": prompt}]}]},
-        timeout=120)
-    r.raise_for_status()
-    txt = "".join(p.get("text", "") for p in r.json()["candidates"][0]["content"]["parts"])
-    m = re.search(r"\{[\s\S]*\}", txt)
-    if not m:
-        raise RuntimeError("photo reader returned no JSON")
-    plan = json.loads(m.group(0))
+    plan = _post_json(TEXT_MODEL, {"contents": [{"role": "user", "parts": [
+        {"inline_data": {"mime_type": "image/jpeg",
+                         "data": base64.b64encode(buf.getvalue()).decode()}},
+        {"text": prompt}]}]}, timeout=120, plan=True,
+        parse=lambda r: _json_reply(r, "photo reader returned no JSON"))
 
     if not plan.get("usable", True):
         raise RuntimeError("frame rejected: {}".format(plan.get("reject_reason", "unusable")))
@@ -325,18 +727,88 @@ def _box_px(box, W, H):
     return r
 
 
-def crop_for_plan(img, plan, sem_orig=None):
-    """Crop 4:5 to SERVE the plan: keep the feature whole and the standing
-    region inside. The crop is chosen last among these three, not first."""
+# -------------------------------------------------------------------- crop --
+# ONE CROP SEARCH. Every crop here is the same question - which offset of a
+# fixed-size window keeps the most of what matters - and each used to answer
+# it with its own Python loop over a coarse grid (8px, 16px), re-summing a
+# full-height slice of the score map at every step. A window's share of a
+# rectangle is a clipped interval overlap, and its share of a score map is a
+# difference of two prefix sums over the map's column totals, so EVERY offset
+# is scored at 1px in one vectorised pass. Objectives are weighted terms, and
+# the window can be any aspect ratio: the search runs along whichever axis
+# has slack (sideways for 4:5 from a landscape photo, up/down for 1.91:1 or
+# a 4:5 from a tall one) and centres on the other. The STAGING crops below
+# still only take 4:5: candidates, the marker, compose and the render's
+# aspectRatio are all built for an OUT_W x OUT_H frame.
+def _crop_size(W, H, aspect=(4, 5)):
+    aw, ah = aspect
+    cw = min(W, int(round(H * aw / ah)))
+    ch = min(H, int(round(cw * ah / aw)))
+    return cw, ch
+
+
+def _out_size(aspect=(4, 5)):
+    """The staged frame for a crop of `aspect` - always OUT_W x OUT_H, so any
+    other aspect is refused rather than handed on as a frame nothing
+    downstream is sized for."""
+    if aspect[0] * OUT_H != aspect[1] * OUT_W:
+        raise ValueError("staging crops are {}x{} (4:5), not {}:{}".format(OUT_W, OUT_H, *aspect))
+    return OUT_W, OUT_H
+
+
+def window_scores(length, win, spans=(), profiles=(), centre=0.0):
+    """Score of every offset 0..length-win of a `win`-wide window on one axis.
+
+      spans     [(weight, (a0, a1))]  + weight x fraction of [a0, a1) inside
+      profiles  [(weight, per-pixel 1-D scores)]  + weight x sum inside
+      centre    - centre x distance of the window's centre from the frame's"""
+    off = np.arange(length - win + 1, dtype=np.float64)
+    s = np.zeros_like(off)
+    for wgt, (a0, a1) in spans:
+        inter = np.clip(np.minimum(a1, off + win) - np.maximum(a0, off), 0, None)
+        s += wgt * inter / max(1.0, a1 - a0)
+    for wgt, prof in profiles:
+        cs = np.concatenate(([0.0], np.cumsum(prof, dtype=np.float64)))
+        s += wgt * (cs[win:] - cs[:-win])
+    if centre:
+        s -= centre * np.abs(off + win / 2 - length / 2)
+    return s
+
+
+def best_window(W, H, aspect=(4, 5), rects=(), maps=(), centre=0.0):
+    """(left, top, cw, ch) of the best `aspect` window in a W x H frame.
+
+    rects  [(weight, (x0, y0, x1, y1) or None)]  keep as much of each as possible
+    maps   [(weight, HxW score map)]             keep as much score as possible
+    Ties go to the first offset, as the old loops' strict > did."""
+    cw, ch = _crop_size(W, H, aspect)
+    left, top = (W - cw) // 2, (H - ch) // 2
+    axis = 0 if cw < W else (1 if ch < H else None)
+    if axis is not None:
+        spans = [(w, (r[axis], r[axis + 2])) for w, r in rects if r]
+        profiles = [(w, m.sum(axis=axis)) for w, m in maps]
+        length, win = (W, cw) if axis == 0 else (H, ch)
+        o = int(np.argmax(window_scores(length, win, spans, profiles, centre)))
+        left, top = (o, top) if axis == 0 else (left, o)
+    return left, top, cw, ch
+
+
+def _kept(rect, left, top, cw, ch):
+    """Fraction of rect's area inside the window (1.0 for no rect)."""
+    if not rect:
+        return 1.0
+    x0, y0, x1, y1 = rect
+    ix = max(0.0, min(x1, left + cw) - max(x0, left))
+    iy = max(0.0, min(y1, top + ch) - max(y0, top))
+    return ix * iy / max(1.0, (x1 - x0) * (y1 - y0))
+
+
+def crop_for_plan(img, plan, sem_orig=None, aspect=(4, 5)):
+    """Crop to SERVE the plan: keep the feature whole and the standing region
+    inside. The crop is chosen last among these three, not first."""
+    out_size = _out_size(aspect)
     W, H = img.size
     f_orig, _, _ = intrinsics(W, H)
-    cw = min(W, int(round(H * 4 / 5)))
-    ch = min(H, int(round(cw * 5 / 4)))
-    top = (H - ch) // 2
-    if cw >= W:
-        out = img.crop((0, top, cw, top + ch)).resize((OUT_W, OUT_H), Image.LANCZOS)
-        return out, f_orig * (OUT_W / cw), 0, top, cw
-
     feat = _box_px(plan.get("feature_box"), W, H)
     stand = _box_px(plan.get("stand_region"), W, H)
 
@@ -364,47 +836,34 @@ def crop_for_plan(img, plan, sem_orig=None):
             print("  contact object     '{}' spans x {}-{} of {}".format(
                 name, int(xs.min()), int(xs.max()), W))
 
-    def covered(rect, left):
-        if not rect:
-            return 1.0
-        x0, _, x1, _ = rect
-        inter = max(0.0, min(x1, left + cw) - max(x0, left))
-        return inter / max(1.0, x1 - x0)
-
-    best_left, best = (W - cw) // 2, -1e9
-    for left in range(0, W - cw + 1, 8):
-        # The feature must survive WHOLE - a clipped pool table is the failure
-        # this ordering exists to prevent - and the actor needs somewhere to be.
-        s = 3.0 * covered(feat, left) + 1.6 * covered(stand, left)
-        if contact is not None:
-            s += 5.0 * covered(contact, left)   # outranks everything else
-        s -= 0.00004 * abs((left + cw / 2) - W / 2)
-        if s > best:
-            best_left, best = left, s
-
-    out = img.crop((best_left, top, best_left + cw, top + ch)).resize(
-        (OUT_W, OUT_H), Image.LANCZOS)
-    print("  crop x={} of {}   feature {:.0%}, stand {:.0%}, contact {:.0%}".format(
-        best_left, W - cw, covered(feat, best_left), covered(stand, best_left),
-        covered(contact, best_left) if contact is not None else 1.0))
-    return out, f_orig * (OUT_W / cw), best_left, top, cw
+    # The feature must survive WHOLE - a clipped pool table is the failure this
+    # ordering exists to prevent - and the actor needs somewhere to be. The
+    # contact object outranks everything else.
+    left, top, cw, ch = best_window(
+        W, H, aspect, rects=[(3.0, feat), (1.6, stand), (5.0, contact)], centre=0.00004)
+
+    out = img.crop((left, top, left + cw, top + ch)).resize(out_size, Image.LANCZOS)
+    print("  crop x={} y={} of {}x{}   feature {:.0%}, stand {:.0%}, contact {:.0%}".format(
+        left, top, W - cw, H - ch, _kept(feat, left, top, cw, ch),
+        _kept(stand, left, top, cw, ch), _kept(contact, left, top, cw, ch)))
+    return out, f_orig * (OUT_W / cw), left, top, cw
 
 
 # ---------------------------------------------------------------- geometry --
-def crop_45_feature(img):
-    """Choose the 4:5 window that KEEPS what makes the room that room.
+def crop_45_feature(img, aspect=(4, 5)):
+    """Choose the window that KEEPS what makes the room that room.
 
     A centre crop of the game room threw away the pool table and the bar and
     kept a brick chimney, so the slide captioned "the game room" contained no
     game room. The crop is now scored on weighted feature pixels retained."""
+    out_size = _out_size(aspect)
     W, H = img.size
     f_orig, _, _ = intrinsics(W, H)
-    cw = min(W, int(round(H * 4 / 5)))
-    ch = min(H, int(round(cw * 5 / 4)))
-    if cw >= W:
-        return crop_45(img)
+    cw, ch = _crop_size(W, H, aspect)
+    if cw >= W and ch >= H:
+        return crop_45(img, aspect)
 
-    sem = semantic(img)
+    sem = room_semantic(img)
     score_map = np.zeros(sem.shape, np.float32)
     present = {}
     for name, wgt in FEATURE_WEIGHTS.items():
@@ -413,26 +872,19 @@ def crop_45_feature(img):
             score_map[m] = wgt
             present[name] = int(m.sum())
 
-    best_left, best = 0, -1.0
-    for left in range(0, W - cw + 1, 16):
-        s = float(score_map[:, left:left + cw].sum())
-        # Nudge toward centre only to break ties between equal-content windows.
-        s -= 0.02 * abs((left + cw / 2) - W / 2)
-        if s > best:
-            best_left, best = left, s
-
-    top = (H - ch) // 2
-    out = img.crop((best_left, top, best_left + cw, top + ch)).resize(
-        (OUT_W, OUT_H), Image.LANCZOS)
+    # Nudge toward centre only to break ties between equal-content windows.
+    left, top, cw, ch = best_window(W, H, aspect, maps=[(1.0, score_map)], centre=0.02)
+    out = img.crop((left, top, left + cw, top + ch)).resize(out_size, Image.LANCZOS)
     f_out = f_orig * (OUT_W / cw)
     kept = ", ".join(sorted(present, key=lambda k: -present[k])[:4]) or "nothing named"
-    print("  crop x={} of {} (centre would be {})  keeps: {}".format(
-        best_left, W - cw, (W - cw) // 2, kept))
+    print("  crop x={} y={} of {}x{} (centre would be {},{})  keeps: {}".format(
+        left, top, W - cw, H - ch, (W - cw) // 2, (H - ch) // 2, kept))
     return out, f_out
 
 
-def crop_45(img):
-    """Crop to 4:5 keeping full height, and return the focal length OF THE CROP.
+def crop_45(img, aspect=(4, 5)):
+    """Centre crop to the aspect keeping full height (or width), and return the
+    focal length OF THE CROP.
 
     Focal length must be derived from the ORIGINAL frame and then carried
     through the crop. Assuming the field of view on the already-cropped image
@@ -441,31 +893,34 @@ def crop_45(img):
     length nearly doubled (600 -> ~1124 px) once accounted for."""
     W, H = img.size
     f_orig, _, _ = intrinsics(W, H)          # 84 deg hFOV applies to the ORIGINAL
-    cw = min(W, int(round(H * 4 / 5)))
-    ch = min(H, int(round(cw * 5 / 4)))
+    cw, ch = _crop_size(W, H, aspect)
     left = (W - cw) // 2
     top = (H - ch) // 2
-    out = img.crop((left, top, left + cw, top + ch)).resize((OUT_W, OUT_H), Image.LANCZOS)
-    f_out = f_orig * (OUT_W / cw)
+    out_w, out_h = _out_size(aspect)
+    out = img.crop((left, top, left + cw, top + ch)).resize((out_w, out_h), Image.LANCZOS)
+    f_out = f_orig * (out_w / cw)
     print("  crop {}x{} -> {}x{}   focal {:.0f}px (orig {:.0f}px)".format(
-        cw, ch, OUT_W, OUT_H, f_out, f_orig))
+        cw, ch, out_w, out_h, f_out, f_orig))
     return out, f_out
 
 
-def analyse(img, f):
-    """Depth -> floor plane -> (floor mask, depth)."""
-    from transformers import AutoImageProcessor, AutoModelForDepthEstimation
-    dev = "cuda" if torch.cuda.is_available() else "cpu"
-    mid = "depth-anything/Depth-Anything-V2-Metric-Indoor-Base-hf"
-    proc = AutoImageProcessor.from_pretrained(mid)
-    model = AutoModelForDepthEstimation.from_pretrained(mid).to(dev).eval()
-
-    inp = proc(images=img, return_tensors="pt").to(dev)
-    with torch.no_grad():
-        pred = model(**inp).predicted_depth
-    depth = torch.nn.functional.interpolate(
-        pred.unsqueeze(1), size=img.size[::-1], mode="bicubic", align_corners=False
-    )[0, 0].cpu().numpy()
+def analyse(img, f, depth=None, key=None):
+    """Depth -> floor plane -> (floor mask, depth, standable), from the
+    geometry cache when this crop has been seen before. depth is the raw
+    model output when the listing pre-pass already has it; key the crop's
+    cache key when the caller already hashed it."""
+    gc = geometry_cache()
+    if gc is not None:
+        key = key or gc.key(img)
+        hit = gc.load(key, _floor_name(f))
+        if hit is not None:
+            m = hit["meta"]
+            print("  geometry cache     hit {} (camera read {:.2f}m, depth x{:.3f})".format(
+                key[:10], m["camera"], m["scale"]))
+            return hit["floor"], hit["depth"].astype(np.float32), hit["standable"]
+
+    if depth is None:
+        depth = estimate_depth(img)
 
     w, h = img.size
     pts = unproject(depth, f, w / 2.0, h / 2.0)
@@ -504,25 +959,29 @@ def analyse(img, f):
     # still are not, which is the case the gate exists for.
     standable = (above <= 0.30)
     standable[: int(h * 0.45), :] = False
+
+    if gc is not None:
+        # Hand back exactly what a later hit will load, so a re-run cannot
+        # judge the same crop differently from the first.
+        depth = depth.astype(np.float16)
+        gc.save(key, _floor_name(f), {"depth": depth, "floor": floor, "standable": standable},
+                {"model": DEPTH_MODEL, "n": [float(v) for v in n], "d": float(d),
+                 "camera": float(implied), "scale": float(s)})
+        depth = depth.astype(np.float32)
     return floor, depth, standable
 
 
+def person_masks(imgs):
+    """Semantic segmentation -> boolean 'person' mask for each image, in
+    one batch."""
+    return [_largest_figure(sem == ADE_PERSON) for sem in semantic_batch(imgs)]
+
+
 def person_mask(img):
-    """Semantic segmentation -> boolean mask of 'person' pixels."""
-    from transformers import SegformerImageProcessor, SegformerForSemanticSegmentation
-    dev = "cuda" if torch.cuda.is_available() else "cpu"
-    mid = "nvidia/segformer-b4-finetuned-ade-512-512"
-    proc = SegformerImageProcessor.from_pretrained(mid)
-    model = SegformerForSemanticSegmentation.from_pretrained(mid).to(dev).eval()
+    return person_masks([img])[0]
 
-    inp = proc(images=img, return_tensors="pt").to(dev)
-    with torch.no_grad():
-        logits = model(**inp).logits
-    up = torch.nn.functional.interpolate(
-        logits, size=img.size[::-1], mode="bilinear", align_corners=False
-    )
-    pm = up.argmax(1)[0].cpu().numpy() == ADE_PERSON
 
+def _largest_figure(pm):
     # KEEP ONLY THE LARGEST FIGURE. Semantic segmentation labels every person
     # pixel in the frame, so when the model invented a second figure behind the
     # bar it was composited in alongside the agent - a stranger in the client's
@@ -542,6 +1001,17 @@ def person_mask(img):
     return pm
 
 
+def gate_inputs(gens, ref):
+    """What every take's gates need from the models - the figure's mask and,
+    with a reference, the face inside it - for several takes at once: one
+    Segformer batch and one ArcFace batch. -> [(pm, face)]"""
+    pms = person_masks(gens)
+    if ref is None:
+        return [(pm, None) for pm in pms]
+    faces = face_embeddings(gens, [_figure_box(pm) for pm in pms])
+    return list(zip(pms, faces))
+
+
 # ------------------------------------------------------------------- spot --
 def pick_spot(floor, depth, f):
     """Choose WHERE the agent stands, from geometry rather than from prose.
@@ -593,17 +1063,35 @@ def clearance(floor, depth, x, y, deg, max_px=520):
     """How many METRES of open floor lie in a given image direction from the
     feet. This is what 'walking into a brick wall' failed: a walking pose was
     assigned before anything checked there was anywhere to walk."""
+    return float(clearance_many(floor, depth, np.array([x]), np.array([y]), deg, max_px)[0])
+
+
+def clearance_many(floor, depth, xs, ys, deg, max_px=520):
+    """clearance() for a whole array of feet positions at once.
+
+    The ray is marched for every position together, one 4px step per pass,
+    and a ray drops out of the live set the step it leaves the floor - so the
+    cost is the total ray LENGTH, not rays x 129 steps, and the per-pixel
+    Python loop that made spot search take seconds is gone. Same float maths
+    as the scalar walk, so the same ray lands on the same pixels."""
     import math
     dx, dy = math.cos(math.radians(deg)), -math.sin(math.radians(deg))
     H, W = floor.shape
-    d0 = depth[y, x]
-    last = 0.0
+    xs, ys = np.asarray(xs), np.asarray(ys)
+    d0 = depth[ys, xs]
+    last = np.zeros(len(xs))
+    live = np.arange(len(xs))
     for t in range(4, max_px, 4):
-        xx, yy = int(x + dx * t), int(y + dy * t)
-        if not (0 <= xx < W and 0 <= yy < H) or not floor[yy, xx]:
+        if not live.size:
             break
+        xx = (xs[live] + dx * t).astype(np.int64)
+        yy = (ys[live] + dy * t).astype(np.int64)
+        ok = (xx >= 0) & (xx < W) & (yy >= 0) & (yy < H)
+        ok[ok] = floor[yy[ok], xx[ok]]
+        live, xx, yy = live[ok], xx[ok], yy[ok]
+        dd = depth[yy, xx]
         # Ground distance travelled, from the depth change along the ray.
-        last = abs(depth[yy, xx] - d0) + 0.35 * (t / max(1.0, depth[yy, xx]) * 0.01)
+        last[live] = np.abs(dd - d0[live]) + 0.35 * (t / np.maximum(1.0, dd) * 0.01)
     return last
 
 
@@ -627,66 +1115,103 @@ def near_object(sem, name, reach_px):
     if hit is None or hit.sum() < 400:
         return None
     r = max(12, int(reach_px))
-    grown = hit.copy()
-    for _ in range(r // 6):
-        grown = (grown | np.roll(grown, 6, 0) | np.roll(grown, -6, 0)
-                 | np.roll(grown, 6, 1) | np.roll(grown, -6, 1))
-    return grown & ~hit
+    return _within(hit, r) & ~hit
+
+
+def _within(mask, r):
+    """Pixels within r px (Euclidean) of the mask, in one distance transform.
+    Without scipy, the same disk in two separable passes: each pixel's
+    distance to the mask down its own column, then the nearest column within
+    r horizontally for which dx^2 + dy^2 <= r^2."""
+    try:
+        from scipy import ndimage
+        return ndimage.distance_transform_edt(~mask) <= r
+    except ImportError:
+        H, W = mask.shape
+        rows = np.arange(H)[:, None]
+        up = np.maximum.accumulate(np.where(mask, rows, -2 * H - r), axis=0)
+        down = np.minimum.accumulate(np.where(mask, rows, 3 * H + r)[::-1], axis=0)[::-1]
+        dy2 = np.minimum(np.minimum(rows - up, down - rows), r + 1) ** 2
+        out = np.zeros((H, W), bool)
+        for dx in range(-min(r, W - 1), min(r, W - 1) + 1):
+            near = dy2[:, max(0, dx):W + min(0, dx)] <= r * r - dx * dx
+            out[:, max(0, -dx):W - max(0, dx)] |= near
+        return out
+
 
+CLEARANCE_DIRS = (0, 45, 90, 135, 180)
 
-def candidates(floor, depth, f, sem, n=4, region=None, _relaxed=False, near=None):
+
+def candidates(floor, depth, f, sem, n=4, region=None, _relaxed=False, near=None, stride=5):
     """Emit several spots that are ALL physically valid, well separated.
 
     Geometry's job is to guarantee validity - real floor, whole body in frame,
     correct scale, room to stand. Choosing which valid spot best SHOWS THE ROOM
-    is a question about meaning, and is handed to the vision model instead."""
+    is a question about meaning, and is handed to the vision model instead.
+
+    Every gate is an array op over all sampled floor pixels at once: person
+    height from depth, frame bounds, standing support from an integral image,
+    clearance from clearance_many(). stride=5 samples the floor pixels exactly
+    as the old per-pixel loop did (so the same spots come out); stride=1
+    scores every floor pixel."""
     ys, xs = np.where(floor)
-    pool = []
-    for i in range(0, len(ys), 5):
-        y, x = int(ys[i]), int(xs[i])
-        d = depth[y, x]
-        if not np.isfinite(d) or d <= 0.5:
-            continue
-        h = f * PERSON_H / d
-        lo, hi = (0.24, 0.78) if _relaxed else (0.32, 0.66)
-        if not (lo * OUT_H <= h <= hi * OUT_H):
-            continue
-        if y - h < (10 if _relaxed else 45) or y > OUT_H - 40:
-            continue
-        half = max(8, int(h * 0.16))
-        if x - half < 25 or x + half > OUT_W - 25:
-            continue
-        sub = floor[max(0, y - 8):y + 9, x - half:x + half + 1]
-        if (sub.mean() if sub.size else 0) < (0.55 if _relaxed else 0.78):
-            continue
-        # Free space to either side and ahead - a spot boxed in on all sides is
-        # where the "walking into a brick wall" frame came from.
-        cl = {a: clearance(floor, depth, x, y, a) for a in (0, 45, 90, 135, 180)}
-        openness = sum(sorted(cl.values())[-3:])
-        # Spots inside the region the photo-reader nominated rank first; the
-        # region is advisory, so a geometrically better spot outside it can
-        # still surface if the reader's box was poor.
-        if region and region[0] <= x <= region[2] and region[1] <= y <= region[3]:
-            openness += 4.0
-        # Being within arm's reach of the object he is using outranks having
-        # lots of room - a pool shot happens at the table, not near it.
-        if near is not None and near[min(y, near.shape[0] - 1), x]:
-            openness += 12.0
-        pool.append((openness, x, y, h, cl))
-
-    pool.sort(key=lambda p: -p[0])
+    ys, xs = ys[::stride], xs[::stride]
+    H, W = floor.shape
+
+    d = depth[ys, xs].astype(np.float64)
+    ok = np.isfinite(d) & (d > 0.5)
+    h = f * PERSON_H / np.where(ok, d, 1.0)
+    lo, hi = (0.24, 0.78) if _relaxed else (0.32, 0.66)
+    ok &= (lo * OUT_H <= h) & (h <= hi * OUT_H)
+    ok &= (ys - h >= (10 if _relaxed else 45)) & (ys <= OUT_H - 40)
+    half = np.maximum(8, (h * 0.16).astype(np.int64))
+    ok &= (xs - half >= 25) & (xs + half <= OUT_W - 25)
+
+    # Standing support: fraction of floor in the box around the feet, read
+    # off a summed-area table in four lookups instead of slicing per pixel.
+    sat = np.zeros((H + 1, W + 1), np.int64)
+    sat[1:, 1:] = floor.cumsum(0).cumsum(1)
+    ys, xs, h, half = ys[ok], xs[ok], h[ok], half[ok]
+    r0, r1 = np.maximum(0, ys - 8), np.minimum(H, ys + 9)
+    c0, c1 = np.clip(xs - half, 0, W), np.clip(xs + half + 1, 0, W)
+    area = (r1 - r0) * (c1 - c0)
+    inside = sat[r1, c1] - sat[r0, c1] - sat[r1, c0] + sat[r0, c0]
+    support = np.where(area > 0, inside / np.maximum(area, 1), 0.0)
+    keep = support >= (0.55 if _relaxed else 0.78)
+    ys, xs, h = ys[keep], xs[keep], h[keep]
+
+    # Free space to either side and ahead - a spot boxed in on all sides is
+    # where the "walking into a brick wall" frame came from.
+    cl = np.stack([clearance_many(floor, depth, xs, ys, a) for a in CLEARANCE_DIRS], 1)
+    openness = np.sort(cl, 1)[:, -3:].sum(1) if len(cl) else np.zeros(0)
+    # Spots inside the region the photo-reader nominated rank first; the
+    # region is advisory, so a geometrically better spot outside it can
+    # still surface if the reader's box was poor.
+    if region:
+        openness += 4.0 * ((region[0] <= xs) & (xs <= region[2])
+                           & (region[1] <= ys) & (ys <= region[3]))
+    # Being within arm's reach of the object he is using outranks having
+    # lots of room - a pool shot happens at the table, not near it.
+    if near is not None:
+        openness += 12.0 * near[np.minimum(ys, near.shape[0] - 1), xs]
+
+    # Greedy separation on the scored array: take the best, strike out
+    # everything too close to it, repeat - n passes, not a pass per spot.
+    order = np.argsort(-openness, kind="stable")
+    alive = np.ones(len(order), bool)
     out = []
-    for cand in pool:
-        if all(abs(cand[1] - o[1]) > 0.16 * OUT_W or abs(cand[2] - o[2]) > 0.16 * OUT_H
-               for o in out):
-            out.append(cand)
-        if len(out) == n:
-            break
+    while len(out) < n and alive.any():
+        i = order[np.argmax(alive)]
+        out.append((float(openness[i]), int(xs[i]), int(ys[i]), float(h[i]),
+                    {a: float(cl[i, k]) for k, a in enumerate(CLEARANCE_DIRS)}))
+        alive &= ~((np.abs(xs[order] - xs[i]) <= 0.16 * OUT_W)
+                   & (np.abs(ys[order] - ys[i]) <= 0.16 * OUT_H))
     if not out and not _relaxed:
         # A tight crop around a small feature can leave no spot that clears the
         # strict bars (the game room's wood burner did exactly this). Retry once
         # with looser standing-room and framing limits before giving up.
-        return candidates(floor, depth, f, sem, n=n, region=region, _relaxed=True, near=near)
+        return candidates(floor, depth, f, sem, n=n, region=region, _relaxed=True, near=near,
+                          stride=stride)
     if not out:
         raise RuntimeError("no valid candidate spots")
     return out
@@ -696,7 +1221,6 @@ def choose_spot(img, cands, room_kind):
     """Geometry proposed; vision disposes. Show the numbered valid options and
     ask which one actually shows off the room - plus what he should be doing
     there and what he must not block."""
-    import requests
     from PIL import ImageDraw
     ov = img.copy()
     dr = ImageDraw.Draw(ov)
@@ -721,21 +1245,11 @@ def choose_spot(img, cands, room_kind):
           "\"doing\": \"<one concrete thing he is doing, in under 15 words>\", "
           "\"reject\": \"<why the other boxes are worse, one short clause>\"}"
     )
-    r = requests.post(
-        "https://generativelanguage.googleapis.com/v1beta/models/"
-        "gemini-2.5-flash:generateContent",
-        params={"key": os.environ["GEMINI_API_KEY"]},
-        json={"contents": [{"role": "user", "parts": [
-            {"inline_data": {"mime_type": "image/png",
-                             "data": base64.b64encode(buf.getvalue()).decode()}},
-            {"text": prompt}]}]},
-        timeout=120)
-    r.raise_for_status()
-    txt = "".join(p.get("text", "") for p in r.json()["candidates"][0]["content"]["parts"])
-    m = re.search(r"\{[\s\S]*\}", txt)
-    if not m:
-        raise RuntimeError("no choice returned")
-    j = json.loads(m.group(0))
+    j = _post_json(TEXT_MODEL, {"contents": [{"role": "user", "parts": [
+        {"inline_data": {"mime_type": "image/png",
+                         "data": base64.b64encode(buf.getvalue()).decode()}},
+        {"text": prompt}]}]}, timeout=120, plan=True,
+        parse=lambda r: _json_reply(r, "no choice returned"))
     k = max(1, min(len(cands), int(j.get("choice", 1))))
     print("  vision picks       box {} - feature: {} | facing: {}".format(
         k, j.get("feature"), j.get("facing")))
@@ -800,8 +1314,6 @@ BONES = [("head", "neck"), ("neck", "sL"), ("neck", "sR"), ("sL", "eL"), ("eL",
 
 
 def render_reaction(img, mark, headshot, reaction, wardrobe, feature):
-    import requests
-
     def b64(im):
         b = io.BytesIO(); im.save(b, format="PNG")
         return base64.b64encode(b.getvalue()).decode()
@@ -832,25 +1344,15 @@ def render_reaction(img, mark, headshot, reaction, wardrobe, feature):
         + "Light him with THIS ROOM's light - being nearer the lens he catches more of "
           "it - and keep him sharp against the room behind."
     )
-    r = requests.post(
-        "https://generativelanguage.googleapis.com/v1beta/models/"
-        "gemini-2.5-flash-image:generateContent",
-        params={"key": os.environ["GEMINI_API_KEY"]},
-        json={"contents": [{"role": "user", "parts": [
+    return _response_image(_post_json(IMAGE_MODEL, {
+        "contents": [{"role": "user", "parts": [
             {"inline_data": {"mime_type": "image/png", "data": b64(img)}},
             {"inline_data": {"mime_type": "image/png", "data": b64(mark)}},
             {"inline_data": {"mime_type": "image/png", "data": b64(headshot)}},
             {"inline_data": {"mime_type": "image/png", "data": b64(face_plate(headshot))}},
             {"text": prompt}]}],
-              "generationConfig": {"imageConfig": {"aspectRatio": "4:5", "imageSize": "2K"}}},
-        timeout=180)
-    r.raise_for_status()
-    for part in r.json()["candidates"][0]["content"]["parts"]:
-        d = part.get("inlineData") or part.get("inline_data")
-        if d and d.get("data"):
-            return Image.open(io.BytesIO(base64.b64decode(d["data"]))).convert("RGB").resize(
-                (OUT_W, OUT_H), Image.LANCZOS)
-    raise RuntimeError("no image returned")
+        "generationConfig": {"imageConfig": {"aspectRatio": "4:5", "imageSize": "2K"}}},
+        timeout=180))
 
 
 def check_guides(img):
@@ -874,16 +1376,20 @@ def check_guides(img):
     return n
 
 
-def check_identity(gen, ref, tier):
+def check_identity(gen, ref, tier, pm=None, face=_DETECT):
     """Reject a take whose face is not his. Runs on the RENDER, before anything
-    is composited, so a stranger never reaches an image we might publish."""
+    is composited, so a stranger never reaches an image we might publish. The
+    face is looked for inside the figure's box when pm is given; face is the
+    precomputed face_embeddings() result when gate_inputs() already has it."""
     if ref is None:
         return None
-    f = _largest_face(gen)
-    if f is None:
+    if face is _DETECT:
+        face = face_embeddings([gen], [_figure_box(pm)] if pm is not None else None)[0]
+    if face is None:
         raise RuntimeError("no face detected in the render")
-    sim = float(np.dot(ref, f.normed_embedding))
-    frac = (f.bbox[3] - f.bbox[1]) / OUT_H
+    emb, bbox = face
+    sim = float(np.dot(ref, emb))
+    frac = (bbox[3] - bbox[1]) / OUT_H
     need = next(t for lo, t in FACE_MIN_BY_SIZE if frac >= lo)
     print("  face match         cos {:.3f} (need {:.2f}; face is {:.0%} of frame)".format(
         sim, need, frac))
@@ -892,13 +1398,13 @@ def check_identity(gen, ref, tier):
     return sim
 
 
-def compose_reaction(base, gen, pm, side, feat_box=None, ref=None):
+def compose_reaction(base, gen, pm, side, feat_box=None, ref=None, face=_DETECT):
     """Gates for an edge reaction. Deliberately NOT the standing gates: there
     are no feet to put on a floor and no full height to measure, so checking
     for them would reject every correct frame. What matters instead is that he
     stayed at the edge, stayed big, and left the room visible."""
     check_guides(gen)
-    sim = check_identity(gen, ref, "reaction")
+    sim = check_identity(gen, ref, "reaction", pm, face)
     ys, xs = np.where(pm)
     if len(ys) < 500:
         raise RuntimeError("segmentation found no person")
@@ -925,14 +1431,11 @@ def compose_reaction(base, gen, pm, side, feat_box=None, ref=None):
     print("  reaction figure    {:.0%} tall, {:.0%} wide, on the {} edge".format(
         hfrac, wfrac, side))
 
-    b = np.array(base).astype(np.float32)
-    g = np.array(gen).astype(np.float32)
-    a = Image.fromarray((pm * 255).astype(np.uint8)).filter(ImageFilter.GaussianBlur(1.2))
-    a = (np.array(a).astype(np.float32) / 255.0)[..., None]
-    comp = b * (1 - a) + g * a
-    drift = float(np.abs(b[~pm] - g[~pm]).mean())
+    b, g = np.asarray(base), np.asarray(gen)
+    drift = _room_drift(b, g, pm, (top, bot, left, right))
     print("  room drift         {:.1f}/255 outside the figure".format(drift))
-    return (Image.fromarray(np.clip(comp, 0, 255).astype(np.uint8)),
+    comp, _ = _composite(b, g, pm, (top, bot, left, right))
+    return (Image.fromarray(comp),
             {"tier": "reaction", "height_frac": round(hfrac, 3), "drift": round(drift, 1),
              "face": round(sim, 3) if sim else None})
 
@@ -1022,17 +1525,11 @@ def render(img, mark, headshot, pose, wardrobe):
     """REST rather than the SDK: the installed google-genai predates
     `image_config`, and native 4:5 output matters - resizing a 16:9 return
     would distort the person we just went to trouble to scale correctly."""
-    import requests
-
     def b64(im, fmt="PNG"):
         b = io.BytesIO()
         im.save(b, format=fmt)
         return base64.b64encode(b.getvalue()).decode()
 
-    key = os.environ["GEMINI_API_KEY"]
-    url = ("https://generativelanguage.googleapis.com/v1beta/models/"
-           "gemini-2.5-flash-image:generateContent")
-
     prompt = (
         "IMAGE 1 is a photograph of a room. IMAGE 2 is a POSITION DIAGRAM on a dark "
         "canvas at exactly the same dimensions - it is not a photograph and nothing in "
@@ -1077,22 +1574,93 @@ def render(img, mark, headshot, pose, wardrobe):
         ]}],
         "generationConfig": {"imageConfig": {"aspectRatio": "4:5", "imageSize": "2K"}},
     }
-    r = requests.post(url, params={"key": key}, json=body, timeout=180)
-    r.raise_for_status()
-    for part in r.json()["candidates"][0]["content"]["parts"]:
-        d = part.get("inlineData") or part.get("inline_data")
-        if d and d.get("data"):
-            raw = base64.b64decode(d["data"])
-            return Image.open(io.BytesIO(raw)).convert("RGB").resize(
-                (OUT_W, OUT_H), Image.LANCZOS)
-    raise RuntimeError("no image returned")
+    return _response_image(_post_json(IMAGE_MODEL, body, timeout=180))
 
 
 # --------------------------------------------------------------- composite --
-def compose(base, gen, pm, floor, depth, f, mode="standing", sem=None, standable=None, ref=None):
-    """Keep only the person; transfer their shadow as darken-only."""
+# EVERYTHING HERE IS LOCAL TO THE FIGURE. The gates read a 13-row strip under
+# the feet, and the blend and the shadow can only change pixels within a few
+# blur radii of the person's box - the rest of the output is, by design,
+# literally the original array. So the gates are index arrays rather than
+# per-pixel Python loops, and the float work runs on a window around the
+# figure instead of the whole 1080x1350 frame, which used to cost more per
+# take than everything but the models.
+SOLID = [ADE[k] for k in ("cabinet", "table", "chair", "sofa", "shelf", "armchair", "seat",
+                          "desk", "counter", "countertop", "island", "bar", "pooltable",
+                          "coffeetable", "bed", "stove", "sink")]
+ALPHA_PAD = 8           # > the reach of the GaussianBlur(1.2) alpha feather
+SHADOW_PAD = 48         # > the reach of the GaussianBlur(7) shadow
+
+
+def _room_drift(b, g, pm, box):
+    """Mean absolute difference (0-255) between base and render outside the
+    figure: whole-frame total minus the figure's pixels inside its box = (top,
+    bot, left, right), in integer arithmetic on the uint8 frames."""
+    top, bot, left, right = box
+    d = np.maximum(b, g)
+    d -= np.minimum(b, g)
+    inside = d[top:bot + 1, left:right + 1][pm[top:bot + 1, left:right + 1]]
+    outside = int(d.sum(dtype=np.int64)) - int(inside.sum(dtype=np.int64))
+    return outside / max(1, 3 * (pm.size - int(np.count_nonzero(pm))))
+
+
+def _composite(b, g, pm, box, shadow=False):
+    """Paste the figure from g onto b (feathered), plus the darken-only
+    shadow transfer when asked. Only a window around box = (top, bot, left,
+    right) is touched; returns (uint8 frame, shadow max)."""
+    top, bot, left, right = box
+    H, W = pm.shape
+    pad_x = ALPHA_PAD + (130 + SHADOW_PAD if shadow else 0)
+    y0, y1 = max(0, top - ALPHA_PAD), min(H, bot + 1 + (90 + SHADOW_PAD if shadow else ALPHA_PAD))
+    x0, x1 = max(0, left - pad_x), min(W, right + 1 + pad_x)
+    bw = b[y0:y1, x0:x1].astype(np.float32)
+    gw = g[y0:y1, x0:x1].astype(np.float32)
+    mw = pm[y0:y1, x0:x1]
+
+    a = Image.fromarray((mw * 255).astype(np.uint8)).filter(ImageFilter.GaussianBlur(1.2))
+    a = (np.asarray(a).astype(np.float32) / 255.0)[..., None]
+    comp = bw * (1 - a) + gw * a
+
+    # Shadow: darken-only, near the feet, outside the figure. A multiply can
+    # never change the floor's MATERIAL, only its brightness, so this cannot
+    # smuggle in a repaint.
+    smax = None
+    if shadow:
+        sh = np.zeros(mw.shape, np.float32)
+        ry0 = max(0, top + int(0.55 * (bot - top))) - y0
+        ry1 = min(H, bot + 90) - y0
+        rx0, rx1 = max(0, left - 130) - x0, min(W, right + 130) - x0
+        reg = ~mw[ry0:ry1, rx0:rx1]
+        rat = np.clip(gw[ry0:ry1, rx0:rx1].mean(2) / np.maximum(bw[ry0:ry1, rx0:rx1].mean(2), 1.0), 0, 1)
+        sh[ry0:ry1, rx0:rx1][reg] = 1.0 - rat[reg]
+        sh = np.asarray(Image.fromarray((np.clip(sh, 0, 1) * 255).astype(np.uint8))
+                        .filter(ImageFilter.GaussianBlur(7))).astype(np.float32) / 255.0
+        sh = np.clip(sh - 0.06, 0, 1) * 0.9
+        comp *= (1.0 - sh)[..., None]
+        smax = float(sh.max())
+
+    out = np.array(b, dtype=np.uint8)
+    out[y0:y1, x0:x1] = np.clip(comp, 0, 255).astype(np.uint8)
+    return out, smax
+
+
+def compose(base, gen, pm, floor, depth, f, mode="standing", sem=None, standable=None, ref=None,
+            face=_DETECT):
+    """Keep only the person; transfer their shadow as darken-only. The stats
+    carry a per-stage timing breakdown in ms."""
+    timing = {}
+    t = time.perf_counter()
+
+    def lap(name):
+        nonlocal t
+        now = time.perf_counter()
+        timing[name] = round((now - t) * 1000, 1)
+        t = now
+
     check_guides(gen)
-    sim = check_identity(gen, ref, "action")
+    lap("guides")
+    sim = check_identity(gen, ref, "action", pm, face)
+    lap("identity")
     ys, xs = np.where(pm)
     if len(ys) < 500:
         raise RuntimeError("segmentation found no person")
@@ -1107,13 +1675,12 @@ def compose(base, gen, pm, floor, depth, f, mode="standing", sem=None, standable
         raise RuntimeError("figure runs off the bottom edge - feet cropped")
 
     # --- GATE 1: are the feet on the fitted floor plane? ---
+    # Each mask pixel in the bottom 13 rows is tested 6px BELOW itself.
     y0 = max(0, bot - 12)
     fys, fxs = np.where(pm[y0:bot + 1, :])
     surf = standable if standable is not None else floor
-    on_floor = 0
-    for yy, xx in zip(fys + y0, fxs):
-        on_floor += surf[min(yy + 6, surf.shape[0] - 1), xx]
-    frac = on_floor / max(1, len(fys))
+    below = np.minimum(fys + y0 + 6, surf.shape[0] - 1)
+    frac = float(np.count_nonzero(surf[below, fxs])) / max(1, len(fys))
     print("  feet-on-floor      {:.0%}".format(frac))
     # WHEN THE LOWER BODY IS HIDDEN, THE BOTTOM OF THE MASK IS NOT THE FEET.
     # Leaning on an island or sat at a table puts the legs BEHIND the furniture,
@@ -1128,16 +1695,9 @@ def compose(base, gen, pm, floor, depth, f, mode="standing", sem=None, standable
     else:
         support = frac
         if sem is not None and frac < 0.30:
-            SOLID = {ADE[k] for k in ("cabinet", "table", "chair", "sofa", "shelf",
-                                      "armchair", "seat", "desk", "counter", "countertop",
-                                      "island", "bar", "pooltable", "coffeetable",
-                                      "bed", "stove", "sink", "case" if "case" in ADE else "table")}
-            hit = 0
-            for yy, xx in zip(fys + y0, fxs):
-                y2 = min(yy + 6, sem.shape[0] - 1)
-                if sem[y2, xx] in SOLID or floor[y2, xx]:
-                    hit += 1
-            support = hit / max(1, len(fys))
+            below = np.minimum(fys + y0 + 6, sem.shape[0] - 1)
+            hit = np.isin(sem[below, fxs], SOLID) | floor[below, fxs]
+            support = float(np.count_nonzero(hit)) / max(1, len(fys))
             print("  contact support    {:.0%} (lower body occluded by furniture)".format(support))
         if support < 0.30:
             raise RuntimeError(
@@ -1155,47 +1715,104 @@ def compose(base, gen, pm, floor, depth, f, mode="standing", sem=None, standable
         fd, expect, mode, actual, ratio))
     if not (0.70 <= ratio <= 1.32):
         raise RuntimeError("scale wrong for that distance ({:.2f}x)".format(ratio))
+    lap("gates")
 
-    b = np.array(base).astype(np.float32)
-    g = np.array(gen).astype(np.float32)
+    b, g = np.asarray(base), np.asarray(gen)
 
     # How much did the room change OUTSIDE the person? Tells us whether the
     # shadow transfer is safe (it assumes the two frames still line up).
-    drift = float(np.abs(b[~pm] - g[~pm]).mean())
+    drift = _room_drift(b, g, pm, (top, bot, left, right))
     print("  room drift         {:.1f}/255 outside the figure".format(drift))
+    lap("drift")
 
-    a = Image.fromarray((pm * 255).astype(np.uint8)).filter(ImageFilter.GaussianBlur(1.2))
-    a = (np.array(a).astype(np.float32) / 255.0)[..., None]
-    comp = b * (1 - a) + g * a
-
-    # Shadow: darken-only, near the feet, outside the figure. A multiply can
-    # never change the floor's MATERIAL, only its brightness, so this cannot
-    # smuggle in a repaint.
-    if drift < 42:
-        sh = np.zeros((OUT_H, OUT_W), np.float32)
-        ry0 = max(0, top + int(0.55 * (bot - top)))
-        ry1 = min(OUT_H, bot + 90)
-        rx0, rx1 = max(0, left - 130), min(OUT_W, right + 130)
-        reg = np.zeros_like(sh, bool)
-        reg[ry0:ry1, rx0:rx1] = True
-        reg &= ~pm
-        rat = np.clip(g.mean(2) / np.maximum(b.mean(2), 1.0), 0, 1)
-        sh[reg] = 1.0 - rat[reg]
-        sh = np.array(Image.fromarray((np.clip(sh, 0, 1) * 255).astype(np.uint8))
-                      .filter(ImageFilter.GaussianBlur(7))).astype(np.float32) / 255.0
-        sh = np.clip(sh - 0.06, 0, 1) * 0.9
-        comp *= (1.0 - sh)[..., None]
-        print("  shadow transferred (max {:.2f})".format(sh.max()))
+    comp, smax = _composite(b, g, pm, (top, bot, left, right), shadow=drift < 42)
+    if smax is not None:
+        print("  shadow transferred (max {:.2f})".format(smax))
     else:
         print("  shadow SKIPPED - room drifted too far to trust alignment")
+    lap("composite")
+    print("  compose timing     " + " | ".join("{} {:.0f}ms".format(k, v) for k, v in timing.items()))
 
-    return (Image.fromarray(np.clip(comp, 0, 255).astype(np.uint8)),
+    return (Image.fromarray(comp),
             {"feet_on_floor": round(frac, 3), "scale_ratio": round(ratio, 3),
-             "drift": round(drift, 1), "face": round(sim, 3) if sim else None})
+             "drift": round(drift, 1), "face": round(sim, 3) if sim else None,
+             "timing_ms": timing})
 
 
 HEADSHOT = ("https://res.cloudinary.com/duqgao9h8/image/upload/v1774327194/"
             "headshots/head-shot-2026.png")
+_HEADSHOT_IMG = None
+
+
+def load_headshot():
+    """The agent headshot, from the local image cache: downloaded once ever,
+    decoded once per process. It used to be fetched from Cloudinary twice per
+    photo - a --batch run over a listing paid for it dozens of times."""
+    global _HEADSHOT_IMG
+    if _HEADSHOT_IMG is None:
+        from image_cache import ImageCache
+        _HEADSHOT_IMG = ImageCache().image(HEADSHOT)
+    return _HEADSHOT_IMG.copy()
+
+
+# TAKES RUN CONCURRENTLY. A render is a long blocking POST and the model, not
+# this machine, is what it waits on; three takes in sequence cost three
+# renders of wall clock even when the first one would have passed. All takes
+# are dispatched at once and each is gated the moment it lands, on the calling
+# thread, never on a take thread. The gates' local models still must not
+# fight each other for the CPU when run_batch has several photos gating at
+# once; that is what _INFER_LOCK is for. The first to pass wins and the
+# others are abandoned: takes not yet started are cancelled, and a POST
+# already in flight cannot be aborted mid-request, so its result is simply
+# never looked at.
+#
+# THE COST CHANGED WITH THIS. Sequential takes stopped paying at the first
+# pass; with takes <= STAGE_TAKE_WORKERS (3 and 3 by default) every take is
+# in flight before any is gated, so nothing is ever cancelled and EVERY photo
+# pays for all its renders. Set STAGE_TAKE_WORKERS=1 for the old
+# pay-until-one-passes behaviour at the old wall clock. The abandoned POSTs
+# run on executor threads the interpreter would wait for at exit (up to the
+# render timeout each), so main() leaves with os._exit once its output is
+# flushed - the caller resolves on the process closing, not on the last POST.
+STAGE_TAKE_WORKERS = max(1, int(os.environ.get("STAGE_TAKE_WORKERS", "3")))
+
+
+def _first_passing(takes, render_take, gate_take, label="", prefetch=None):
+    """Dispatch `takes` renders at once and gate each as it arrives. Returns
+    the first gate_take(gen[, extra]) that does not raise RuntimeError, or
+    None. Takes that land together are handed to prefetch(gens) as one batch,
+    and gate_take gets each one's share as `extra`. If no render came back at
+    all, the first render error is raised."""
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    pool = ThreadPoolExecutor(max_workers=min(takes, STAGE_TAKE_WORKERS))
+    futs = {pool.submit(render_take): i for i in range(1, takes + 1)}
+    print("dispatched {} take(s){}, {} at a time".format(takes, label, min(takes, STAGE_TAKE_WORKERS)))
+    errors, landed, pending = [], 0, set(futs)
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            arrived = []
+            for fut in sorted(done, key=futs.get):
+                try:
+                    arrived.append((futs[fut], fut.result()))
+                except Exception as e:
+                    print("  take {} failed: {}".format(futs[fut], str(e)[:160]))
+                    errors.append(e)
+            if not arrived:
+                continue
+            extras = prefetch([g for _, g in arrived]) if prefetch else [None] * len(arrived)
+            for (i, gen), extra in zip(arrived, extras):
+                landed += 1
+                print("take {}{}...".format(i, label))
+                try:
+                    return gate_take(gen, extra) if prefetch else gate_take(gen)
+                except RuntimeError as e:
+                    print("  rejected: {}".format(e))
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    if not landed and errors:
+        raise errors[0]
+    return None
 
 
 # Formality by room: the great room, dining and formal living carry the sharp
@@ -1203,75 +1820,157 @@ HEADSHOT = ("https://res.cloudinary.com/duqgao9h8/image/upload/v1774327194/"
 SHARP_ROOMS = {"living", "great_room", "dining", "primary_bedroom", "office", "exterior"}
 
 
-def stage_one(src, out_name="staged.png", takes=3, room_hint=None, used_poses=None):
-    import requests
+def prepare(src, out_name="staged.png", room_hint=None):
+    """Stages 1-2 of stage_one, which only need the vision reader and the
+    original: everything the geometry stage starts from."""
     orig = Image.open(src).convert("RGB")
 
     # 1. READ the photograph, full frame, before anything is discarded.
     print("reading photo...")
     plan = read_photo(orig)
-    room_kind = room_hint or plan.get("room", "living")
 
     # 2. CROP to serve that decision.
-    sem_orig = semantic(orig) if plan.get("contact_object") else None
+    sem_orig = room_semantic(orig) if plan.get("contact_object") else None
     base, f, cl_x, cl_y, cw = crop_for_plan(orig, plan, sem_orig)
-    base.save(src.with_name("base_" + out_name))
+    base_path = src.with_name("base_" + out_name)
+    base.save(base_path)
+    return {"plan": plan, "room_kind": room_hint or plan.get("room", "living"),
+            "orig_size": orig.size, "base": base, "base_path": base_path,
+            "f": f, "crop": (cl_x, cl_y, cw)}
+
+
+def precompute_geometry(preps):
+    """The listing pre-pass: depth and semantics for every prepared crop the
+    geometry cache does not already hold, as batched tensors. Results are
+    kept on the prep for stage_one and written beside the base image as
+    <base>.depth.npy / <base>.sem.npy (the same sidecar depth_probe.py
+    writes, so floor_plane.py can re-fit any of them)."""
+    preps = [p for p in preps if p is not None]
+    if not preps:
+        return
+    gc = geometry_cache()
+    for p in preps:
+        p["key"] = gc.key(p["base"]) if gc is not None else None
+    need_d = [p for p in preps if gc is None or not gc.has(p["key"], _floor_name(p["f"]))]
+    need_s = [p for p in preps if gc is None or not gc.has(p["key"], SEM_TAG)]
+    print("geometry pre-pass: {} photos, {} depth + {} semantic to compute, batch {}".format(
+        len(preps), len(need_d), len(need_s), STAGE_BATCH))
+    for p, d in zip(need_d, estimate_depth_batch([p["base"] for p in need_d])):
+        p["depth_raw"] = d
+        np.save(p["base_path"].with_suffix(".depth.npy"), d)
+    for p, sm in zip(need_s, semantic_batch([p["base"] for p in need_s])):
+        p["sem"] = room_semantic(p["base"], p["key"], sm)
+        np.save(p["base_path"].with_suffix(".sem.npy"), sm)
+
+
+class PoseLedger:
+    """Which body mode + pose each photo of a listing holds, so a carousel does
+    not show the same stance four times.
+
+    With photos pipelined, photo N+1 is planned while photo N is still being
+    rendered, so "poses used so far" is not a set that can be added to after
+    the fact. A photo RESERVES its pose when it is planned (in job order),
+    keeps it if a take passes, and releases it as soon as its renders fall
+    back to a reaction or fail - freeing the stance for photos planned after
+    that. Releases happen when renders finish, so which stance a later photo
+    gets can depend on timing; the ledger only promises no two photos hold
+    the same one at once."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._held = {}              # owner -> "mode:pose"
+
+    def reserve(self, owner, mode, prefer):
+        """Reserve the first of `prefer` (pose keys, best first) that no
+        other photo holds in this mode - or prefer[0] if all are taken."""
+        with self._lock:
+            taken = {k for o, k in self._held.items() if o != owner}
+            pose = next((p for p in prefer if "{}:{}".format(mode, p) not in taken), prefer[0])
+            self._held[owner] = "{}:{}".format(mode, pose)
+            return pose
+
+    def release(self, owner):
+        with self._lock:
+            self._held.pop(owner, None)
+
+    def held(self):
+        with self._lock:
+            return sorted(self._held.values())
+
+
+def _stage_reaction(job, reason, takes):
+    """REACTION: either the reader asked for it (nothing here worth using), or
+    the action path cannot find anywhere valid to stand. Both end up here,
+    which is why no geometry failure needs to be fatal any more."""
+    src, out_name, plan, base = job["src"], job["out_name"], job["plan"], job["base"]
+    cl_x, cl_y, cw = job["crop"]
+    # Record what actually happened. The batch result was reporting the
+    # PLANNED tier, so a bedroom that fell back to a reaction was logged as
+    # a seated action - the log said one thing and the slide showed another.
+    plan["tier"] = "reaction"
+    side = plan.get("side") if plan.get("side") in ("left", "right") else "right"
+    # A reader that planned an ACTION never chose a reaction, so falling
+    # back must not invent an extreme one: a wide-eyed "wow" fired in a
+    # BEDROOM this way. Astonishment has to be earned by an explicit
+    # reader decision, never reached by default.
+    rk = plan.get("reaction") if plan.get("reaction") in REACTIONS else "approving"
+    if reason != "nothing here worth using" and rk == "wow":
+        rk = "approving"
+    print("  TIER reaction      {} on the {} ({})".format(rk, side, reason))
+    mark = reaction_marker(base, side)
+    mark.save(src.with_name("marker_" + out_name))
+    wd = pick_wardrobe(base, OUT_W // 2, int(OUT_H * 0.9), int(OUT_H * 0.6),
+                       "sharp" if plan.get("luxury") else "casual")
+    fb = _box_px(plan.get("feature_box"), *job["orig_size"])
+    fbc = None
+    if fb:
+        sc = OUT_W / cw
+        fbc = ((fb[1] - cl_y) * sc, (fb[0] - cl_x) * sc,
+               (fb[3] - cl_y) * sc, (fb[2] - cl_x) * sc)
+    hs = load_headshot()
+    ref = face_ref(hs)
+    won = _first_passing(
+        takes,
+        lambda: render_reaction(base, mark, hs, REACTIONS[rk], wd, plan.get("feature")),
+        lambda g, x: compose_reaction(base, g, x[0], side, fbc, ref, x[1]),
+        " (reaction)", prefetch=lambda gens: gate_inputs(gens, ref))
+    if won is None:
+        return None, plan
+    o, st = won
+    o.save(src.with_name(out_name))
+    st.update({"room": plan.get("room"), "reaction": rk, "feature": plan.get("feature")})
+    print("OK -> {} {}".format(out_name, json.dumps(st)))
+    return o, plan
+
+
+def stage_plan(src, out_name="staged.png", room_hint=None, poses=None, prep=None):
+    """Everything before the first render - geometry, the spot, the pose, the
+    wardrobe and the marker. Returns the job stage_finish() renders; a job
+    with a "reaction" reason goes straight to the reaction tier."""
+    if prep is None:
+        prep = prepare(src, out_name, room_hint)
+    plan, room_kind, base, f = prep["plan"], prep["room_kind"], prep["base"], prep["f"]
+    cl_x, cl_y, cw = prep["crop"]
+    job = {"src": src, "out_name": out_name, "plan": plan, "room_kind": room_kind,
+           "base": base, "f": f, "crop": prep["crop"], "orig_size": prep["orig_size"]}
 
     # 3. GEOMETRY proves which spots are physically real.
     print("geometry...")
-    floor, depth, standable = analyse(base, f)
-    sem = semantic(base)
+    gc = geometry_cache()
+    key = prep.get("key") or (gc.key(base) if gc is not None else None)
+    floor, depth, standable = analyse(base, f, prep.get("depth_raw"), key)
+    sem = room_semantic(base, key, prep.get("sem"))
 
     region = None
-    r = _box_px(plan.get("stand_region"), *orig.size)
+    r = _box_px(plan.get("stand_region"), *prep["orig_size"])
     if r:
         sc = OUT_W / cw
         region = ((r[0] - cl_x) * sc, (r[1] - cl_y) * sc,
                   (r[2] - cl_x) * sc, (r[3] - cl_y) * sc)
-    # REACTION: either the reader asked for it (nothing here worth using), or
-    # the action path cannot find anywhere valid to stand. Both end up here,
-    # which is why no geometry failure needs to be fatal any more.
-    def _reaction(reason):
-        # Record what actually happened. The batch result was reporting the
-        # PLANNED tier, so a bedroom that fell back to a reaction was logged as
-        # a seated action - the log said one thing and the slide showed another.
-        plan["tier"] = "reaction"
-        side = plan.get("side") if plan.get("side") in ("left", "right") else "right"
-        # A reader that planned an ACTION never chose a reaction, so falling
-        # back must not invent an extreme one: a wide-eyed "wow" fired in a
-        # BEDROOM this way. Astonishment has to be earned by an explicit
-        # reader decision, never reached by default.
-        rk = plan.get("reaction") if plan.get("reaction") in REACTIONS else "approving"
-        if reason != "nothing here worth using" and rk == "wow":
-            rk = "approving"
-        print("  TIER reaction      {} on the {} ({})".format(rk, side, reason))
-        mark = reaction_marker(base, side)
-        mark.save(src.with_name("marker_" + out_name))
-        wd = pick_wardrobe(base, OUT_W // 2, int(OUT_H * 0.9), int(OUT_H * 0.6),
-                           "sharp" if plan.get("luxury") else "casual")
-        fb = _box_px(plan.get("feature_box"), *orig.size)
-        fbc = None
-        if fb:
-            sc = OUT_W / cw
-            fbc = ((fb[1] - cl_y) * sc, (fb[0] - cl_x) * sc,
-                   (fb[3] - cl_y) * sc, (fb[2] - cl_x) * sc)
-        hs = Image.open(io.BytesIO(requests.get(HEADSHOT, timeout=60).content)).convert("RGB")
-        ref = face_ref(hs)
-        for take in range(1, takes + 1):
-            print("take {} (reaction)...".format(take))
-            g = render_reaction(base, mark, hs, REACTIONS[rk], wd, plan.get("feature"))
-            try:
-                o, st = compose_reaction(base, g, person_mask(g), side, fbc, ref)
-            except RuntimeError as e:
-                print("  rejected: {}".format(e)); continue
-            o.save(src.with_name(out_name))
-            st.update({"room": plan.get("room"), "reaction": rk, "feature": plan.get("feature")})
-            print("OK -> {} {}".format(out_name, json.dumps(st)))
-            return o, plan
-        return None, plan
 
     if str(plan.get("tier", "action")).lower() == "reaction":
-        return _reaction("nothing here worth using")
+        job["reaction"] = "nothing here worth using"
+        return job
 
     reach = f * 0.9 / max(1.5, float(np.median(depth[floor]) if floor.any() else 3.0))
     near = near_object(sem, plan.get("contact_object") or plan.get("feature"), reach)
@@ -1281,7 +1980,8 @@ def stage_one(src, out_name="staged.png", takes=3, room_hint=None, used_poses=No
     try:
         cands = candidates(floor, depth, f, sem, region=region, near=near)
     except RuntimeError as e:
-        return _reaction("no full-body spot: {}".format(e))
+        job["reaction"] = "no full-body spot: {}".format(e)
+        return job
     print("  candidates         {} valid spots".format(len(cands)))
 
     # 4. VISION picks among valid options, seeded with the plan's intent.
@@ -1301,18 +2001,23 @@ def stage_one(src, out_name="staged.png", takes=3, room_hint=None, used_poses=No
     if mode not in BODY_MODES:
         mode = "standing"
 
+    # The stance the intent asks for comes first; the other plain stances
+    # are what the ledger may hand out instead when another photo holds it.
     intent = (str(plan.get("action", "")) + " " + str(plan.get("facing", ""))).lower()
-    if any(w in intent for w in ("walk", "stride", "stepping", "entering")) and ahead > 1.1:
-        pose_key = "walk_look_back"
+    can_walk = ahead > 1.1
+    if any(w in intent for w in ("walk", "stride", "stepping", "entering")) and can_walk:
+        first = "walk_look_back"
     elif any(w in intent for w in ("talk", "convers", "laugh", "welcom")):
-        pose_key = "mid_sentence"
+        first = "mid_sentence"
     else:
-        pose_key = "hand_pocket_angle"
-    used = used_poses if used_poses is not None else set()
-    used.add(mode + ":" + pose_key)
+        first = "hand_pocket_angle"
+    prefer = [first] + [k for k in ("hand_pocket_angle", "mid_sentence", "walk_look_back")
+                        if k != first and (can_walk or k != "walk_look_back")]
+    poses = poses if poses is not None else PoseLedger()
+    pose_key = poses.reserve(str(src.with_name(out_name)), mode, prefer)
     print("  action             {}".format(plan.get("action")))
-    print("  body mode          {} (x{:.2f} height) | contact: {}".format(
-        mode, BODY_MODES[mode], plan.get("contact_object")))
+    print("  body mode          {} (x{:.2f} height) | contact: {} | pose {}".format(
+        mode, BODY_MODES[mode], plan.get("contact_object"), pose_key))
     print("  clearance          {:.2f}m ahead at {} deg".format(ahead, best_dir))
 
     formal = "sharp" if plan.get("formality") == "sharp" or room_kind in SHARP_ROOMS else "casual"
@@ -1320,31 +2025,116 @@ def stage_one(src, out_name="staged.png", takes=3, room_hint=None, used_poses=No
     mark = marker(base, x, y, h, pose_key, mode)
     mark.save(src.with_name("marker_" + out_name))
 
-    headshot = Image.open(io.BytesIO(requests.get(HEADSHOT, timeout=60).content)).convert("RGB")
-    ref = face_ref(headshot)
     contact = plan.get("contact_object")
     pose = "{}{} He is looking {}. Do not block or crowd the {}.".format(
         plan.get("action", POSES[pose_key]["desc"]),
         " He is in real physical contact with the {}.".format(contact) if contact else "",
         plan.get("facing", "into the room"), plan.get("feature", "room's feature"))
+    job.update({"floor": floor, "depth": depth, "sem": sem, "standable": standable,
+                "mode": mode, "pose": pose, "wardrobe": wardrobe, "mark": mark})
+    return job
+
 
-    for take in range(1, takes + 1):
-        print("take {}...".format(take))
-        gen = render(base, mark, headshot, pose, wardrobe)
+def stage_finish(job, takes=3, poses=None):
+    """The renders and their gates for a planned job -> (image or None, plan)."""
+    if "reaction" in job:
+        return _stage_reaction(job, job["reaction"], takes)
+    src, out_name, plan, base = job["src"], job["out_name"], job["plan"], job["base"]
+    kept = False
+    try:
+        hs = load_headshot()
+        ref = face_ref(hs)
+        won = _first_passing(
+            takes,
+            lambda: render(base, job["mark"], hs, job["pose"], job["wardrobe"]),
+            lambda gen, x: compose(base, gen, x[0], job["floor"], job["depth"], job["f"],
+                                   job["mode"], job["sem"], job["standable"], ref, x[1]),
+            prefetch=lambda gens: gate_inputs(gens, ref))
+        if won is not None:
+            out, stats = won
+            out.save(src.with_name(out_name))
+            kept = True
+    finally:
+        # Rejected or failed: hand the stance back now, not after the batch
+        if not kept and poses is not None:
+            poses.release(str(src.with_name(out_name)))
+    if not kept:
+        return _stage_reaction(job, "all action takes rejected", takes)
+    stats["room"] = job["room_kind"]
+    stats["feature"] = plan.get("feature")
+    stats["action"] = plan.get("action")
+    stats["mode"] = job["mode"]
+    print("OK -> {} {}".format(out_name, json.dumps(stats)))
+    return out, plan
+
+
+def stage_one(src, out_name="staged.png", takes=3, room_hint=None, used_poses=None, prep=None):
+    return stage_finish(stage_plan(src, out_name, room_hint, used_poses, prep), takes, used_poses)
+
+
+# THE LISTING PIPELINE. Photos are independent until the pose ledger, and
+# their stages are bound by different things: reading a photo and rendering
+# one wait on the network, geometry and gating on this CPU. So --batch reads
+# every photo concurrently, runs the dense models over the listing in
+# batches, then plans photos in job order on this thread while the renders
+# of earlier photos are in flight on STAGE_PIPELINE workers (each of which
+# fans out its own takes). Planning runs at most 2 x STAGE_PIPELINE photos
+# ahead of the renders, which bounds the maps held in memory and keeps the
+# ledger's releases useful to later photos.
+STAGE_PIPELINE = max(1, int(os.environ.get("STAGE_PIPELINE", "2")))
+
+
+def _capture(fn, *args):
+    try:
+        return fn(*args)
+    except Exception as e:
+        return e
+
+
+def run_batch(jobs, takes=3):
+    """Stage a listing's [{"src", "out"}] jobs -> result dicts in job order."""
+    from concurrent.futures import ThreadPoolExecutor
+    ledger = PoseLedger()
+    with ThreadPoolExecutor(max_workers=STAGE_PIPELINE) as pool:
+        preps = [pool.submit(_capture, prepare, pathlib.Path(j["src"]), j["out"]) for j in jobs]
+        preps = [p.result() for p in preps]
         try:
-            out, stats = compose(base, gen, person_mask(gen), floor, depth, f, mode, sem,
-                                 standable, ref)
-        except RuntimeError as e:
-            print("  rejected: {}".format(e))
-            continue
-        out.save(src.with_name(out_name))
-        stats["room"] = room_kind
-        stats["feature"] = plan.get("feature")
-        stats["action"] = plan.get("action")
-        stats["mode"] = mode
-        print("OK -> {} {}".format(out_name, json.dumps(stats)))
-        return out, plan
-    return _reaction("all action takes rejected")
+            precompute_geometry([p for p in preps if isinstance(p, dict)])
+        except Exception as e:
+            print("  geometry pre-pass failed ({}), falling back per photo".format(str(e)[:120]))
+
+        finishing = []
+        for j, prep in zip(jobs, preps):
+            ahead = len(finishing) - 2 * STAGE_PIPELINE
+            if ahead >= 0 and hasattr(finishing[ahead], "result"):
+                finishing[ahead].result()
+            job = prep if isinstance(prep, Exception) else _capture(
+                stage_plan, pathlib.Path(j["src"]), j["out"], None, ledger, prep)
+            if isinstance(job, Exception):
+                ledger.release(str(pathlib.Path(j["src"]).with_name(j["out"])))
+            finishing.append(job if isinstance(job, Exception)
+                             else pool.submit(_capture, stage_finish, job, takes, ledger))
+
+        results = []
+        for j, fin in zip(jobs, finishing):
+            r = fin.result() if hasattr(fin, "result") else fin
+            if isinstance(r, Exception):
+                results.append({"src": j["src"], "out": j["out"], "ok": False,
+                                "error": str(r)[:200]})
+                continue
+            img, plan = r
+            results.append({"src": j["src"], "out": j["out"], "ok": img is not None,
+                            "room": plan.get("room"), "feature": plan.get("feature"),
+                            "action": plan.get("action") or plan.get("reaction"),
+                            "tier": plan.get("tier", "action")})
+    print("poses held: {}".format(", ".join(ledger.held()) or "none"))
+    return results
+
+
+def _exit_now(code):
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(code)
 
 
 def main():
@@ -1355,28 +2145,30 @@ def main():
 
     --batch reads [{"src": "...", "out": "..."}] and prints ONE json line per
     job to stdout, so build-pending-post.ts can spawn this once for a whole
-    listing rather than paying model-load cost per photo. Progress goes to
-    stderr; stdout stays parseable."""
-    if sys.argv[1] == "--batch":
-        jobs = json.load(open(sys.argv[2]))
-        used = set()
-        real_stdout, sys.stdout = sys.stdout, sys.stderr   # keep stdout clean
-        results = []
-        for j in jobs:
-            try:
-                img, plan = stage_one(pathlib.Path(j["src"]), j["out"], used_poses=used)
-                results.append({"src": j["src"], "out": j["out"], "ok": img is not None,
-                                "room": plan.get("room"), "feature": plan.get("feature"),
-                                "action": plan.get("action") or plan.get("reaction"),
-                                "tier": plan.get("tier", "action")})
-            except Exception as e:
-                results.append({"src": j["src"], "out": j["out"], "ok": False,
-                                "error": str(e)[:200]})
-        sys.stdout = real_stdout
-        print(json.dumps(results))
-        return
-    src = pathlib.Path(sys.argv[1])
-    stage_one(src, sys.argv[2] if len(sys.argv) > 2 else "staged.png")
+    listing rather than paying model-load cost per photo. run_batch pipelines
+    the photos (see STAGE_PIPELINE); results still come back in job order.
+    Progress goes to stderr; stdout stays parseable.
+
+    Exits with os._exit rather than returning, so renders abandoned by
+    _first_passing do not hold the process open (see TAKES RUN
+    CONCURRENTLY)."""
+    try:
+        if sys.argv[1] == "--batch":
+            jobs = json.load(open(sys.argv[2]))
+            real_stdout, sys.stdout = sys.stdout, sys.stderr   # keep stdout clean
+            results = run_batch(jobs)
+            print("vision calls: {calls} sent, {hits} from cache, {shared} shared in flight".format(
+                **CACHE_STATS))
+            sys.stdout = real_stdout
+            print(json.dumps(results))
+        else:
+            src = pathlib.Path(sys.argv[1])
+            stage_one(src, sys.argv[2] if len(sys.argv) > 2 else "staged.png")
+    except Exception:
+        import traceback
+        traceback.print_exc()
+        _exit_now(1)
+    _exit_now(0)
 
 
 if __name__ == "__main__":
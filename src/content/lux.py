@@ -1,4 +1,5 @@
 import os
+import sys
 import json
 import time
 import requests
@@ -14,6 +15,10 @@ PROJECT_ROOT = Path(__file__).resolve().parents[2]
 ENV_PATH = PROJECT_ROOT / ".env.local"
 load_dotenv(dotenv_path=ENV_PATH)
 
+# Shared image cache lives in ./scripts
+sys.path.insert(0, str(PROJECT_ROOT / "scripts"))
+from image_cache import ImageCache
+
 ACCESS_TOKEN = os.getenv("SPARK_ACCESS_TOKEN") or os.getenv("SPARK_OAUTH_KEY")
 if not ACCESS_TOKEN:
     raise ValueError("❌ Missing SPARK_ACCESS_TOKEN in .env.local")
@@ -39,6 +44,12 @@ PHOTOS_DIR.mkdir(parents=True, exist_ok=True)
 INDEX_FILE = LOG_DIR / "index.json"
 INPUT_FILE = PROJECT_ROOT / "local-logs" / "flattened_all_listings_preserved.json"
 
+# Originals, shared with scripts/stage_geometric.py. A repeat run over the
+# same listings is served entirely from disk. Resized derivatives are rendered
+# on demand by whatever reads them (IMAGE_CACHE.derivative), not here.
+IMAGE_CACHE = ImageCache()
+PHOTO_LIST_MAX_AGE = 24 * 3600  # re-ask Spark for a listing's photo list after a day
+
 # ──────────────────────────────────────────────────────────────
 # 🧩 HELPERS
 # ──────────────────────────────────────────────────────────────
@@ -97,7 +108,9 @@ def fetch_listing_photos(listing_key: str, retries: int = 3) -> List[Dict[str, A
     return []
 
 def download_listing_photos(listing_key: str, folder_name: str, limit: int = 15) -> List[str]:
-    photos = fetch_listing_photos(listing_key)
+    photos = IMAGE_CACHE.manifest(
+        f"photos-{listing_key}", lambda: fetch_listing_photos(listing_key), max_age=PHOTO_LIST_MAX_AGE
+    )
     if not photos:
         print(f"⚠️ No photos found for {listing_key}")
         return []
@@ -117,16 +130,13 @@ def download_listing_photos(listing_key: str, folder_name: str, limit: int = 15)
             saved.append(filename)
             continue
         try:
-            r = requests.get(url, timeout=10)
-            if r.ok:
-                with open(path, "wb") as f:
-                    f.write(r.content)
-                saved.append(filename)
-            else:
-                print(f"⚠️ Bad status {r.status_code} for {url}")
+            misses = IMAGE_CACHE.misses
+            IMAGE_CACHE.copy_to(url, path, photo_id=p.get("Id"))
+            saved.append(filename)
+            if IMAGE_CACHE.misses != misses:
+                time.sleep(0.3)  # only pace requests that actually hit the CDN
         except Exception as e:
             print(f"⚠️ Error downloading {url}: {e}")
-        time.sleep(0.3)
     return saved
 
 # ──────────────────────────────────────────────────────────────
@@ -195,6 +205,8 @@ def main():
 
     save_index(index)
     print(f"🪵 Index updated: {INDEX_FILE}")
+    cache = IMAGE_CACHE.stats()
+    print(f"🗄️ Image cache: {cache['hits']} hits, {cache['misses']} downloads ({cache['root']})")
 
 # ──────────────────────────────────────────────────────────────
 # 🏁 ENTRY POINT
@@ -1,13 +1,22 @@
+# Backfill only: the unified sync fetches _expand=Photos and writes the primary
+# photo for every listing it seeds (unified/photos.py). This script covers
+# listings the sync hasn't seen, one /photos request each.
+
 import os
-import json
-import time
-import requests
+import sys
 from pathlib import Path
 from dotenv import load_dotenv
 from pymongo import MongoClient
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, UTC
-from typing import Dict, Any, Set, Optional
+from typing import Dict, Any, Optional
+
+# Shared Spark client lives in ./unified
+sys.path.insert(0, str(Path(__file__).resolve().parent / "unified"))
+from spark_client import SparkClient, SparkError
+from concurrency import AdaptiveConcurrency
+from photos import primary_photo_doc
+from photo_state import PhotoState
 
 # ──────────────────────────────────────────────────────────────────────────────
 # 🔧 ENV & CONSTANTS
@@ -29,17 +38,16 @@ if not MONGO_URI:
 LOG_DIR = Path(__file__).resolve().parents[4] / "local-logs" / "photo-logs"
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 
-# A single, ever-growing index of listingIds we should skip next runs
-SKIP_INDEX_PATH = LOG_DIR / "skip_index.json"
-
-# Per-run JSONL for auditability
+# Skip entries + per-run audit events (SQLite, WAL). Replaces skip_index.json
+# (imported on first open) and the run_*.jsonl files.
+STATE_DB_PATH = LOG_DIR / "photo_state.db"
 RUN_ID = datetime.now(UTC).strftime("%Y%m%d-%H%M%S")
-RUN_LOG_PATH = LOG_DIR / f"run_{RUN_ID}.jsonl"
 
-HEADERS = {
-    "Authorization": f"Bearer {ACCESS_TOKEN}",
-    "Accept": "application/json",
-}
+# In-flight /photos requests tuned from latency and 429s (was 2 workers + 0.5s sleeps)
+CONCURRENCY = AdaptiveConcurrency("cache-photos", initial=2, maximum=12)
+
+# Pooled keep-alive connections shared by the worker threads
+SPARK = SparkClient(ACCESS_TOKEN, pool_size=CONCURRENCY.maximum, timeout=10, concurrency=CONCURRENCY)
 
 # ──────────────────────────────────────────────────────────────────────────────
 # 🗃️ DB
@@ -55,38 +63,14 @@ except Exception as e:
     raise Exception(f"❌ Failed to connect to MongoDB: {e}")
 
 # ──────────────────────────────────────────────────────────────────────────────
-# 🧾 Skip Index Helpers
+# 🧾 Photo State Helpers
 # ──────────────────────────────────────────────────────────────────────────────
 
-def load_skip_index() -> Set[str]:
-    if not SKIP_INDEX_PATH.exists():
-        return set()
-    try:
-        with SKIP_INDEX_PATH.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-            if isinstance(data, dict) and "listingIds" in data:
-                return set(str(x) for x in data["listingIds"])
-            if isinstance(data, list):
-                return set(str(x) for x in data)
-    except Exception as e:
-        print(f"⚠️ Could not read skip index ({SKIP_INDEX_PATH}): {e}")
-    return set()
-
-def persist_skip_index(skip_ids: Set[str]) -> None:
-    tmp_path = SKIP_INDEX_PATH.with_suffix(".json.tmp")
-    payload = {"listingIds": sorted(list(skip_ids))}
-    with tmp_path.open("w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
-    tmp_path.replace(SKIP_INDEX_PATH)
-
 def append_run_log(entry: Dict[str, Any]) -> None:
-    entry = {"ts": datetime.now(UTC).isoformat(), **entry}
-    with RUN_LOG_PATH.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    _state.log(**entry)
 
 def mark_skipped(listing_id: str, slug: Optional[str], reason: str, extra: Optional[Dict[str, Any]] = None) -> None:
-    global _skip_ids
-    _skip_ids.add(str(listing_id))
+    _state.skip(listing_id, slug, reason, detail=extra)
     append_run_log({
         "event": "skipped",
         "listingId": listing_id,
@@ -94,9 +78,9 @@ def mark_skipped(listing_id: str, slug: Optional[str], reason: str, extra: Optio
         "reason": reason,
         **(extra or {}),
     })
-    persist_skip_index(_skip_ids)
 
 def mark_success(listing_id: str, slug: Optional[str], photo_id: Optional[str]) -> None:
+    _state.clear(listing_id=listing_id)  # drop an expired no-photos/error entry
     append_run_log({
         "event": "cached",
         "listingId": listing_id,
@@ -105,6 +89,9 @@ def mark_success(listing_id: str, slug: Optional[str], photo_id: Optional[str])
     })
 
 def mark_error(listing_id: Optional[str], slug: Optional[str], msg: str) -> None:
+    # Errors are retried once their TTL passes (photo_state.RETRY_AFTER)
+    if listing_id:
+        _state.skip(listing_id, slug, "error", detail={"message": msg})
     append_run_log({
         "event": "error",
         "listingId": listing_id,
@@ -118,25 +105,18 @@ def mark_error(listing_id: Optional[str], slug: Optional[str], msg: str) -> None
 
 def fetch_listing_photos(slug: str, retries: int = 3):
     url = f"https://replication.sparkapi.com/v1/listings/{slug}/photos"
-    for attempt in range(retries):
-        try:
-            res = requests.get(url, headers=HEADERS, timeout=10)
-            if res.status_code == 200:
-                return res.json().get("D", {}).get("Results", [])
-            elif res.status_code == 403:
-                # Permanent permission denied → return marker
-                return {"_403": True, "body": res.text}
-            elif res.status_code == 429 or "over rate" in res.text.lower():
-                wait = 3 + attempt * 2
-                print(f"⏳ Rate limited on {slug}, waiting {wait}s...")
-                time.sleep(wait)
-            else:
-                raise Exception(f"HTTP {res.status_code}: {res.text}")
-        except requests.RequestException as e:
-            if attempt == retries - 1:
-                raise Exception(f"❌ Max retries reached for {slug}: {e}")
-            time.sleep(2 ** attempt)
-    raise Exception(f"❌ Max retries reached for {slug}")
+    try:
+        # SparkClient retries 429/"over rate", 5xx and network errors
+        res = SPARK.get(url, retries=retries)
+    except SparkError as e:
+        raise Exception(f"❌ Max retries reached for {slug}: {e}")
+
+    if res.status_code == 200:
+        return res.json().get("D", {}).get("Results", [])
+    elif res.status_code == 403:
+        # Permanent permission denied → return marker
+        return {"_403": True, "body": res.text}
+    raise Exception(f"HTTP {res.status_code}: {res.text}")
 
 # ──────────────────────────────────────────────────────────────────────────────
 # 📦 Worker
@@ -150,8 +130,8 @@ def cache_photo_for_listing(listing: Dict[str, Any]) -> str:
         mark_skipped(listing_id or "unknown", slug, reason="missing-required-fields")
         return f"⚠️ Skipped: missing slug or listingId for {listing.get('_id', 'unknown')}"
 
-    if listing_id in _skip_ids:
-        return f"⏭️ Pre-skipped {slug} (in skip_index)"
+    if _state.is_skipped(listing_id):
+        return f"⏭️ Pre-skipped {slug} (in photo state)"
 
     if photos_collection.find_one({"listingId": listing_id}):
         mark_skipped(listing_id, slug, reason="already-cached")
@@ -169,30 +149,13 @@ def cache_photo_for_listing(listing: Dict[str, Any]) -> str:
             mark_skipped(listing_id, slug, reason="no-photos")
             return f"⚠️ No photos for {slug}"
 
-        primary = photos[0]
-        doc = {
-            "listingId": listing_id,
-            "photoId": primary.get("Id"),
-            "caption": primary.get("Caption"),
-            "uriThumb": primary.get("UriThumb"),
-            "uri300": primary.get("Uri300"),
-            "uri640": primary.get("Uri640"),
-            "uri800": primary.get("Uri800"),
-            "uri1024": primary.get("Uri1024"),
-            "uri1280": primary.get("Uri1280"),
-            "uri1600": primary.get("Uri1600"),
-            "uri2048": primary.get("Uri2048"),
-            "uriLarge": primary.get("UriLarge"),
-            "primary": primary.get("Primary", True),
-        }
-
-        if not doc["photoId"]:
+        doc = primary_photo_doc(listing_id, photos)
+        if not doc:
             mark_skipped(listing_id, slug, reason="no-photo-id")
             return f"⚠️ No valid photoId for {slug}"
 
-        photos_collection.update_one({"photoId": doc["photoId"]}, {"$set": doc}, upsert=True)
+        photos_collection.update_one({"listingId": doc["listingId"]}, {"$set": doc}, upsert=True)
         mark_success(listing_id, slug, photo_id=doc["photoId"])
-        time.sleep(0.5)
         return f"✅ Cached photo for {slug}"
     except Exception as e:
         mark_error(listing_id, slug, msg=str(e))
@@ -202,14 +165,14 @@ def cache_photo_for_listing(listing: Dict[str, Any]) -> str:
 # 🚀 Main
 # ──────────────────────────────────────────────────────────────────────────────
 
-_skip_ids: Set[str] = set()
+_state: Optional[PhotoState] = None
 
 def main():
-    global _skip_ids
+    global _state
 
     print("🚀 Starting throttled photo caching...")
-    _skip_ids = load_skip_index()
-    print(f"🧾 Loaded skip index with {len(_skip_ids)} listingIds")
+    _state = PhotoState(STATE_DB_PATH, run_id=RUN_ID)
+    print(f"🧾 Opened photo state with {_state.size()} skip entries")
 
     try:
         listings_cursor = listings_collection.find({}, {"slug": 1, "listingId": 1})
@@ -222,12 +185,13 @@ def main():
         return
 
     pre_count = len(listings)
-    listings = [l for l in listings if l.get("listingId") and str(l["listingId"]) not in _skip_ids]
+    pending = _state.pending(l["listingId"] for l in listings if l.get("listingId"))
+    listings = [l for l in listings if l.get("listingId") and str(l["listingId"]) in pending]
     print(f"🧹 Pre-filtered {pre_count - len(listings)} listings; {len(listings)} remain")
 
     failed = 0
     processed = 0
-    with ThreadPoolExecutor(max_workers=2) as executor:
+    with ThreadPoolExecutor(max_workers=CONCURRENCY.maximum) as executor:
         futures = [executor.submit(cache_photo_for_listing, l) for l in listings]
         for future in as_completed(futures):
             try:
@@ -245,10 +209,12 @@ def main():
         "event": "run_complete",
         "processed": processed,
         "failed": failed,
-        "skip_index_size": len(_skip_ids),
+        "skip_entries": _state.size(),
+        "spark_metrics": SPARK.metrics(),
     })
 
-    print(f"🏁 Run complete: {processed} processed, {failed} failed, skip_index now {len(_skip_ids)} entries.")
+    print(f"🏁 Run complete: {processed} processed, {failed} failed, photo state now {_state.size()} skip entries.")
+    SPARK.print_metrics()
 
 if __name__ == "__main__":
     try:
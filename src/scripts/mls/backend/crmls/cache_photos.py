@@ -2,16 +2,20 @@
 # CRMLS Photo Caching Script
 #
 # Rate Limiting Strategy:
-# - 4 concurrent workers (balanced speed/safety)
-# - 0.3s sleep between requests
-# - 60s pause every 1000 items
-# - Exponential backoff on 429 errors (5s, 10s, 20s, 40s, 80s)
-# - Expected rate: ~3-4 items/sec, ~2.5 hours for 33k listings
+# - Adaptive concurrency (unified/concurrency.py): in-flight requests grow
+#   while Spark answers fast and 429-free, and halve on a 429; the limit is
+#   remembered between runs (local-logs/concurrency/crmls-cache-photos.json)
+# - No fixed sleeps or batch pauses
+# - Exponential backoff on 429 errors (5s, 10s, 20s, 40s between 5 attempts),
+#   Retry-After pauses every worker
+#
+# The unified sync now fetches _expand=Photos and writes the primary photo for
+# every listing it seeds (unified/photos.py), so this is only a backfill for
+# listings the sync hasn't covered.
 
 import os
-import json
+import sys
 import time
-import requests
 from pathlib import Path
 from dotenv import load_dotenv
 from pymongo import MongoClient
@@ -19,6 +23,13 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, UTC
 from typing import Dict, Any, Set, Optional
 
+# Shared Spark client lives in ../unified
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "unified"))
+from spark_client import SparkClient, SparkError
+from photos import primary_photo_doc
+from photo_state import PhotoState
+from concurrency import AdaptiveConcurrency
+
 # ──────────────────────────────────────────────────────────────────────────────
 # 🔧 ENV & CONSTANTS
 # ──────────────────────────────────────────────────────────────────────────────
@@ -39,17 +50,23 @@ if not MONGO_URI:
 LOG_DIR = Path(__file__).resolve().parents[5] / "local-logs" / "crmls" / "photo-logs"
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 
-# A single, ever-growing index of listingIds we should skip next runs
-SKIP_INDEX_PATH = LOG_DIR / "skip_index.json"
-
-# Per-run JSONL for auditability
+# Skip entries + per-run audit events (SQLite, WAL). Replaces skip_index.json
+# (imported on first open) and the run_*.jsonl files.
+STATE_DB_PATH = LOG_DIR / "photo_state.db"
 RUN_ID = datetime.now(UTC).strftime("%Y%m%d-%H%M%S")
-RUN_LOG_PATH = LOG_DIR / f"run_{RUN_ID}.jsonl"
 
-HEADERS = {
-    "Authorization": f"Bearer {ACCESS_TOKEN}",
-    "Accept": "application/json",
-}
+# In-flight /photos requests tuned from latency and 429s (starts at 4 the first run)
+CONCURRENCY = AdaptiveConcurrency("crmls-cache-photos", initial=4, maximum=16)
+
+# Pooled keep-alive connections for the workers; 5 attempts with 5s, 10s, 20s, 40s backoff on 429
+SPARK = SparkClient(
+    ACCESS_TOKEN,
+    pool_size=CONCURRENCY.maximum,
+    retries=5,
+    backoff_base=5.0,
+    max_backoff=80.0,
+    concurrency=CONCURRENCY
+)
 
 # ──────────────────────────────────────────────────────────────────────────────
 # 🗃️ DB
@@ -65,38 +82,15 @@ except Exception as e:
     raise Exception(f"❌ Failed to connect to MongoDB: {e}")
 
 # ──────────────────────────────────────────────────────────────────────────────
-# 🧾 Skip Index Helpers
+# 🧾 Photo State Helpers
 # ──────────────────────────────────────────────────────────────────────────────
 
-def load_skip_index() -> Set[str]:
-    if not SKIP_INDEX_PATH.exists():
-        return set()
-    try:
-        with SKIP_INDEX_PATH.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-            if isinstance(data, dict) and "listingIds" in data:
-                return set(str(x) for x in data["listingIds"])
-            if isinstance(data, list):
-                return set(str(x) for x in data)
-    except Exception as e:
-        print(f"⚠️ Could not read skip index ({SKIP_INDEX_PATH}): {e}")
-    return set()
-
-def persist_skip_index(skip_ids: Set[str]) -> None:
-    tmp_path = SKIP_INDEX_PATH.with_suffix(".json.tmp")
-    payload = {"listingIds": sorted(list(skip_ids))}
-    with tmp_path.open("w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
-    tmp_path.replace(SKIP_INDEX_PATH)
-
 def append_run_log(entry: Dict[str, Any]) -> None:
-    entry = {"ts": datetime.now(UTC).isoformat(), **entry}
-    with RUN_LOG_PATH.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    _state.log(**entry)
 
 def mark_skipped(listing_id: str, slug: Optional[str], reason: str, extra: Optional[Dict[str, Any]] = None) -> None:
-    global _skip_ids, _skip_persist_counter
-    _skip_ids.add(str(listing_id))
+    # One upsert per skip: nothing to batch, nothing lost on a crash
+    _state.skip(listing_id, slug, reason, detail=extra)
     append_run_log({
         "event": "skipped",
         "listingId": listing_id,
@@ -104,13 +98,9 @@ def mark_skipped(listing_id: str, slug: Optional[str], reason: str, extra: Optio
         "reason": reason,
         **(extra or {}),
     })
-    # Batch persist: only write to disk every 100 skips
-    _skip_persist_counter += 1
-    if _skip_persist_counter >= 100:
-        persist_skip_index(_skip_ids)
-        _skip_persist_counter = 0
 
 def mark_success(listing_id: str, slug: Optional[str], photo_id: Optional[str]) -> None:
+    _state.clear(listing_id=listing_id)  # drop an expired no-photos/error entry
     append_run_log({
         "event": "cached",
         "listingId": listing_id,
@@ -119,6 +109,9 @@ def mark_success(listing_id: str, slug: Optional[str], photo_id: Optional[str])
     })
 
 def mark_error(listing_id: Optional[str], slug: Optional[str], msg: str) -> None:
+    # Errors are retried once their TTL passes (photo_state.RETRY_AFTER)
+    if listing_id:
+        _state.skip(listing_id, slug, "error", detail={"message": msg})
     append_run_log({
         "event": "error",
         "listingId": listing_id,
@@ -132,31 +125,18 @@ def mark_error(listing_id: Optional[str], slug: Optional[str], msg: str) -> None
 
 def fetch_listing_photos(slug: str, retries: int = 5):
     url = f"https://replication.sparkapi.com/v1/listings/{slug}/photos"
-    for attempt in range(retries):
-        try:
-            res = requests.get(url, headers=HEADERS, timeout=15)
-            if res.status_code == 200:
-                return res.json().get("D", {}).get("Results", [])
-            elif res.status_code == 403:
-                # Permanent permission denied → return marker
-                return {"_403": True, "body": res.text}
-            elif res.status_code == 429 or "over rate" in res.text.lower():
-                # Exponential backoff for rate limits: 5s, 10s, 20s, 40s, 80s
-                wait = 5 * (2 ** attempt)
-                print(f"⏳ RATE LIMITED on {slug}, waiting {wait}s... (attempt {attempt+1}/{retries})")
-                time.sleep(wait)
-            else:
-                # Other errors: short retry
-                if attempt < retries - 1:
-                    print(f"⚠️ HTTP {res.status_code} on {slug}, retrying...")
-                    time.sleep(2 ** attempt)
-                else:
-                    raise Exception(f"HTTP {res.status_code}: {res.text[:200]}")
-        except requests.RequestException as e:
-            if attempt == retries - 1:
-                raise Exception(f"❌ Max retries reached for {slug}: {e}")
-            time.sleep(2 ** attempt)
-    raise Exception(f"❌ Max retries reached for {slug}")
+    try:
+        # SparkClient retries 429/"over rate", 5xx and network errors
+        res = SPARK.get(url, retries=retries)
+    except SparkError as e:
+        raise Exception(f"❌ Max retries reached for {slug}: {e}")
+
+    if res.status_code == 200:
+        return res.json().get("D", {}).get("Results", [])
+    elif res.status_code == 403:
+        # Permanent permission denied → return marker
+        return {"_403": True, "body": res.text}
+    raise Exception(f"HTTP {res.status_code}: {res.text[:200]}")
 
 # ──────────────────────────────────────────────────────────────────────────────
 # 📦 Worker
@@ -170,8 +150,8 @@ def cache_photo_for_listing(listing: Dict[str, Any]) -> str:
         mark_skipped(listing_id or "unknown", slug, reason="missing-required-fields")
         return f"⚠️ Skipped: missing slug or listingId for {listing.get('_id', 'unknown')}"
 
-    if listing_id in _skip_ids:
-        return f"⏭️ Pre-skipped {slug} (in skip_index)"
+    if _state.is_skipped(listing_id):
+        return f"⏭️ Pre-skipped {slug} (in photo state)"
 
     # Fast lookup: check against pre-fetched cached set
     if listing_id in _already_cached:
@@ -190,31 +170,13 @@ def cache_photo_for_listing(listing: Dict[str, Any]) -> str:
             mark_skipped(listing_id, slug, reason="no-photos")
             return f"⚠️ No photos for {slug}"
 
-        primary = photos[0]
-        doc = {
-            "listingId": listing_id,
-            "photoId": primary.get("Id"),
-            "caption": primary.get("Caption"),
-            "uriThumb": primary.get("UriThumb"),
-            "uri300": primary.get("Uri300"),
-            "uri640": primary.get("Uri640"),
-            "uri800": primary.get("Uri800"),
-            "uri1024": primary.get("Uri1024"),
-            "uri1280": primary.get("Uri1280"),
-            "uri1600": primary.get("Uri1600"),
-            "uri2048": primary.get("Uri2048"),
-            "uriLarge": primary.get("UriLarge"),
-            "primary": primary.get("Primary", True),
-        }
-
-        if not doc["photoId"]:
+        doc = primary_photo_doc(listing_id, photos)
+        if not doc:
             mark_skipped(listing_id, slug, reason="no-photo-id")
             return f"⚠️ No valid photoId for {slug}"
 
-        photos_collection.update_one({"photoId": doc["photoId"]}, {"$set": doc}, upsert=True)
+        photos_collection.update_one({"listingId": doc["listingId"]}, {"$set": doc}, upsert=True)
         mark_success(listing_id, slug, photo_id=doc["photoId"])
-        # Conservative 0.3s sleep to avoid rate limits (still faster than original 0.5s)
-        time.sleep(0.3)
         return f"✅ Cached photo for {slug}"
     except Exception as e:
         mark_error(listing_id, slug, msg=str(e))
@@ -224,17 +186,16 @@ def cache_photo_for_listing(listing: Dict[str, Any]) -> str:
 # 🚀 Main
 # ──────────────────────────────────────────────────────────────────────────────
 
-_skip_ids: Set[str] = set()
+_state: Optional[PhotoState] = None
 _already_cached: Set[str] = set()
-_skip_persist_counter: int = 0
 
 def main():
-    global _skip_ids, _already_cached
+    global _state, _already_cached
 
     print("🚀 Starting SAFE & FAST photo caching for CRMLS listings...")
-    print("⚙️  Settings: 4 workers, 0.3s sleep, 60s pause every 1000 items")
-    _skip_ids = load_skip_index()
-    print(f"🧾 Loaded skip index with {len(_skip_ids)} listingIds")
+    print(f"⚙️  Settings: adaptive concurrency, starting at {CONCURRENCY.snapshot()['limit']} (max {CONCURRENCY.maximum})")
+    _state = PhotoState(STATE_DB_PATH, run_id=RUN_ID)
+    print(f"🧾 Opened photo state with {_state.size()} skip entries")
 
     # Pre-fetch already cached listingIds for fast lookup
     print("🔍 Pre-fetching already cached photos...")
@@ -259,7 +220,8 @@ def main():
     print(f"📊 Total CRMLS listings: {total}")
 
     # Filter out already processed
-    listings = [l for l in listings if l.get("listingId") and str(l["listingId"]) not in _skip_ids and str(l.get("listingId")) not in _already_cached]
+    pending = _state.pending(l["listingId"] for l in listings if l.get("listingId"))
+    listings = [l for l in listings if l.get("listingId") and str(l["listingId"]) in pending and str(l.get("listingId")) not in _already_cached]
     print(f"🧹 After filtering: {len(listings)} listings to process")
 
     if len(listings) == 0:
@@ -269,11 +231,10 @@ def main():
     failed = 0
     processed = 0
     cached = 0
-    batch_size = 1000  # Conservative batch size
     start_time = time.time()
 
-    # Increased workers from 2 to 4 (balanced speed/rate-limit safety)
-    with ThreadPoolExecutor(max_workers=4) as executor:
+    # Pool sized to the ceiling; CONCURRENCY decides how many requests actually run
+    with ThreadPoolExecutor(max_workers=CONCURRENCY.maximum) as executor:
         futures = [executor.submit(cache_photo_for_listing, l) for l in listings]
 
         for i, future in enumerate(as_completed(futures), 1):
@@ -297,17 +258,8 @@ def main():
                 eta = (len(listings) - processed) / rate if rate > 0 else 0
                 print(f"📈 Progress: {processed}/{len(listings)} ({processed/len(listings)*100:.1f}%) | "
                       f"Cached: {cached} | Failed: {failed} | "
-                      f"Rate: {rate:.1f}/s | ETA: {eta/60:.1f}m")
-
-            # Batch pause every 1000 items to avoid rate limits
-            if processed % batch_size == 0 and processed < len(listings):
-                print(f"😴 Processed {processed} items — pausing 60s to avoid rate limits...")
-                persist_skip_index(_skip_ids)  # Save progress
-                time.sleep(60)  # Longer pause for safety
-                print("✅ Resuming...\n")
-
-    # Final persist
-    persist_skip_index(_skip_ids)
+                      f"Rate: {rate:.1f}/s | ETA: {eta/60:.1f}m | "
+                      f"Concurrency: {CONCURRENCY.snapshot()['limit']}")
 
     elapsed = time.time() - start_time
     append_run_log({
@@ -315,8 +267,9 @@ def main():
         "processed": processed,
         "cached": cached,
         "failed": failed,
-        "skip_index_size": len(_skip_ids),
+        "skip_entries": _state.size(),
         "duration_seconds": elapsed,
+        "spark_metrics": SPARK.metrics(),
     })
 
     print(f"\n🏁 CRMLS Run complete!")
@@ -324,6 +277,7 @@ def main():
     print(f"   Cached: {cached}")
     print(f"   Failed: {failed}")
     print(f"   Duration: {elapsed/60:.1f} minutes")
+    SPARK.print_metrics("   Spark API")
     print(f"   Rate: {processed/elapsed:.1f} items/sec")
 
 if __name__ == "__main__":
@@ -1,8 +1,7 @@
 
 import os
-import json
+import sys
 import time
-import requests
 import re
 import unicodedata
 import urllib.parse
@@ -14,6 +13,15 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta, UTC
 from typing import Dict, Any, Set, Optional, List
 
+# Shared Spark client lives in ./unified
+sys.path.insert(0, str(Path(__file__).resolve().parent / "unified"))
+from spark_client import SparkClient, SparkError
+from concurrency import AdaptiveConcurrency
+from snapshot import snapshot_path, find_snapshots, read_snapshot, write_snapshot
+from photos import PHOTO_EXPANSION, primary_photo_doc, pop_photo, photo_operation, drop_cached
+from bulk_seeder import BulkSeeder
+from photo_state import PhotoState
+
 # ──────────────────────────────────────────────────────────────────────────────
 # 🔧 ENV & CONSTANTS
 # ──────────────────────────────────────────────────────────────────────────────
@@ -31,22 +39,26 @@ if not MONGO_URI:
     raise ValueError("❌ Missing MONGODB_URI in .env.local")
 
 BASE_URL = "https://replication.sparkapi.com/v1/listings"
-EXPANSIONS = ["Rooms", "Units", "OpenHouses", "VirtualTours"]
+# Photos brings each listing's photo metadata inline, so caching needs no per-listing requests
+EXPANSIONS = ["Rooms", "Units", "OpenHouses", "VirtualTours", PHOTO_EXPANSION]
 LOG_DIR = Path(__file__).resolve().parents[4] / "local-logs"
 PHOTO_LOG_DIR = LOG_DIR / "photo-logs"
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 PHOTO_LOG_DIR.mkdir(parents=True, exist_ok=True)
 
-LISTINGS_FILE = LOG_DIR / "all_listings_with_expansions.json"
-FLATTENED_FILE = LOG_DIR / "flattened_all_listings_preserved.json"
-SKIP_INDEX_PATH = PHOTO_LOG_DIR / "skip_index.json"
+# Snapshot format for the listing files: json, ndjson (gzip'd) or parquet (needs pyarrow)
+SNAPSHOT_FORMAT = os.getenv("MLS_SNAPSHOT_FORMAT", "json")
+LISTINGS_FILE = snapshot_path(LOG_DIR / "all_listings_with_expansions", SNAPSHOT_FORMAT)
+FLATTENED_FILE = snapshot_path(LOG_DIR / "flattened_all_listings_preserved", SNAPSHOT_FORMAT)
 RUN_ID = datetime.now(UTC).strftime("%Y%m%d-%H%M%S")
-RUN_LOG_PATH = PHOTO_LOG_DIR / f"run_{RUN_ID}.jsonl"
+# Photo skip entries + run events (SQLite, WAL); replaces skip_index.json and run_*.jsonl
+PHOTO_STATE = PhotoState(PHOTO_LOG_DIR / "photo_state.db", run_id=RUN_ID)
 
-HEADERS = {
-    "Authorization": f"Bearer {ACCESS_TOKEN}",
-    "Accept": "application/json",
-}
+# Photo workers run as many requests as the AIMD controller allows (was a fixed 2 + sleeps)
+CONCURRENCY = AdaptiveConcurrency("master-sync-photos", initial=2, maximum=12)
+
+# One pooled client for listing pages and photo workers (429/backoff handled inside)
+SPARK = SparkClient(ACCESS_TOKEN, pool_size=CONCURRENCY.maximum, timeout=10, concurrency=CONCURRENCY)
 
 # ──────────────────────────────────────────────────────────────────────────────
 # 🗃️ DB
@@ -101,35 +113,24 @@ def camelize_keys(obj):
         return obj
 
 def append_run_log(entry: Dict[str, Any]) -> None:
-    entry = {"ts": datetime.now(UTC).isoformat(), **camelize_keys(entry)}
-    with RUN_LOG_PATH.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
-
-def load_skip_index() -> Set[str]:
-    if not SKIP_INDEX_PATH.exists():
-        return set()
-    try:
-        with SKIP_INDEX_PATH.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-            if isinstance(data, dict) and "listingIds" in data:
-                return set(str(x) for x in data["listingIds"])
-            if isinstance(data, list):
-                return set(str(x) for x in data)
-    except Exception as e:
-        print(f"⚠️ Could not read skip index ({SKIP_INDEX_PATH}): {e}")
-    return set()
-
-def persist_skip_index(skip_ids: Set[str]) -> None:
-    tmp_path = SKIP_INDEX_PATH.with_suffix(".json.tmp")
-    payload = {"listingIds": sorted(list(skip_ids))}
-    with tmp_path.open("w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
-    tmp_path.replace(SKIP_INDEX_PATH)
+    PHOTO_STATE.log(**camelize_keys(entry))
 
 # ──────────────────────────────────────────────────────────────────────────────
 # 📡 Sync Listings
 # ──────────────────────────────────────────────────────────────────────────────
 
+def fetch_page(url: str, page: int, retries: int = 3) -> List[Dict]:
+    """One page of Spark results; SparkClient handles 429s, backoff and network retries"""
+    try:
+        res = SPARK.get(url, retries=retries)
+    except SparkError as e:
+        append_run_log({"event": "fetch_error", "page": page, "status_code": e.status, "error": str(e)})
+        raise Exception(f"❌ Max retries reached: {e}")
+    if res.status_code != 200:
+        append_run_log({"event": "fetch_error", "page": page, "status_code": res.status_code, "response": res.text})
+        raise Exception(f"HTTP {res.status_code}: {res.text}")
+    return res.json().get("D", {}).get("Results", [])
+
 def fetch_updated_listings(start_time: datetime, end_time: datetime, batch_size: int = 500) -> List[Dict]:
     # Format timestamps without microseconds, ensuring UTC 'Z'
     start_str = start_time.replace(microsecond=0).isoformat() + "Z"
@@ -148,33 +149,13 @@ def fetch_updated_listings(start_time: datetime, end_time: datetime, batch_size:
 
         append_run_log({"event": "fetch_updated_listings", "page": page, "url": url})
         print(f"📄 Fetching updated listings, page {page}: {url}")
-        for attempt in range(retries):
-            try:
-                res = requests.get(url, headers=HEADERS, timeout=10)
-                if res.status_code == 200:
-                    batch = res.json().get("D", {}).get("Results", [])
-                    if not batch:
-                        append_run_log({"event": "fetch_updated_listings_complete", "page": page, "listings_fetched": len(listings)})
-                        break
-                    cleaned = [camelize_keys(item) for item in batch]
-                    listings.extend(cleaned)
-                    skiptoken = batch[-1].get("Id")
-                    break
-                elif res.status_code == 429:
-                    wait = 3 + attempt * 2
-                    append_run_log({"event": "rate_limited", "page": page, "wait_seconds": wait})
-                    time.sleep(wait)
-                else:
-                    append_run_log({"event": "fetch_error", "page": page, "status_code": res.status_code, "response": res.text})
-                    raise Exception(f"HTTP {res.status_code}: {res.text}")
-            except requests.RequestException as e:
-                append_run_log({"event": "fetch_error", "page": page, "error": str(e)})
-                if attempt == retries - 1:
-                    raise Exception(f"❌ Max retries reached: {e}")
-                time.sleep(2 ** attempt)
-
+        batch = fetch_page(url, page, retries)
         if not batch:
+            append_run_log({"event": "fetch_updated_listings_complete", "page": page, "listings_fetched": len(listings)})
             break
+        cleaned = [camelize_keys(item) for item in batch]
+        listings.extend(cleaned)
+        skiptoken = batch[-1].get("Id")
 
         page += 1
         time.sleep(0.3)
@@ -194,32 +175,12 @@ def fetch_accessible_listing_keys(batch_size: int = 1000) -> Set[str]:
 
         append_run_log({"event": "fetch_listing_keys", "page": page, "url": url})
         print(f"📄 Fetching listing keys, page {page}: {url}")
-        for attempt in range(retries):
-            try:
-                res = requests.get(url, headers=HEADERS, timeout=10)
-                if res.status_code == 200:
-                    batch = res.json().get("D", {}).get("Results", [])
-                    if not batch:
-                        append_run_log({"event": "fetch_listing_keys_complete", "page": page, "keys_fetched": len(listing_keys)})
-                        break
-                    listing_keys.update(item.get("ListingKey") for item in batch if item.get("ListingKey"))
-                    skiptoken = batch[-1].get("ListingKey")
-                    break
-                elif res.status_code == 429:
-                    wait = 3 + attempt * 2
-                    append_run_log({"event": "rate_limited", "page": page, "wait_seconds": wait})
-                    time.sleep(wait)
-                else:
-                    append_run_log({"event": "fetch_error", "page": page, "status_code": res.status_code, "response": res.text})
-                    raise Exception(f"HTTP {res.status_code}: {res.text}")
-            except requests.RequestException as e:
-                append_run_log({"event": "fetch_error", "page": page, "error": str(e)})
-                if attempt == retries - 1:
-                    raise Exception(f"❌ Max retries reached: {e}")
-                time.sleep(2 ** attempt)
-
+        batch = fetch_page(url, page, retries)
         if not batch:
+            append_run_log({"event": "fetch_listing_keys_complete", "page": page, "keys_fetched": len(listing_keys)})
             break
+        listing_keys.update(item.get("ListingKey") for item in batch if item.get("ListingKey"))
+        skiptoken = batch[-1].get("ListingKey")
 
         page += 1
         time.sleep(0.3)
@@ -236,13 +197,14 @@ def merge_listings(existing_listings: List[Dict], updated_listings: List[Dict])
 
 def sync_listings(update_interval_hours: int = 12, purge: bool = False) -> List[Dict]:
     existing_listings = []
-    if LISTINGS_FILE.exists():
+    # Newest snapshot in any format, so switching MLS_SNAPSHOT_FORMAT keeps the merge base
+    existing_files = find_snapshots(LOG_DIR, "all_listings_with_expansions")
+    if existing_files:
         try:
-            with LISTINGS_FILE.open("r", encoding="utf-8") as f:
-                existing_listings = json.load(f)
+            existing_listings = read_snapshot(existing_files[0])
         except Exception as e:
-            append_run_log({"event": "read_error", "file": str(LISTINGS_FILE), "error": str(e)})
-            print(f"⚠️ Failed to read {LISTINGS_FILE}: {e}")
+            append_run_log({"event": "read_error", "file": str(existing_files[0]), "error": str(e)})
+            print(f"⚠️ Failed to read {existing_files[0]}: {e}")
 
     try:
         end_time = datetime.now(UTC)
@@ -270,8 +232,7 @@ def sync_listings(update_interval_hours: int = 12, purge: bool = False) -> List[
             print(f"⚠️ Failed to purge stale listings: {e}")
 
     try:
-        with LISTINGS_FILE.open("w", encoding="utf-8") as f:
-            json.dump(merged_listings, f, indent=2)
+        write_snapshot(merged_listings, LISTINGS_FILE)
         append_run_log({"event": "save_listings", "file": str(LISTINGS_FILE), "total_listings": len(merged_listings)})
     except Exception as e:
         append_run_log({"event": "write_error", "file": str(LISTINGS_FILE), "error": str(e)})
@@ -324,8 +285,7 @@ def flatten_listings(listings: List[Dict]) -> List[Dict]:
 
     append_run_log({"event": "flatten_complete", "flattened_count": len(flattened), "skipped_count": skipped})
     try:
-        with FLATTENED_FILE.open("w", encoding="utf-8") as f:
-            json.dump(flattened, f, indent=2)
+        write_snapshot(flattened, FLATTENED_FILE)
         append_run_log({"event": "save_flattened", "file": str(FLATTENED_FILE), "total_listings": len(flattened)})
     except Exception as e:
         append_run_log({"event": "write_error", "file": str(FLATTENED_FILE), "error": str(e)})
@@ -415,28 +375,20 @@ def seed_listings(flattened_listings: List[Dict]) -> None:
 
 def fetch_listing_photos(slug: str, retries: int = 3):
     url = f"{BASE_URL}/{slug}/photos"
-    for attempt in range(retries):
-        try:
-            res = requests.get(url, headers=HEADERS, timeout=10)
-            if res.status_code == 200:
-                return res.json().get("D", {}).get("Results", [])
-            elif res.status_code == 403:
-                return {"_403": True, "body": res.text}
-            elif res.status_code == 429 or "over rate" in res.text.lower():
-                wait = 3 + attempt * 2
-                append_run_log({"event": "rate_limited", "slug": slug, "wait_seconds": wait})
-                time.sleep(wait)
-            else:
-                append_run_log({"event": "fetch_photo_error", "slug": slug, "status_code": res.status_code, "response": res.text})
-                raise Exception(f"HTTP {res.status_code}: {res.text}")
-        except requests.RequestException as e:
-            append_run_log({"event": "fetch_photo_error", "slug": slug, "error": str(e)})
-            if attempt == retries - 1:
-                raise Exception(f"❌ Max retries reached for {slug}: {e}")
-            time.sleep(2 ** attempt)
-    raise Exception(f"❌ Max retries reached for {slug}")
-
-def cache_photo_for_listing(listing: Dict[str, Any], skip_ids: Set[str]) -> str:
+    try:
+        res = SPARK.get(url, retries=retries)
+    except SparkError as e:
+        append_run_log({"event": "fetch_photo_error", "slug": slug, "status_code": e.status, "error": str(e)})
+        raise Exception(f"❌ Max retries reached for {slug}: {e}")
+
+    if res.status_code == 200:
+        return res.json().get("D", {}).get("Results", [])
+    elif res.status_code == 403:
+        return {"_403": True, "body": res.text}
+    append_run_log({"event": "fetch_photo_error", "slug": slug, "status_code": res.status_code, "response": res.text})
+    raise Exception(f"HTTP {res.status_code}: {res.text}")
+
+def cache_photo_for_listing(listing: Dict[str, Any]) -> str:
     slug = listing.get("slug")
     listing_id = str(listing.get("listingId")) if listing.get("listingId") else None
 
@@ -444,8 +396,8 @@ def cache_photo_for_listing(listing: Dict[str, Any], skip_ids: Set[str]) -> str:
         append_run_log({"event": "photo_skipped", "reason": "missing_required_fields", "listingId": listing_id or "unknown"})
         return f"⚠️ Skipped: missing slug or listingId for {listing.get('_id', 'unknown')}"
 
-    if listing_id in skip_ids:
-        return f"⏭️ Pre-skipped {slug} (in skip_index)"
+    if PHOTO_STATE.is_skipped(listing_id):
+        return f"⏭️ Pre-skipped {slug} (in photo state)"
 
     if photos_collection.find_one({"listingId": listing_id}):
         append_run_log({"event": "photo_skipped", "reason": "already_cached", "listingId": listing_id, "slug": slug})
@@ -454,7 +406,7 @@ def cache_photo_for_listing(listing: Dict[str, Any], skip_ids: Set[str]) -> str:
     try:
         photos = fetch_listing_photos(slug)
         if isinstance(photos, dict) and photos.get("_403"):
-            skip_ids.add(listing_id)
+            PHOTO_STATE.skip(listing_id, slug, "permission-denied", detail={"response": photos["body"]})
             append_run_log({
                 "event": "photo_skipped",
                 "reason": "permission_denied",
@@ -462,48 +414,31 @@ def cache_photo_for_listing(listing: Dict[str, Any], skip_ids: Set[str]) -> str:
                 "slug": slug,
                 "response": photos["body"]
             })
-            persist_skip_index(skip_ids)
             return f"🚫 Permission denied for {slug} (skipped permanently)"
 
         if not photos:
-            skip_ids.add(listing_id)
+            PHOTO_STATE.skip(listing_id, slug, "no-photos")
             append_run_log({"event": "photo_skipped", "reason": "no_photos", "listingId": listing_id, "slug": slug})
-            persist_skip_index(skip_ids)
             return f"⚠️ No photos for {slug}"
 
-        primary = photos[0]
-        doc = {
-            "listingId": listing_id,
-            "photoId": primary.get("Id"),
-            "caption": primary.get("Caption"),
-            "uriThumb": primary.get("UriThumb"),
-            "uri300": primary.get("Uri300"),
-            "uri640": primary.get("Uri640"),
-            "uri800": primary.get("Uri800"),
-            "uri1024": primary.get("Uri1024"),
-            "uri1280": primary.get("Uri1280"),
-            "uri1600": primary.get("Uri1600"),
-            "uri2048": primary.get("Uri2048"),
-            "uriLarge": primary.get("UriLarge"),
-            "primary": primary.get("Primary", True),
-        }
-
-        if not doc["photoId"]:
-            skip_ids.add(listing_id)
+        doc = primary_photo_doc(listing_id, photos)
+        if not doc:
+            PHOTO_STATE.skip(listing_id, slug, "no-photo-id")
             append_run_log({"event": "photo_skipped", "reason": "no_photo_id", "listingId": listing_id, "slug": slug})
-            persist_skip_index(skip_ids)
             return f"⚠️ No valid photoId for {slug}"
 
-        photos_collection.update_one({"photoId": doc["photoId"]}, {"$set": doc}, upsert=True)
+        photos_collection.update_one({"listingId": doc["listingId"]}, {"$set": doc}, upsert=True)
+        PHOTO_STATE.clear(listing_id=listing_id)
         append_run_log({
             "event": "photo_cached",
             "listingId": listing_id,
             "slug": slug,
             "photoId": doc["photoId"]
         })
-        time.sleep(0.5)
         return f"✅ Cached photo for {slug}"
     except Exception as e:
+        # Retried once the error TTL passes (photo_state.RETRY_AFTER)
+        PHOTO_STATE.skip(listing_id, slug, "error", detail={"error": str(e)})
         append_run_log({
             "event": "photo_error",
             "listingId": listing_id,
@@ -512,17 +447,48 @@ def cache_photo_for_listing(listing: Dict[str, Any], skip_ids: Set[str]) -> str:
         })
         return f"❌ Failed for {slug}: {e}"
 
-def cache_photos(flattened_listings: List[Dict]) -> None:
-    skip_ids = load_skip_index()
-    append_run_log({"event": "photo_cache_start", "skip_index_size": len(skip_ids)})
-
-    listings = [l for l in flattened_listings if l.get("listingId") and str(l["listingId"]) not in skip_ids]
+def harvest_photos(flattened_listings: List[Dict]) -> Dict[str, Dict]:
+    """Pop the inline _expand=Photos arrays off the listings; one primary photo doc per listingId"""
+    harvested = {}
+    for listing in flattened_listings:
+        doc = pop_photo(listing)
+        if doc:
+            harvested[doc["listingId"]] = doc
+    append_run_log({"event": "photo_harvest", "harvested": len(harvested), "listings": len(flattened_listings)})
+    return harvested
+
+def cache_photos(flattened_listings: List[Dict], harvested: Dict[str, Dict]) -> None:
+    append_run_log({"event": "photo_cache_start", "skip_entries": PHOTO_STATE.size(), "harvested": len(harvested)})
+
+    # Photos that came with the listings: bulk upsert, only the ones that changed
+    if harvested:
+        seeder = BulkSeeder(
+            photos_collection,
+            photo_operation,
+            in_flight=2,
+            prepare=lambda docs: drop_cached(photos_collection, docs),
+            progress=False
+        )
+        seeder.extend(harvested.values())
+        stats = seeder.close()
+        append_run_log({"event": "photo_harvest_saved", **{k: v for k, v in stats.items() if k != "errors"}})
+        print(f"📸 Cached {stats['written']:,} harvested photos ({stats['unchanged']:,} unchanged, {stats['failed']:,} failed)")
+
+    # Per-listing /photos requests only for listings the expansion didn't cover
+    uncovered = [l for l in flattened_listings if l.get("listingId") and str(l["listingId"]) not in harvested]
+    # A harvested doc only saves a request if it's keyed like the listing it came from
+    matched = len(flattened_listings) - len(uncovered) - sum(1 for l in flattened_listings if not l.get("listingId"))
+    if matched != len(harvested):
+        append_run_log({"event": "photo_harvest_mismatch", "harvested": len(harvested), "matched": matched})
+        print(f"⚠️ {len(harvested) - matched:,} harvested photos match no listingId; their listings will still hit /photos")
+    pending = PHOTO_STATE.pending(l["listingId"] for l in uncovered)
+    listings = [l for l in uncovered if str(l["listingId"]) in pending]
     append_run_log({"event": "photo_cache_filtered", "remaining_listings": len(listings)})
 
     failed = 0
     processed = 0
-    with ThreadPoolExecutor(max_workers=2) as executor:
-        futures = [executor.submit(cache_photo_for_listing, l, skip_ids) for l in listings]
+    with ThreadPoolExecutor(max_workers=CONCURRENCY.maximum) as executor:
+        futures = [executor.submit(cache_photo_for_listing, l) for l in listings]
         for future in as_completed(futures):
             try:
                 result = future.result()
@@ -539,7 +505,7 @@ def cache_photos(flattened_listings: List[Dict]) -> None:
         "event": "photo_cache_complete",
         "processed_count": processed,
         "failed_count": failed,
-        "skip_index_size": len(skip_ids)
+        "skip_entries": PHOTO_STATE.size()
     })
 
 # ──────────────────────────────────────────────────────────────────────────────
@@ -553,17 +519,19 @@ def main():
         is_6am = datetime.now(UTC).hour == 6
         listings = sync_listings(update_interval_hours=12, purge=is_6am)
 
-        # Step 2: Flatten listings
+        # Step 2: Flatten listings (inline photos are split off before seeding)
         flattened_listings = flatten_listings(listings)
+        harvested_photos = harvest_photos(flattened_listings)
 
         # Step 3: Seed MongoDB
         seed_listings(flattened_listings)
 
         # Step 4: Cache photos
-        cache_photos(flattened_listings)
+        cache_photos(flattened_listings, harvested_photos)
 
-        append_run_log({"event": "complete", "run_id": RUN_ID})
+        append_run_log({"event": "complete", "run_id": RUN_ID, "spark_metrics": SPARK.metrics()})
         print("🏁 Master sync complete")
+        SPARK.print_metrics()
     except Exception as e:
         append_run_log({"event": "error", "error": str(e)})
         print(f"❌ Unhandled error in master_sync.py: {e}")
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Pipelined MongoDB Bulk Seeder
+
+Keeps several bulk_write batches in flight at once instead of sending one
+batch, waiting for Atlas, then building the next:
+
+- Up to in_flight batches run on a thread pool. add() blocks once they are all
+  busy, so a fast producer (file load or Spark stream) never queues more than
+  in_flight batches in memory
+- Batch size adapts to what the server is doing: it grows while batches come
+  back well under target_latency, shrinks when they are slower, and halves on
+  write errors (bounded by min_batch / max_batch)
+- Network / server errors (PyMongoError) are retried with backoff. Upserts
+  keyed by listingKey are idempotent, so a retried batch cannot duplicate.
+  Per-document BulkWriteErrors are counted as failed, not retried
+- Throughput is reported per batch and in the final stats (docs/sec)
+
+Usage:
+    from bulk_seeder import BulkSeeder
+
+    seeder = BulkSeeder(collection, upsert_operation, in_flight=4)
+    for doc in docs:
+        seeder.add(doc)
+    stats = seeder.close()      # waits for every batch; raises on fatal errors
+    print(stats["written"], stats["docs_per_sec"])
+"""
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from pymongo.errors import BulkWriteError, PyMongoError
+
+MAX_ERROR_MESSAGES = 20
+
+
+class BulkSeeder:
+    """Concurrent, adaptively sized bulk_write pipeline for one collection"""
+
+    def __init__(
+        self,
+        collection,
+        operation,
+        batch_size=500,
+        in_flight=4,
+        min_batch=100,
+        max_batch=2000,
+        target_latency=1.0,
+        retries=3,
+        prepare=None,
+        label="",
+        progress=True
+    ):
+        """
+        Args:
+            collection: pymongo collection to write to
+            operation: doc -> UpdateOne/ReplaceOne/... for bulk_write
+            batch_size: Starting batch size
+            in_flight: Batches written concurrently
+            min_batch / max_batch: Bounds for the adaptive batch size
+            target_latency: Seconds per bulk_write the batch size aims for
+            retries: Attempts per batch on PyMongoError
+            prepare: Optional batch -> (batch, unchanged_count), run on the
+                     worker before writing (e.g. seed.drop_unchanged)
+            label: Prefix for progress lines (e.g. the MLS name)
+            progress: Print one line per batch
+        """
+        self.collection = collection
+        self.operation = operation
+        self.batch_size = batch_size
+        self.min_batch = min(min_batch, batch_size)
+        self.max_batch = max(max_batch, batch_size)
+        self.target_latency = target_latency
+        self.retries = retries
+        self.prepare = prepare
+        self.prefix = f"[{label}]" if label else ""
+        self.progress = progress
+
+        self.executor = ThreadPoolExecutor(max_workers=in_flight, thread_name_prefix="bulk-seed")
+        self.slots = threading.BoundedSemaphore(in_flight)
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.fatal = None
+        self.started = time.perf_counter()
+        self.stats = {
+            "docs": 0,
+            "written": 0,
+            "upserted": 0,
+            "modified": 0,
+            "unchanged": 0,
+            "failed": 0,
+            "batches": 0,
+            "retries": 0,
+            "errors": [],
+        }
+
+    # ──────────────────────────────────────────────────────────────────────
+    # Producer side
+    # ──────────────────────────────────────────────────────────────────────
+
+    def add(self, doc):
+        """Queue one document; dispatches a batch once the buffer is full"""
+        self.buffer.append(doc)
+        if len(self.buffer) >= self.batch_size:
+            self._dispatch()
+
+    def extend(self, docs):
+        for doc in docs:
+            self.add(doc)
+
+    def close(self):
+        """Flush the remainder, wait for every batch and return the stats"""
+        try:
+            if self.buffer and not self.fatal:
+                self._dispatch()
+        finally:
+            self.executor.shutdown(wait=True)
+
+        if self.fatal:
+            raise Exception(self.fatal)
+
+        elapsed = time.perf_counter() - self.started
+        stats = dict(self.stats)
+        stats["seconds"] = round(elapsed, 1)
+        stats["docs_per_sec"] = round(stats["docs"] / elapsed) if elapsed > 0 else 0
+        stats["batch_size"] = self.batch_size
+        return stats
+
+    def _dispatch(self):
+        if self.fatal:
+            raise Exception(self.fatal)
+
+        batch, self.buffer = self.buffer, []
+        self.slots.acquire()  # Blocks while in_flight batches are still being written
+        with self.lock:
+            self.stats["batches"] += 1
+            batch_num = self.stats["batches"]
+        try:
+            self.executor.submit(self._run, batch_num, batch)
+        except Exception:
+            self.slots.release()
+            raise
+
+    # ──────────────────────────────────────────────────────────────────────
+    # Worker side
+    # ──────────────────────────────────────────────────────────────────────
+
+    def _run(self, batch_num, batch):
+        try:
+            self._write(batch_num, batch)
+        except Exception as e:
+            with self.lock:
+                if not self.fatal:
+                    self.fatal = f"[ERROR] Batch {batch_num} failed: {e}"
+        finally:
+            self.slots.release()
+
+    def _write(self, batch_num, batch):
+        size = len(batch)
+        unchanged = 0
+        prepared = self.prepare is None
+
+        for attempt in range(self.retries):
+            started = time.perf_counter()
+            try:
+                if not prepared:
+                    batch, unchanged = self.prepare(batch)
+                    prepared = True
+                if not batch:
+                    self._record(batch_num, size, unchanged=unchanged)
+                    return
+                result = self.collection.bulk_write([self.operation(doc) for doc in batch], ordered=False)
+            except BulkWriteError as e:
+                details = e.details or {}
+                write_errors = details.get("writeErrors", [])
+                self._record(
+                    batch_num,
+                    size,
+                    upserted=details.get("nUpserted", 0),
+                    modified=details.get("nModified", 0),
+                    unchanged=unchanged,
+                    failed=len(write_errors) or len(batch),
+                    error=f"Batch {batch_num}: {write_errors[:3] or e}"
+                )
+                self._adapt(error=True)
+                return
+            except PyMongoError as e:
+                self._adapt(error=True)
+                if attempt == self.retries - 1:
+                    raise
+                with self.lock:
+                    self.stats["retries"] += 1
+                wait = min(30, 2 ** attempt)
+                print(f"{self.prefix}[WARN] Batch {batch_num} hit {type(e).__name__}, retrying in {wait}s "
+                      f"(attempt {attempt + 1}/{self.retries})")
+                time.sleep(wait)
+                continue
+
+            seconds = time.perf_counter() - started
+            self._record(
+                batch_num,
+                size,
+                upserted=result.upserted_count or 0,
+                modified=result.modified_count or 0,
+                unchanged=unchanged,
+                seconds=seconds
+            )
+            self._adapt(seconds)
+            return
+
+    def _record(self, batch_num, size, upserted=0, modified=0, unchanged=0, failed=0, seconds=0.0, error=None):
+        with self.lock:
+            stats = self.stats
+            stats["docs"] += size
+            stats["upserted"] += upserted
+            stats["modified"] += modified
+            stats["written"] += upserted + modified
+            stats["unchanged"] += unchanged
+            stats["failed"] += failed
+            if error and len(stats["errors"]) < MAX_ERROR_MESSAGES:
+                stats["errors"].append(error)
+            elapsed = time.perf_counter() - self.started
+            rate = stats["docs"] / elapsed if elapsed > 0 else 0
+
+        if failed:
+            print(f"{self.prefix}[Batch {batch_num}] Failed with {failed} errors")
+        elif self.progress:
+            print(f"{self.prefix}[Batch {batch_num}] Modified: {modified}, Upserted: {upserted}, "
+                  f"Unchanged: {unchanged} ({size} docs, {seconds:.2f}s, {rate:,.0f} docs/sec)")
+
+    def _adapt(self, seconds=None, error=False):
+        """Grow the batch size while writes are fast, shrink it when slow or failing"""
+        with self.lock:
+            size = self.batch_size
+            if error:
+                size //= 2
+            elif seconds > self.target_latency:
+                size = int(size * 0.75)
+            elif seconds < self.target_latency / 2:
+                size = int(size * 1.25)
+            self.batch_size = max(self.min_batch, min(self.max_batch, size))
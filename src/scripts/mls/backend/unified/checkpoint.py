@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Durable Checkpoints for SkipToken Pagination
+
+A PageCheckpoint records, after every page, the SkipToken for the next request,
+the page number and an NDJSON spool of everything fetched so far. A run that
+crashes (or is killed) on page 900 can then resume from page 901 instead of
+starting over from skiptoken "".
+
+Files (under local-logs/checkpoints/):
+    <name>.json    - state: query, skiptoken, page, fetched, spool byte offset
+    <name>.ndjson  - one cleaned listing per line, fsynced per page
+
+Commit order makes this crash-safe: the spool is appended and fsynced first,
+then the state file is atomically replaced. Anything in the spool past the
+committed byte offset (a page whose state never landed) is truncated on load.
+
+Usage:
+    checkpoint = PageCheckpoint(LOCAL_LOGS_DIR / "checkpoints", "active_GPS")
+    if resume:
+        checkpoint.load()          # None if there is nothing to resume
+    ... fetch_listings(..., checkpoint=checkpoint)
+    save_to_file(...)
+    checkpoint.clear()             # only once the output is safely written
+"""
+
+import os
+import json
+from pathlib import Path
+from datetime import datetime
+
+
+class PageCheckpoint:
+    """Per-page SkipToken checkpoint with an on-disk spool of fetched listings"""
+
+    def __init__(self, directory, name):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.name = name
+        self.state_path = self.directory / f"{name}.json"
+        self.spool_path = self.directory / f"{name}.ndjson"
+        self.state = None
+
+    def load(self):
+        """Load a previous checkpoint for resuming. Returns the state or None."""
+        if not self.state_path.exists():
+            return None
+
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[WARN] Ignoring unreadable checkpoint {self.state_path}: {e}")
+            return None
+
+        committed = state.get("spool_bytes", 0)
+        size = self.spool_path.stat().st_size if self.spool_path.exists() else 0
+        if size < committed:
+            print(f"[WARN] Checkpoint spool {self.spool_path} is shorter than committed; starting over")
+            return None
+        if size > committed:
+            # Drop a page that was spooled but never committed to the state file
+            with open(self.spool_path, "r+b") as f:
+                f.truncate(committed)
+
+        self.state = state
+        return self.state
+
+    def begin(self, query):
+        """Start a fresh checkpoint, discarding any previous one"""
+        now = datetime.now().isoformat()
+        self.state = {
+            "name": self.name,
+            "query": query,
+            "skiptoken": "",
+            "page": 0,
+            "fetched": 0,
+            "spool_bytes": 0,
+            "complete": False,
+            "started": now,
+            "updated": now
+        }
+        open(self.spool_path, "wb").close()
+        self._write_state()
+
+    def commit(self, page, skiptoken, listings, complete=False):
+        """
+        Durably record a page
+
+        Args:
+            page: Page number just fetched
+            skiptoken: SkipToken to send for the NEXT page
+            listings: Cleaned listings from this page (appended to the spool)
+            complete: True once the last page has been fetched
+        """
+        with open(self.spool_path, "ab") as f:
+            for listing in listings:
+                f.write((json.dumps(listing, separators=(",", ":")) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+            offset = f.tell()
+
+        self.state.update(
+            page=page,
+            skiptoken=skiptoken,
+            fetched=self.state["fetched"] + len(listings),
+            spool_bytes=offset,
+            complete=complete,
+            updated=datetime.now().isoformat()
+        )
+        self._write_state()
+
+    def replay(self, batch_size=500):
+        """Yield the committed spool back as lists of up to batch_size listings"""
+        limit = self.state["spool_bytes"]
+        batch = []
+        with open(self.spool_path, "rb") as f:
+            while f.tell() < limit:
+                line = f.readline()
+                if not line:
+                    break
+                batch.append(json.loads(line))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def clear(self):
+        """Remove the checkpoint once its output has been saved"""
+        for path in (self.state_path, self.spool_path):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+        self.state = None
+
+    def _write_state(self):
+        """Atomically replace the state file"""
+        tmp_path = self.state_path.with_name(self.state_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_path)
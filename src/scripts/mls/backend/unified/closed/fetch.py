@@ -32,11 +32,12 @@ Usage:
 
     # Combine exclude and auto-confirm
     python src/scripts/mls/backend/unified/closed/fetch.py --exclude GPS CRMLS -y --delay 1.5
+
+    # Resume an interrupted pull from its last checkpointed page
+    python src/scripts/mls/backend/unified/closed/fetch.py --mls CRMLS --resume -y
 """
 
 import os
-import json
-import requests
 import time
 import argparse
 import sys
@@ -44,6 +45,12 @@ from pathlib import Path
 from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 
+# Shared helpers live in the parent unified/ directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from checkpoint import PageCheckpoint
+from spark_client import SparkClient, SparkError
+from snapshot import FORMATS, snapshot_path, write_snapshot
+
 # Load environment variables
 env_path = Path(__file__).resolve().parents[6] / ".env.local"
 load_dotenv(dotenv_path=env_path)
@@ -53,6 +60,9 @@ BASE_URL = "https://replication.sparkapi.com/v1/listings"
 ACCESS_TOKEN = os.getenv("SPARK_ACCESS_TOKEN")
 LOCAL_LOGS_DIR = Path(__file__).resolve().parents[6] / "local-logs" / "closed"
 LOCAL_LOGS_DIR.mkdir(parents=True, exist_ok=True)
+# Longer backoff than the active fetch: closed pulls are big and run for hours
+SPARK = SparkClient(ACCESS_TOKEN, pool_size=4, backoff_base=5.0, max_backoff=30.0)
+CHECKPOINT_DIR = LOCAL_LOGS_DIR / "checkpoints"
 
 # MLS ID Mapping (all 8 associations - same as unified-fetch.py)
 MLS_IDS = {
@@ -121,12 +131,12 @@ def print_progress_bar(current, total, bar_length=50, prefix="Progress", start_t
         print()
 
 
-def get_total_count(headers, filter_query):
+def get_total_count(filter_query):
     """Get total record count before fetching"""
     count_url = f"{BASE_URL}?_filter={filter_query}&_pagination=count"
 
     try:
-        response = requests.get(count_url, headers=headers, timeout=10)
+        response = SPARK.get(count_url, timeout=10)
         if response.status_code == 200:
             data = response.json()
             total_rows = data.get("D", {}).get("Pagination", {}).get("TotalRows", 0)
@@ -145,7 +155,8 @@ def fetch_closed_listings(
     years_back=5,
     batch_size=500,
     expansions=None,
-    rate_limit_delay=1.0
+    rate_limit_delay=1.0,
+    checkpoint=None
 ):
     """
     Fetch closed listings from Spark Replication API
@@ -157,6 +168,10 @@ def fetch_closed_listings(
         batch_size: Records per request (max 1000 for replication API)
         expansions: List of expansions (e.g., ["Media", "OpenHouses"])
         rate_limit_delay: Seconds to wait between requests (default: 1.0)
+        checkpoint: checkpoint.PageCheckpoint committed after every page. If it
+                    was load()ed from an interrupted run, the spool is read back
+                    and paging continues from the stored SkipToken and query
+                    (including the original CloseDate cutoff).
 
     Returns:
         List of closed listing dictionaries
@@ -165,11 +180,6 @@ def fetch_closed_listings(
     if not ACCESS_TOKEN:
         raise Exception("[ERROR] SPARK_ACCESS_TOKEN is missing in .env.local")
 
-    headers = {
-        "Authorization": f"Bearer {ACCESS_TOKEN}",
-        "Accept": "application/json"
-    }
-
     # Default to all MLSs if none specified
     if mls_ids is None:
         mls_ids = list(MLS_IDS.keys())
@@ -215,12 +225,20 @@ def fetch_closed_listings(
     if expansions and len(expansions) > 0:
         url_params.append(f"_expand={','.join(expansions)}")
 
+    resumed = checkpoint is not None and checkpoint.state is not None
+    if resumed:
+        # Reuse the interrupted run's query so its SkipToken stays valid
+        combined_filter = checkpoint.state["query"]["filter"]
+        url_params = checkpoint.state["query"]["params"]
+    elif checkpoint is not None:
+        checkpoint.begin({"filter": combined_filter, "params": url_params})
+
     # Get total count first
     print(f"\n>>> Fetching CLOSED listings from MLS(s): {', '.join(mls_ids)}")
     print(f">>> Lookback period: Past {years_back} years (since {cutoff_date.strftime('%Y-%m-%d')})")
     print(f">>> Filter: {combined_filter}\n")
 
-    total_count = get_total_count(headers, combined_filter)
+    total_count = get_total_count(combined_filter)
     if total_count is not None:
         print(f">>> Total closed sales to fetch: {total_count:,}\n")
 
@@ -228,79 +246,67 @@ def fetch_closed_listings(
     all_listings = []
     skiptoken = ""  # Start with empty string
     page = 1
-    retries = 3
+    complete = False
+
+    if resumed:
+        state = checkpoint.state
+        print(f">>> Resuming from checkpoint: page {state['page'] + 1}, {state['fetched']:,} listings spooled\n")
+        for spooled in checkpoint.replay(batch_size):
+            all_listings.extend(spooled)
+        skiptoken = state["skiptoken"]
+        page = state["page"] + 1
+        complete = state["complete"]
+
     fetch_start_time = time.time()
 
     # Show initial progress bar if we have total count
     if total_count:
-        print_progress_bar(0, total_count, prefix=f"Fetching {', '.join(mls_ids)} CLOSED", start_time=fetch_start_time)
+        print_progress_bar(len(all_listings), total_count, prefix=f"Fetching {', '.join(mls_ids)} CLOSED", start_time=fetch_start_time)
 
-    while True:
+    while not complete:
         # Build URL with skiptoken
         url = f"{BASE_URL}?{'&'.join(url_params)}&_skiptoken={skiptoken}"
 
-        # Initialize variables before retry loop
-        batch = []
-        new_skiptoken = None
-        success = False
+        # SparkClient handles 429/Retry-After, backoff and transient errors
+        try:
+            data = SPARK.get_json(url)
+        except SparkError as e:
+            raise Exception(f"[Page {page}] {e}")
 
-        for attempt in range(retries):
-            try:
-                response = requests.get(url, headers=headers, timeout=15)
-
-                if response.status_code == 200:
-                    data = response.json()
-                    response_data = data.get("D", {})
-                    batch = response_data.get("Results", [])
-
-                    # CRITICAL: Get SkipToken from API response
-                    new_skiptoken = response_data.get("SkipToken")
-
-                    if not batch:
-                        print(f"[Page {page}] No more results. Fetch complete.\n")
-                        success = True
-                        break
-
-                    # Clean and add to results
-                    cleaned_batch = [clean_data(listing) for listing in batch]
-                    all_listings.extend(cleaned_batch)
-
-                    # Update progress bar
-                    if total_count:
-                        print_progress_bar(len(all_listings), total_count, prefix=f"Fetching {', '.join(mls_ids)} CLOSED", start_time=fetch_start_time)
-                    else:
-                        print(f"[Page {page}] Fetched {len(batch)} closed listings (Total: {len(all_listings):,})")
-
-                    # Check for end condition
-                    if not new_skiptoken or new_skiptoken == skiptoken:
-                        print(f"[Page {page}] SkipToken unchanged. Fetch complete.\n")
-                        success = True
-                        break
-
-                    skiptoken = new_skiptoken
-                    success = True
-                    break
-
-                elif response.status_code == 429:
-                    # Exponential backoff for rate limiting
-                    wait_time = min(30, 5 + (attempt * 5))  # Cap at 30 seconds
-                    print(f"\n[Page {page}] Rate limited (429). Waiting {wait_time}s before retry...")
-                    time.sleep(wait_time)
+        response_data = data.get("D", {})
+        batch = response_data.get("Results", [])
 
-                else:
-                    error_msg = f"HTTP {response.status_code}: {response.text[:200]}"
-                    raise Exception(error_msg)
+        # CRITICAL: Get SkipToken from API response
+        new_skiptoken = response_data.get("SkipToken")
+
+        if not batch:
+            print(f"[Page {page}] No more results. Fetch complete.\n")
+            if checkpoint is not None:
+                checkpoint.commit(page, skiptoken, [], complete=True)
+            break
 
-            except requests.RequestException as e:
-                print(f"[Page {page}] Request error: {e}")
-                if attempt == retries - 1:
-                    raise Exception(f"Max retries reached: {e}")
-                time.sleep(2 ** attempt)
+        # Clean and add to results
+        cleaned_batch = [clean_data(listing) for listing in batch]
+        all_listings.extend(cleaned_batch)
 
-        # Break if request failed or no batch
-        if not success or not batch:
+        # Commit the page so an interrupted run can resume after it
+        done = not new_skiptoken or new_skiptoken == skiptoken
+        if checkpoint is not None:
+            checkpoint.commit(page, new_skiptoken, cleaned_batch, complete=done)
+
+        # Update progress bar
+        if total_count:
+            print_progress_bar(len(all_listings), total_count, prefix=f"Fetching {', '.join(mls_ids)} CLOSED", start_time=fetch_start_time)
+        else:
+            print(f"[Page {page}] Fetched {len(batch)} closed listings (Total: {len(all_listings):,})")
+
+        # Check for end condition
+        if done:
+            print(f"[Page {page}] SkipToken unchanged. Fetch complete.\n")
             break
 
+        skiptoken = new_skiptoken
+
         page += 1
         # Configurable rate limiting delay
         if rate_limit_delay > 0:
@@ -316,14 +322,13 @@ def fetch_closed_listings(
     return all_listings
 
 
-def save_to_file(listings, mls_names, years_back=5):
-    """Save listings to JSON file"""
-    filename = f"closed_{years_back}y_{'_'.join(mls_names)}_listings.json"
-    output_file = LOCAL_LOGS_DIR / filename
+def save_to_file(listings, mls_names, years_back=5, fmt="json"):
+    """Save listings to a snapshot file (json, ndjson or parquet; see snapshot.py)"""
+    filename = f"closed_{years_back}y_{'_'.join(mls_names)}_listings"
+    output_file = snapshot_path(LOCAL_LOGS_DIR / filename, fmt)
 
     try:
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(listings, f, indent=2)
+        write_snapshot(listings, output_file)
 
         print(f"\n>>> Saved {len(listings):,} closed listings to: {output_file}")
         return output_file
@@ -383,6 +388,17 @@ def main():
         default=2.0,
         help="Seconds to wait between API requests (default: 2.0)"
     )
+    parser.add_argument(
+        "--format",
+        choices=list(FORMATS),
+        default="json",
+        help="Snapshot file format: json (default), ndjson (gzip'd) or parquet (needs pyarrow)"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume each MLS from its last checkpointed page instead of starting over"
+    )
 
     args = parser.parse_args()
 
@@ -431,6 +447,11 @@ def main():
                     skipped_mls.append(mls_name)
                     continue
 
+            # Every page is checkpointed so a failed run can --resume
+            checkpoint = PageCheckpoint(CHECKPOINT_DIR, f"closed_{args.years}y_{mls_name}")
+            if args.resume and not checkpoint.load():
+                print(f"[WARN] No checkpoint for {mls_name}; starting from the first page")
+
             # Fetch from this MLS
             try:
                 listings = fetch_closed_listings(
@@ -438,15 +459,21 @@ def main():
                     years_back=args.years,
                     batch_size=args.batch_size,
                     expansions=None,  # Media expansion not supported for closed listings
-                    rate_limit_delay=args.delay
+                    rate_limit_delay=args.delay,
+                    checkpoint=checkpoint
                 )
 
                 if not listings:
                     print(f"\n[WARN] No closed listings fetched from {mls_name}")
+                    checkpoint.clear()
                     continue
 
                 # Save to individual MLS file
-                output_file = save_to_file(listings, [mls_name], args.years)
+                output_file = save_to_file(listings, [mls_name], args.years, args.format)
+                if checkpoint.state and checkpoint.state["complete"]:
+                    checkpoint.clear()
+                else:
+                    print(f"[WARN] {mls_name} stopped before the last page; checkpoint kept for --resume")
 
                 # Track progress
                 total_fetched += len(listings)
@@ -461,6 +488,8 @@ def main():
 
             except Exception as e:
                 print(f"\n[ERROR] Failed to fetch {mls_name}: {e}")
+                if checkpoint.state:
+                    print(f"[*] Checkpoint kept at page {checkpoint.state['page']}; rerun with --resume to continue")
                 skipped_mls.append(mls_name)
                 continue
 
@@ -476,6 +505,7 @@ def main():
             print(f"  - {', '.join(skipped_mls)}")
         print(f"Total closed sales fetched: {total_fetched:,}")
         print(f"Lookback period: Past {args.years} years")
+        SPARK.print_metrics()
         print("\n[*] Next step: Run seed script to upload to MongoDB (unified_closed_listings collection)")
         print("=" * 80 + "\n")
 
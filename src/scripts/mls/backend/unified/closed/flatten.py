@@ -19,17 +19,22 @@ Usage:
     # Process all closed listings files
     python src/scripts/mls/backend/unified/closed/flatten.py --all
 
-Input: local-logs/closed/closed_5y_{MLS}_listings.json (from fetch.py)
-Output: local-logs/closed/flattened_closed_{MLS}_listings.json
+Input: local-logs/closed/closed_5y_{MLS}_listings.{json,ndjson.gz,parquet} (from fetch.py)
+Output: local-logs/closed/flattened_closed_{MLS}_listings.* (same format as the
+        input unless --format is given)
 """
 
-import json
 import re
+import sys
 import unicodedata
 import argparse
 from pathlib import Path
 from datetime import datetime
 
+# Shared helpers live in the parent unified/ directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from snapshot import FORMATS, snapshot_format, snapshot_path, snapshot_stem, find_snapshots, read_snapshot, write_snapshot
+
 # MLS ID to Name Mapping (reverse lookup)
 MLS_ID_TO_NAME = {
     "20190211172710340762000000": "GPS",
@@ -249,8 +254,7 @@ def run(input_file: Path, output_file: Path):
         raise Exception(f"Input file {input_file} does not exist")
 
     print(f"\n>>> Loading closed listings from {input_file.name}")
-    with input_file.open(encoding="utf-8") as f:
-        listings = json.load(f)
+    listings = read_snapshot(input_file)
 
     print(f">>> Processing {len(listings):,} closed listings...")
 
@@ -264,8 +268,7 @@ def run(input_file: Path, output_file: Path):
         else:
             skipped += 1
 
-    with output_file.open("w", encoding="utf-8") as f:
-        json.dump(flattened, f, indent=2)
+    write_snapshot(flattened, output_file)
 
     print(f">>> Flattened {len(flattened):,} closed listings to {output_file.name}")
     if skipped:
@@ -279,17 +282,22 @@ def main():
     parser.add_argument(
         "--input",
         type=str,
-        help="Input JSON file path (default: auto-detect from local-logs/closed)"
+        help="Input snapshot file path (default: auto-detect from local-logs/closed)"
     )
     parser.add_argument(
         "--output",
         type=str,
-        help="Output JSON file path (default: flattened_closed_*.json)"
+        help="Output snapshot file path (default: flattened_closed_*, format from its extension)"
+    )
+    parser.add_argument(
+        "--format",
+        choices=list(FORMATS),
+        help="Output format when --output is not given (default: same as the input)"
     )
     parser.add_argument(
         "--all",
         action="store_true",
-        help="Process all closed_5y_*_listings.json files in local-logs/closed"
+        help="Process all closed_5y_*_listings snapshots in local-logs/closed"
     )
 
     args = parser.parse_args()
@@ -302,7 +310,7 @@ def main():
 
     # Process all files if --all flag is set
     if args.all:
-        candidates = sorted(local_logs.glob("closed_5y_*_listings.json"))
+        candidates = sorted(find_snapshots(local_logs, "closed_5y_*_listings"))
         if not candidates:
             raise Exception(f"No closed listings files found in {local_logs}")
 
@@ -314,10 +322,10 @@ def main():
         total_flattened = 0
         for input_path in candidates:
             # Extract MLS name from filename: closed_5y_GPS_listings.json -> GPS
-            stem = input_path.stem  # "closed_5y_GPS_listings"
+            stem = snapshot_stem(input_path)  # "closed_5y_GPS_listings"
             mls_name = stem.replace("closed_5y_", "").replace("_listings", "")
-            output_name = f"flattened_closed_{mls_name}_listings.json"
-            output_path = local_logs / output_name
+            output_format = args.format or snapshot_format(input_path)
+            output_path = snapshot_path(local_logs / f"flattened_closed_{mls_name}_listings", output_format)
 
             try:
                 print(f"{'#' * 80}")
@@ -343,8 +351,8 @@ def main():
     if args.input:
         input_path = Path(args.input)
     else:
-        # Look for most recent closed_5y_*_listings.json
-        candidates = sorted(local_logs.glob("closed_5y_*_listings.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+        # Look for most recent closed_5y_*_listings snapshot in any format
+        candidates = find_snapshots(local_logs, "closed_5y_*_listings")
         if not candidates:
             raise Exception(f"No closed listings files found in {local_logs}. Run fetch.py first.")
         input_path = candidates[0]
@@ -354,10 +362,10 @@ def main():
         output_path = Path(args.output)
     else:
         # Convert closed_5y_GPS_listings.json -> flattened_closed_GPS_listings.json
-        stem = input_path.stem  # "closed_5y_GPS_listings"
+        stem = snapshot_stem(input_path)  # "closed_5y_GPS_listings"
         mls_part = stem.replace("closed_5y_", "")  # "GPS_listings"
-        output_name = f"flattened_closed_{mls_part}.json"
-        output_path = local_logs / output_name
+        output_format = args.format or snapshot_format(input_path)
+        output_path = snapshot_path(local_logs / f"flattened_closed_{mls_part}", output_format)
 
     try:
         print("=" * 80)
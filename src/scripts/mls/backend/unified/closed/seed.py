@@ -6,7 +6,9 @@ Seeds the unified_closed_listings MongoDB collection with closed sales from all
 Based on seed.py but modified for closed listings collection.
 
 Features:
-- Bulk upsert operations (500 per batch)
+- Pipelined bulk upserts: several batches in flight, batch size adapts to
+  write latency (see ../bulk_seeder.py)
+- Reads .json, .ndjson.gz or .parquet snapshots (see ../snapshot.py)
 - Geospatial indexing (for CMA radius queries)
 - Compound indexes (for appreciation analysis, CMA filtering)
 - TTL index (auto-delete sales older than 5 years)
@@ -31,15 +33,20 @@ Usage:
 """
 
 import os
-import json
+import sys
 import time
 import argparse
 from pathlib import Path
 from datetime import datetime
 from pymongo import MongoClient, UpdateOne, GEOSPHERE, ASCENDING, DESCENDING
-from pymongo.errors import BulkWriteError, ConnectionFailure, ServerSelectionTimeoutError
+from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
 from dotenv import load_dotenv
 
+# Shared helpers live in the parent unified/ directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from snapshot import find_snapshots, snapshot_stem, read_snapshot
+from bulk_seeder import BulkSeeder
+
 # Load environment variables
 env_path = Path(__file__).resolve().parents[6] / ".env.local"
 load_dotenv(dotenv_path=env_path)
@@ -224,30 +231,34 @@ def find_latest_flattened_file():
         raise FileNotFoundError(f"Directory not found: {LOCAL_LOGS_DIR}")
 
     # Look for flattened files
-    flattened_files = list(LOCAL_LOGS_DIR.glob("flattened_closed_*_listings.json"))
+    flattened_files = find_snapshots(LOCAL_LOGS_DIR, "flattened_closed_*_listings")
 
     if not flattened_files:
         raise FileNotFoundError(f"No flattened closed listings files found in {LOCAL_LOGS_DIR}")
 
-    # Return most recently modified
-    latest_file = max(flattened_files, key=lambda p: p.stat().st_mtime)
-    return latest_file
+    # Most recently modified first
+    return flattened_files[0]
+
+
+def upsert_operation(listing):
+    # Use listingKey as unique identifier
+    return UpdateOne({"listingKey": listing["listingKey"]}, {"$set": listing}, upsert=True)
 
 
-def seed_listings(collection, input_file, batch_size=500):
+def seed_listings(collection, input_file, batch_size=500, in_flight=4):
     """
     Seed unified_closed_listings collection with bulk upsert
 
     Args:
         collection: MongoDB collection object
-        input_file: Path to flattened JSON file
-        batch_size: Number of documents per bulk operation
+        input_file: Path to flattened snapshot file
+        batch_size: Starting documents per bulk operation (adapts to latency)
+        in_flight: Bulk operations written concurrently
     """
     print(f"\n>>> Loading closed listings from: {input_file}")
 
     try:
-        with open(input_file, "r", encoding="utf-8") as f:
-            listings = json.load(f)
+        listings = read_snapshot(input_file)
     except Exception as e:
         raise Exception(f"[ERROR] Failed to read {input_file}: {e}")
 
@@ -283,54 +294,16 @@ def seed_listings(collection, input_file, batch_size=500):
     total_valid = len(valid_listings)
     print(f">>> Seeding {total_valid:,} valid closed listings to MongoDB...\n")
 
-    # Bulk upsert in batches
-    total_upserted = 0
-    total_modified = 0
-    errors = []
-    start_time = time.time()
-
-    for i in range(0, total_valid, batch_size):
-        batch = valid_listings[i:i + batch_size]
-        batch_num = (i // batch_size) + 1
-        total_batches = (total_valid + batch_size - 1) // batch_size
-
-        # Build bulk operations
-        operations = []
-        for listing in batch:
-            # Use listingKey as unique identifier
-            filter_query = {"listingKey": listing["listingKey"]}
-
-            # Upsert operation
-            operations.append(
-                UpdateOne(
-                    filter_query,
-                    {"$set": listing},
-                    upsert=True
-                )
-            )
-
-        try:
-            result = collection.bulk_write(operations, ordered=False)
-            total_upserted += result.upserted_count
-            total_modified += result.modified_count
-
-            elapsed = time.time() - start_time
-            rate = (i + len(batch)) / elapsed if elapsed > 0 else 0
-
-            print(f"[Batch {batch_num}/{total_batches}] "
-                  f"Upserted: {result.upserted_count}, "
-                  f"Modified: {result.modified_count} "
-                  f"({rate:.0f} docs/sec)")
-
-        except BulkWriteError as e:
-            errors.append(f"Batch {batch_num}: {e.details}")
-            print(f"[ERROR] Batch {batch_num} failed: {e.details}")
+    # Pipelined bulk upserts: in_flight batches written concurrently
+    seeder = BulkSeeder(collection, upsert_operation, batch_size=batch_size, in_flight=in_flight)
+    seeder.extend(valid_listings)
+    stats = seeder.close()
 
-        # Small delay to avoid overwhelming MongoDB
-        time.sleep(0.1)
+    total_upserted = stats["upserted"]
+    total_modified = stats["modified"]
+    errors = stats["errors"]
 
     # Summary
-    elapsed_time = time.time() - start_time
     print("\n" + "=" * 80)
     print("SEEDING SUMMARY - CLOSED LISTINGS")
     print("=" * 80)
@@ -338,8 +311,9 @@ def seed_listings(collection, input_file, batch_size=500):
     print(f"Upserted (new): {total_upserted:,}")
     print(f"Modified (existing): {total_modified:,}")
     print(f"Skipped (missing data): {skipped:,}")
-    print(f"Errors: {len(errors)}")
-    print(f"Time: {elapsed_time:.1f}s ({total_valid/elapsed_time:.0f} docs/sec)")
+    print(f"Failed writes: {stats['failed']:,}")
+    print(f"Time: {stats['seconds']}s ({stats['docs_per_sec']:,} docs/sec, "
+          f"{stats['batches']} batches, final batch size {stats['batch_size']})")
     print("=" * 80 + "\n")
 
     if errors:
@@ -357,7 +331,7 @@ def main():
     parser.add_argument(
         "--input",
         type=str,
-        help="Path to flattened JSON file. If not provided, uses most recent file in local-logs/closed/"
+        help="Path to flattened snapshot (.json, .ndjson.gz or .parquet). If not provided, uses most recent file in local-logs/closed/"
     )
     parser.add_argument(
         "--all",
@@ -379,7 +353,13 @@ def main():
         "--batch-size",
         type=int,
         default=500,
-        help="Documents per bulk operation (default: 500)"
+        help="Starting documents per bulk operation, adapted to write latency (default: 500)"
+    )
+    parser.add_argument(
+        "--in-flight",
+        type=int,
+        default=4,
+        help="Bulk operations written concurrently (default: 4)"
     )
 
     args = parser.parse_args()
@@ -403,7 +383,7 @@ def main():
         # Handle --all flag (batch mode)
         if args.all:
             # Find all flattened files
-            all_files = sorted(LOCAL_LOGS_DIR.glob("flattened_closed_*_listings.json"))
+            all_files = sorted(find_snapshots(LOCAL_LOGS_DIR, "flattened_closed_*_listings"))
 
             if not all_files:
                 raise FileNotFoundError(f"No flattened files found in {LOCAL_LOGS_DIR}")
@@ -414,7 +394,7 @@ def main():
                 filtered_files = []
                 for file in all_files:
                     # Extract MLS name from filename: flattened_closed_GPS_listings.json -> GPS
-                    stem = file.stem  # "flattened_closed_GPS_listings"
+                    stem = snapshot_stem(file)  # "flattened_closed_GPS_listings"
                     mls_name = stem.replace("flattened_closed_", "").replace("_listings", "")
                     if mls_name not in excluded:
                         filtered_files.append(file)
@@ -434,7 +414,7 @@ def main():
 
             for idx, input_file in enumerate(all_files, 1):
                 # Extract MLS name for display
-                stem = input_file.stem
+                stem = snapshot_stem(input_file)
                 mls_name = stem.replace("flattened_closed_", "").replace("_listings", "")
 
                 print(f"\n{'#' * 80}")
@@ -442,7 +422,7 @@ def main():
                 print(f"{'#' * 80}")
 
                 try:
-                    upserted, modified = seed_listings(collection, input_file, args.batch_size)
+                    upserted, modified = seed_listings(collection, input_file, args.batch_size, args.in_flight)
                     total_upserted += upserted
                     total_modified += modified
                 except Exception as e:
@@ -472,7 +452,7 @@ def main():
                 print(f"[AUTO] Using latest file: {input_file.name}")
 
             # Seed data
-            upserted, modified = seed_listings(collection, input_file, args.batch_size)
+            upserted, modified = seed_listings(collection, input_file, args.batch_size, args.in_flight)
 
             # Final count
             total_count = collection.count_documents({})
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Adaptive (AIMD) Concurrency for Spark Worker Pools
+
+The threaded scripts used to guess a safe rate: 5 workers + sleep(0.18) + a
+60s rest every 1000 listings in update-status.py, 4 workers + sleep(0.3) + a
+60s pause in crmls/cache_photos.py, 2 workers in master_sync.py. The guesses
+are either too slow (most of the time) or still too fast (the day Spark is
+busy). An AdaptiveConcurrency limits how many Spark requests are in flight
+and moves that limit the way TCP moves its window:
+
+- Additive increase: after `limit` consecutive fast, 429-free responses (one
+  "round" at the current concurrency) the limit grows by 1, but only while
+  the workers are actually using all of it
+- Multiplicative decrease: a 429 halves the limit, a latency spike (response
+  slower than spike_factor x the running baseline) or a 5xx/network error
+  cuts it to 80%. Decreases are at most once per cooldown, so a burst of 429s
+  from requests already in flight counts as one signal, not eight
+- A 429's Retry-After pauses every worker (like TokenBucket.backoff)
+
+The limit and latency baseline are saved to local-logs/concurrency/<name>.json
+and the next run starts from there instead of re-learning from scratch.
+
+Size the ThreadPoolExecutor to `maximum`; the controller, not the pool size,
+decides how many requests actually run.
+
+Usage:
+    from concurrency import AdaptiveConcurrency
+
+    concurrency = AdaptiveConcurrency("update-status", initial=5, maximum=16)
+    SPARK = SparkClient(ACCESS_TOKEN, pool_size=concurrency.maximum, concurrency=concurrency)
+    with ThreadPoolExecutor(max_workers=concurrency.maximum) as executor:
+        ...                                  # every SPARK.get() is gated
+"""
+
+import os
+import json
+import time
+import atexit
+import threading
+from pathlib import Path
+
+DEFAULT_STATE_DIR = Path(__file__).resolve().parents[5] / "local-logs" / "concurrency"
+
+# Persisted limits older than this are ignored (Spark's limits may have changed)
+STATE_MAX_AGE = 7 * 24 * 3600
+
+
+class AdaptiveConcurrency:
+    """Thread-safe AIMD limit on in-flight requests, persisted between runs"""
+
+    def __init__(
+        self,
+        name,
+        initial=4,
+        minimum=1,
+        maximum=16,
+        spike_factor=2.5,
+        cooldown=2.0,
+        state_dir=DEFAULT_STATE_DIR,
+        persist=True
+    ):
+        """
+        Args:
+            name: State file name (one per script / workload)
+            initial: Starting limit when there is no saved state
+            minimum / maximum: Bounds for the limit
+            spike_factor: Latency over spike_factor x baseline counts as a spike
+            cooldown: Seconds after a decrease during which further signals are ignored
+            state_dir: Where <name>.json is kept
+            persist: Load and save the state file
+        """
+        self.name = name
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.spike_factor = spike_factor
+        self.cooldown = cooldown
+        self.state_path = Path(state_dir) / f"{name}.json" if persist else None
+
+        self.limit = float(max(self.minimum, min(self.maximum, initial)))
+        self.baseline = None        # slow EWMA of response latency (seconds)
+        self.samples = 0
+        self.active = 0
+        self.good_streak = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.last_saved = 0.0
+        self.stats = {"peak": int(self.limit), "increases": 0, "throttles": 0, "spikes": 0, "errors": 0}
+        self.cond = threading.Condition()
+
+        if self.state_path:
+            self._load()
+            atexit.register(self.save)
+
+    # ──────────────────────────────────────────────────────────────────────
+    # Slots
+    # ──────────────────────────────────────────────────────────────────────
+
+    def acquire(self):
+        """Block until a request may start (under the limit and not paused)"""
+        with self.cond:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait > 0:
+                    self.cond.wait(wait)
+                elif self.active >= int(self.limit):
+                    self.cond.wait()
+                else:
+                    self.active += 1
+                    return
+
+    def release(self, seconds, throttled=False, error=False):
+        """Free the slot and feed the outcome of the request into the limit"""
+        with self.cond:
+            # Only a limit that is actually full has earned a raise; otherwise the
+            # tail of a run (few workers left) would ratchet it up to maximum
+            saturated = self.active >= int(self.limit)
+            self.active -= 1
+            if throttled:
+                self.stats["throttles"] += 1
+                self._decrease(0.5)
+            elif error:
+                self.stats["errors"] += 1
+                self._decrease(0.8)
+            else:
+                self._observe(seconds, saturated)
+            self.cond.notify_all()
+        self._maybe_save()
+
+    def backoff(self, seconds):
+        """Pause every worker for a 429's Retry-After"""
+        with self.cond:
+            resume = time.monotonic() + max(0.0, seconds)
+            if resume > self.paused_until:
+                self.paused_until = resume
+            self.cond.notify_all()
+
+    def _observe(self, seconds, saturated=True):
+        spike = (
+            self.baseline is not None
+            and self.samples >= 20
+            and seconds > self.spike_factor * self.baseline
+        )
+        # Spikes are kept out of the baseline so a slow spell can't normalise itself
+        if not spike:
+            self.baseline = seconds if self.baseline is None else 0.95 * self.baseline + 0.05 * seconds
+            self.samples += 1
+
+        if spike:
+            self.stats["spikes"] += 1
+            self._decrease(0.8)
+            return
+
+        if not saturated:
+            return
+        self.good_streak += 1
+        if self.good_streak >= int(self.limit) and self.limit < self.maximum:
+            self.limit = min(self.maximum, self.limit + 1)
+            self.good_streak = 0
+            self.stats["increases"] += 1
+            self.stats["peak"] = max(self.stats["peak"], int(self.limit))
+
+    def _decrease(self, factor):
+        self.good_streak = 0
+        now = time.monotonic()
+        if now - self.last_decrease < self.cooldown:
+            return
+        self.last_decrease = now
+        self.limit = max(float(self.minimum), self.limit * factor)
+
+    # ──────────────────────────────────────────────────────────────────────
+    # State
+    # ──────────────────────────────────────────────────────────────────────
+
+    def _load(self):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        if time.time() - state.get("updated", 0) > STATE_MAX_AGE:
+            return
+        self.limit = float(max(self.minimum, min(self.maximum, state.get("limit", self.limit))))
+        self.baseline = state.get("baseline")
+        self.stats["peak"] = int(self.limit)
+
+    def save(self):
+        """Write the current limit and baseline (atomic replace)"""
+        if not self.state_path:
+            return
+        with self.cond:
+            state = {"limit": round(self.limit, 2), "baseline": self.baseline, "updated": time.time()}
+        try:
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            # Per-thread tmp name: an atexit save can overlap a worker's
+            tmp_path = self.state_path.with_name(f"{self.state_path.name}.{threading.get_ident()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            print(f"[WARN] Could not save concurrency state {self.state_path}: {e}")
+
+    def _maybe_save(self):
+        if not self.state_path:
+            return
+        # Check-and-set under the lock so only one worker saves per interval
+        with self.cond:
+            now = time.monotonic()
+            if now - self.last_saved <= 30:
+                return
+            self.last_saved = now
+        self.save()
+
+    def snapshot(self):
+        with self.cond:
+            return {
+                "limit": int(self.limit),
+                "baseline_ms": round(self.baseline * 1000, 1) if self.baseline else None,
+                **self.stats,
+            }
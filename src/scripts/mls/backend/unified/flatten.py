@@ -13,17 +13,19 @@ Flattens listings from unified-fetch.py output to camelCase format with:
 Usage:
     python src/scripts/mls/backend/unified/flatten.py
 
-Input: local-logs/all_{MLS}_listings.json (from unified-fetch.py)
-Output: local-logs/flattened_unified_{MLS}_listings.json
+Input: local-logs/all_{MLS}_listings.{json,ndjson.gz,parquet} (from unified-fetch.py)
+Output: local-logs/flattened_unified_{MLS}_listings.* (same format as the input
+        unless --format is given)
 """
 
-import json
 import re
 import unicodedata
 import argparse
 from pathlib import Path
 from datetime import datetime
 
+from snapshot import FORMATS, snapshot_format, snapshot_path, snapshot_stem, find_snapshots, read_snapshot, write_snapshot
+
 # MLS ID to Name Mapping (reverse lookup)
 MLS_ID_TO_NAME = {
     "20190211172710340762000000": "GPS",
@@ -228,8 +230,7 @@ def run(input_file: Path, output_file: Path):
         raise Exception(f"Input file {input_file} does not exist")
 
     print(f"\n>>> Loading listings from {input_file}")
-    with input_file.open(encoding="utf-8") as f:
-        listings = json.load(f)
+    listings = read_snapshot(input_file)
 
     print(f">>> Processing {len(listings):,} listings...")
 
@@ -243,8 +244,7 @@ def run(input_file: Path, output_file: Path):
         else:
             skipped += 1
 
-    with output_file.open("w", encoding="utf-8") as f:
-        json.dump(flattened, f, indent=2)
+    write_snapshot(flattened, output_file)
 
     print(f"\n>>> Flattened {len(flattened):,} listings to {output_file}")
     if skipped:
@@ -258,12 +258,17 @@ def main():
     parser.add_argument(
         "--input",
         type=str,
-        help="Input JSON file path (default: auto-detect from local-logs)"
+        help="Input snapshot file path (default: auto-detect from local-logs)"
     )
     parser.add_argument(
         "--output",
         type=str,
-        help="Output JSON file path (default: flattened_unified_*.json)"
+        help="Output snapshot file path (default: flattened_unified_*, format from its extension)"
+    )
+    parser.add_argument(
+        "--format",
+        choices=list(FORMATS),
+        help="Output format when --output is not given (default: same as the input)"
     )
 
     args = parser.parse_args()
@@ -275,8 +280,8 @@ def main():
     if args.input:
         input_path = Path(args.input)
     else:
-        # Look for most recent all_*_listings.json
-        candidates = sorted(local_logs.glob("all_*_listings.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+        # Look for most recent all_*_listings snapshot in any format
+        candidates = find_snapshots(local_logs, "all_*_listings")
         if not candidates:
             raise Exception("No input files found in local-logs. Run unified-fetch.py first.")
         input_path = candidates[0]
@@ -285,11 +290,11 @@ def main():
     if args.output:
         output_path = Path(args.output)
     else:
-        # Convert all_GPS_listings.json -> flattened_unified_GPS_listings.json
-        input_stem = input_path.stem  # "all_GPS_listings"
+        # Convert all_GPS_listings.parquet -> flattened_unified_GPS_listings.parquet
+        input_stem = snapshot_stem(input_path)  # "all_GPS_listings"
         mls_part = input_stem.replace("all_", "")  # "GPS_listings"
-        output_name = f"flattened_unified_{mls_part}.json"
-        output_path = local_logs / output_name
+        output_format = args.format or snapshot_format(input_path)
+        output_path = snapshot_path(local_logs / f"flattened_unified_{mls_part}", output_format)
 
     try:
         print("=" * 80)
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Photo Caching State Store
+
+SQLite (WAL mode) replacement for the photo cachers' skip_index.json and
+per-run run_*.jsonl files. The JSON index was read in full at startup and
+rewritten in full (indent=2) on every skip, so both got slower as the skip set
+grew, and a crash mid-rewrite could lose it. Here:
+
+- skips:  one row per listingId (indexed by reason and updated_at). Written
+          with an upsert per listing, so nothing is ever rewritten in bulk
+- events: the audit trail that used to go to run_*.jsonl, one row per event,
+          indexed by run, listingId and timestamp
+
+Startup cost no longer depends on the size of the skip set: callers ask
+is_skipped() / pending() for the listings they are about to process and SQLite
+answers from the primary key. Every write is its own transaction in WAL mode,
+so a crash loses at most the write in progress and never corrupts the file.
+
+Transient reasons expire: a `no-photos` or `error` entry is retried once its
+TTL has passed (the listing may have gained photos, the API may be back).
+Everything else (permission-denied, no-photo-id, ...) is permanent.
+
+A legacy skip_index.json next to the database is imported once on first open
+(reason "legacy") and renamed to skip_index.json.migrated.
+
+Usage:
+    from photo_state import PhotoState
+
+    state = PhotoState(LOG_DIR / "photo_state.db", run_id=RUN_ID)
+    listings = [l for l in listings if l["listingId"] in state.pending(ids)]
+    state.skip(listing_id, slug, "no-photos")
+    state.log("photo_cached", listingId=listing_id, photoId=photo_id)
+
+CLI:
+    python photo_state.py                          # counts by reason
+    python photo_state.py --reason no-photos --limit 20
+    python photo_state.py --listing 20240101000000000000000000
+    python photo_state.py --events --run 20250101-060000
+    python photo_state.py --clear-reason error     # retry every error next run
+    python photo_state.py --db local-logs/crmls/photo-logs/photo_state.db
+"""
+
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from pathlib import Path
+from datetime import datetime, UTC
+
+DEFAULT_DB = Path(__file__).resolve().parents[5] / "local-logs" / "photo-logs" / "photo_state.db"
+
+# reason -> seconds before the listing is tried again (reasons not listed never expire)
+RETRY_AFTER = {
+    "no-photos": 3 * 24 * 3600,
+    "error": 6 * 3600,
+}
+
+# SQLite's default host-parameter limit is 999 on older builds
+LOOKUP_CHUNK = 900
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS skips (
+    listing_id TEXT PRIMARY KEY,
+    slug TEXT,
+    reason TEXT NOT NULL,
+    detail TEXT,
+    attempts INTEGER NOT NULL DEFAULT 1,
+    first_seen REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS skips_reason ON skips (reason, updated_at);
+CREATE INDEX IF NOT EXISTS skips_updated ON skips (updated_at);
+
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT,
+    ts REAL NOT NULL,
+    event TEXT NOT NULL,
+    listing_id TEXT,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS events_run ON events (run_id, ts);
+CREATE INDEX IF NOT EXISTS events_listing ON events (listing_id, ts);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+"""
+
+
+def normalize_reason(reason):
+    # master_sync logged snake_case reasons, cache_photos kebab-case; store one form
+    return str(reason).replace("_", "-")
+
+
+class PhotoState:
+    """Skip set + event log for one photo cacher, shared by its worker threads"""
+
+    def __init__(self, path=DEFAULT_DB, run_id=None, retry_after=None, legacy_index=None):
+        """
+        Args:
+            path: SQLite database file (created if missing)
+            run_id: Tag for events written by this process
+            retry_after: Override RETRY_AFTER ({reason: seconds})
+            legacy_index: skip_index.json to import once; defaults to the
+                          one next to the database
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.run_id = run_id
+        self.retry_after = dict(RETRY_AFTER if retry_after is None else retry_after)
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+        legacy = Path(legacy_index) if legacy_index else self.path.with_name("skip_index.json")
+        if legacy.exists():
+            self.import_legacy(legacy)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def _write(self, sql, params):
+        with self.lock:
+            self.conn.execute(sql, params)
+
+    # ──────────────────────────────────────────────────────────────────────
+    # Skips
+    # ──────────────────────────────────────────────────────────────────────
+
+    def _expired_clause(self, now):
+        """SQL that is true for rows whose reason has a TTL that has passed"""
+        if not self.retry_after:
+            return "0", []
+        parts = []
+        params = []
+        for reason, seconds in self.retry_after.items():
+            parts.append("(reason = ? AND updated_at < ?)")
+            params.extend([reason, now - seconds])
+        return "(" + " OR ".join(parts) + ")", params
+
+    def is_skipped(self, listing_id):
+        """True if listing_id has a skip entry that hasn't expired"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT reason, updated_at FROM skips WHERE listing_id = ?", (str(listing_id),)
+            ).fetchone()
+        if not row:
+            return False
+        ttl = self.retry_after.get(row[0])
+        return ttl is None or time.time() - row[1] < ttl
+
+    def pending(self, listing_ids):
+        """The subset of listing_ids that should be processed (no live skip entry)"""
+        ids = [str(i) for i in listing_ids]
+        now = time.time()
+        expired, expired_params = self._expired_clause(now)
+        skipped = set()
+        with self.lock:
+            for i in range(0, len(ids), LOOKUP_CHUNK):
+                chunk = ids[i:i + LOOKUP_CHUNK]
+                marks = ",".join("?" * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT listing_id FROM skips WHERE listing_id IN ({marks}) AND NOT {expired}",
+                    chunk + expired_params
+                )
+                skipped.update(r[0] for r in rows)
+        return set(ids) - skipped
+
+    def skip(self, listing_id, slug=None, reason="skipped", detail=None):
+        """Record (or refresh) a skip entry for listing_id"""
+        now = time.time()
+        detail = json.dumps(detail, ensure_ascii=False, default=str) if detail is not None else None
+        self._write(
+            """
+            INSERT INTO skips (listing_id, slug, reason, detail, attempts, first_seen, updated_at)
+            VALUES (?, ?, ?, ?, 1, ?, ?)
+            ON CONFLICT(listing_id) DO UPDATE SET
+                slug = COALESCE(excluded.slug, skips.slug),
+                reason = excluded.reason,
+                detail = excluded.detail,
+                attempts = skips.attempts + 1,
+                updated_at = excluded.updated_at
+            """,
+            (str(listing_id), slug, normalize_reason(reason), detail, now, now)
+        )
+
+    def clear(self, listing_id=None, reason=None):
+        """Remove one listing's entry, or every entry with a reason. Returns rows removed."""
+        if listing_id is None and reason is None:
+            raise Exception("[ERROR] clear() needs a listing_id or a reason")
+        where, params = ("listing_id = ?", [str(listing_id)]) if listing_id is not None \
+            else ("reason = ?", [normalize_reason(reason)])
+        with self.lock:
+            return self.conn.execute(f"DELETE FROM skips WHERE {where}", params).rowcount
+
+    def counts(self):
+        """{reason: entries}, plus how many of the transient ones are due for retry"""
+        now = time.time()
+        expired, params = self._expired_clause(now)
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT reason, COUNT(*), SUM({expired}) FROM skips GROUP BY reason ORDER BY COUNT(*) DESC",
+                params
+            ).fetchall()
+        return {reason: {"entries": n, "due": int(due or 0)} for reason, n, due in rows}
+
+    def size(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM skips").fetchone()[0]
+
+    def find(self, listing_id=None, reason=None, since=None, limit=50):
+        clauses, params = [], []
+        if listing_id:
+            clauses.append("listing_id = ?")
+            params.append(str(listing_id))
+        if reason:
+            clauses.append("reason = ?")
+            params.append(normalize_reason(reason))
+        if since:
+            clauses.append("updated_at >= ?")
+            params.append(since)
+        where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+        with self.lock:
+            cur = self.conn.execute(
+                f"SELECT listing_id, slug, reason, attempts, updated_at, detail FROM skips {where} "
+                f"ORDER BY updated_at DESC LIMIT ?",
+                params + [limit]
+            )
+            return [dict(zip([c[0] for c in cur.description], row)) for row in cur.fetchall()]
+
+    def import_legacy(self, path):
+        """One-time import of a skip_index.json ({"listingIds": [...]} or [...])"""
+        path = Path(path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[WARN] Could not import legacy skip index {path}: {e}")
+            return 0
+
+        ids = data.get("listingIds", []) if isinstance(data, dict) else data
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO skips (listing_id, reason, first_seen, updated_at) VALUES (?, 'legacy', ?, ?)",
+                [(str(i), now, now) for i in ids]
+            )
+            self.conn.execute("COMMIT")
+        path.replace(path.with_name(path.name + ".migrated"))
+        print(f"[OK] Imported {len(ids):,} listingIds from {path.name} into {self.path.name}")
+        return len(ids)
+
+    # ──────────────────────────────────────────────────────────────────────
+    # Events
+    # ──────────────────────────────────────────────────────────────────────
+
+    def log(self, event, listing_id=None, **data):
+        """Append an audit event (what used to be one run_*.jsonl line)"""
+        listing_id = listing_id or data.get("listingId")
+        self._write(
+            "INSERT INTO events (run_id, ts, event, listing_id, data) VALUES (?, ?, ?, ?, ?)",
+            (self.run_id, time.time(), event, str(listing_id) if listing_id else None,
+             json.dumps(data, ensure_ascii=False, default=str) if data else None)
+        )
+
+    def events(self, run_id=None, listing_id=None, event=None, since=None, limit=50):
+        clauses, params = [], []
+        for column, value in (("run_id", run_id), ("listing_id", listing_id), ("event", event)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(str(value))
+        if since:
+            clauses.append("ts >= ?")
+            params.append(since)
+        where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT run_id, ts, event, listing_id, data FROM events {where} ORDER BY ts DESC LIMIT ?",
+                params + [limit]
+            ).fetchall()
+        return [
+            {"runId": r[0], "ts": r[1], "event": r[2], "listingId": r[3], **(json.loads(r[4]) if r[4] else {})}
+            for r in rows
+        ]
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# CLI
+# ──────────────────────────────────────────────────────────────────────────────
+
+def _parse_since(value):
+    """'2d', '6h', '30m' ago, or an ISO date"""
+    if not value:
+        return None
+    units = {"d": 86400, "h": 3600, "m": 60}
+    if value[-1] in units and value[:-1].isdigit():
+        return time.time() - int(value[:-1]) * units[value[-1]]
+    return datetime.fromisoformat(value).timestamp()
+
+
+def _fmt_ts(ts):
+    return datetime.fromtimestamp(ts, UTC).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the photo caching state store")
+    parser.add_argument("--db", type=Path, default=DEFAULT_DB, help=f"Database file (default: {DEFAULT_DB})")
+    parser.add_argument("--listing", help="Show one listingId")
+    parser.add_argument("--reason", help="Filter skips by reason (e.g. no-photos)")
+    parser.add_argument("--since", help="Only entries newer than this (2d, 6h, 30m or an ISO date)")
+    parser.add_argument("--events", action="store_true", help="Show audit events instead of skips")
+    parser.add_argument("--run", help="Filter events by run id")
+    parser.add_argument("--event", help="Filter events by name (e.g. photo_cached)")
+    parser.add_argument("--limit", type=int, default=50, help="Max rows to show (default: 50)")
+    parser.add_argument("--clear-reason", help="Delete every skip with this reason so it is retried")
+    parser.add_argument("--clear-listing", help="Delete one listing's skip entry")
+    args = parser.parse_args()
+
+    if not args.db.exists():
+        print(f"[ERROR] No state database at {args.db}")
+        sys.exit(1)
+
+    state = PhotoState(args.db)
+    since = _parse_since(args.since)
+
+    if args.clear_reason or args.clear_listing:
+        removed = state.clear(listing_id=args.clear_listing, reason=args.clear_reason)
+        print(f"[OK] Removed {removed:,} skip entries")
+        return
+
+    if args.events:
+        for e in reversed(state.events(args.run, args.listing, args.event, since, args.limit)):
+            ts, event = e.pop("ts"), e.pop("event")
+            print(f"{_fmt_ts(ts)}  {event:<24} {json.dumps({k: v for k, v in e.items() if v is not None})}")
+        return
+
+    if args.listing or args.reason or since:
+        for row in state.find(args.listing, args.reason, since, args.limit):
+            print(f"{_fmt_ts(row['updated_at'])}  {row['listing_id']}  {row['reason']:<24} "
+                  f"attempts={row['attempts']}  {row['slug'] or ''}")
+        return
+
+    print(f"\n{'=' * 60}")
+    print(f"Photo state: {args.db}")
+    print(f"{'=' * 60}")
+    print(f"  {'reason':<28}{'entries':>10}{'due retry':>12}")
+    for reason, c in state.counts().items():
+        print(f"  {reason:<28}{c['entries']:>10,}{c['due']:>12,}")
+    print(f"  {'total':<28}{state.size():>10,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Primary Photo Harvesting
+
+Builds the `photos` collection docs (one primary photo per listing, the
+uriThumb / uri300 ... uri2048 / uriLarge shape the cache_photos scripts have
+always written) from photo metadata that arrives with the listing itself via
+`_expand=Photos`, instead of one /listings/{key}/photos request per listing.
+
+Spark puts the expansion under StandardFields.Photos, so after flatten.py it
+is a camelCase `photos` array on the flattened listing. seed.py pops that
+array before the listing is written (unified_listings keeps using `media`)
+and bulk-upserts the primary photo into `photos` from the same stream.
+
+primary_photo_doc() accepts both the raw Spark PascalCase photo objects (the
+/photos endpoint the legacy scripts still call) and flattened camelCase ones.
+
+Usage:
+    from photos import PHOTO_EXPANSION, pop_photo, photo_operation, drop_cached
+
+    photo = pop_photo(flattened_listing)      # None if it carried no photos
+    if photo:
+        photo_seeder.add(photo)               # BulkSeeder(db.photos, photo_operation, prepare=...)
+"""
+
+from pymongo import UpdateOne
+
+PHOTO_EXPANSION = "Photos"
+
+# photos collection field -> Spark photo field
+PHOTO_FIELDS = {
+    "photoId": "Id",
+    "caption": "Caption",
+    "uriThumb": "UriThumb",
+    "uri300": "Uri300",
+    "uri640": "Uri640",
+    "uri800": "Uri800",
+    "uri1024": "Uri1024",
+    "uri1280": "Uri1280",
+    "uri1600": "Uri1600",
+    "uri2048": "Uri2048",
+    "uriLarge": "UriLarge",
+}
+
+
+def _field(photo, spark_name):
+    # flatten.py camelCases Spark's keys: Id -> id, UriThumb -> uriThumb
+    value = photo.get(spark_name)
+    return value if value is not None else photo.get(spark_name[0].lower() + spark_name[1:])
+
+
+def primary_photo(photos):
+    """The photo flagged Primary, else the first one (None for an empty list)"""
+    if not photos:
+        return None
+    for photo in photos:
+        if isinstance(photo, dict) and _field(photo, "Primary"):
+            return photo
+    return photos[0] if isinstance(photos[0], dict) else None
+
+
+def primary_photo_doc(listing_id, photos):
+    """photos collection doc for a listing's primary photo, or None without a usable photo"""
+    photo = primary_photo(photos)
+    if not photo:
+        return None
+
+    doc = {"listingId": str(listing_id)}
+    for field, spark_name in PHOTO_FIELDS.items():
+        doc[field] = _field(photo, spark_name)
+    primary = _field(photo, "Primary")
+    doc["primary"] = True if primary is None else primary
+
+    if not doc["photoId"]:
+        return None
+    return doc
+
+
+def pop_photo(listing):
+    """
+    Remove the inline `photos` array from a flattened listing and return its
+    primary photo doc, or None
+
+    The doc is keyed by the listing's `listingId` (the MLS number from
+    StandardFields.ListingId), like every other writer of `photos`, not by
+    listingKey
+    """
+    photos = listing.pop("photos", None)
+    listing_id = listing.get("listingId")
+    if not photos or not listing_id or not isinstance(photos, list):
+        return None
+    return primary_photo_doc(listing_id, photos)
+
+
+def photo_operation(doc):
+    # One primary photo per listing: a new primary replaces the old doc
+    return UpdateOne({"listingId": doc["listingId"]}, {"$set": doc}, upsert=True)
+
+
+def drop_cached(collection, docs):
+    """
+    Keep only photo docs that differ from what is already stored
+
+    Returns:
+        (changed_docs, unchanged_count) like seed.drop_unchanged()
+    """
+    ids = [doc["listingId"] for doc in docs]
+    projection = {"_id": 0, "listingId": 1, **{field: 1 for field in PHOTO_FIELDS}, "primary": 1}
+    stored = {d["listingId"]: d for d in collection.find({"listingId": {"$in": ids}}, projection)}
+    changed = [doc for doc in docs if stored.get(doc["listingId"]) != doc]
+    return changed, len(docs) - len(changed)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Shared Spark API Rate Limiter
+
+One TokenBucket is shared by every worker thread that talks to Spark, so
+fetching several MLSs at once still stays under the account-wide request
+limit. A 429 pauses the whole bucket for the Retry-After period, not just the
+worker that happened to receive it - otherwise the other workers keep firing
+into the same limit.
+
+Usage:
+    limiter = TokenBucket(rate=4.0)
+    limiter.acquire()                 # before every request
+    limiter.backoff(retry_after(...)) # on a 429
+"""
+
+import time
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` requests/sec with bursts up to `burst`"""
+
+    def __init__(self, rate=4.0, burst=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def backoff(self, seconds):
+        """Pause every worker sharing this bucket (called on a 429)"""
+        with self.lock:
+            resume = time.monotonic() + max(0.0, seconds)
+            if resume > self.paused_until:
+                self.paused_until = resume
+                # No tokens accrue while paused; refill restarts at resume time
+                self.tokens = 0.0
+                self.updated = resume
+
+
+def retry_after(response, default):
+    """Seconds to wait from a 429's Retry-After header (seconds or HTTP date)"""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                when = parsedate_to_datetime(value)
+                return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+    return default
@@ -20,13 +20,31 @@ Usage:
 
     # Incremental update (fetch only recent changes)
     python src/scripts/mls/backend/unified/run-pipeline.py --all --incremental
+
+    # Streaming mode: each page is flattened and seeded as it arrives (no JSON files)
+    python src/scripts/mls/backend/unified/run-pipeline.py --all --stream
+
+    # Parallel streaming: one worker per MLS sharing a single Spark rate limit
+    python src/scripts/mls/backend/unified/run-pipeline.py --all --incremental --parallel 8
+
+    # Full sync with each MLS split into 8 time-sliced partitions fetched concurrently
+    python src/scripts/mls/backend/unified/run-pipeline.py --all --partitions 8
+
+    # Write compact Parquet snapshots instead of pretty-printed JSON
+    python src/scripts/mls/backend/unified/run-pipeline.py --all --format parquet
 """
 
 import subprocess
 import argparse
+import importlib.util
 import sys
+import time
 from pathlib import Path
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from rate_limit import TokenBucket
+from snapshot import FORMATS
 
 # Available MLSs
 MLS_OPTIONS = ["GPS", "CRMLS", "CLAW", "SOUTHLAND", "HIGH_DESERT", "BRIDGE", "CONEJO_SIMI_MOORPARK", "ITECH"]
@@ -49,7 +67,94 @@ def run_command(cmd, description):
     return True
 
 
-def run_pipeline(mls_list, steps, incremental=False):
+def load_fetch_module(scripts_dir):
+    """unified-fetch.py has a hyphen in its name, so load it by path"""
+    spec = importlib.util.spec_from_file_location("unified_fetch", scripts_dir / "unified-fetch.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_parallel(mls_list, incremental=False, workers=8, rate=4.0):
+    """
+    Stream several MLSs at once, one worker thread per association
+
+    All workers share one TokenBucket, so the combined request rate stays at
+    `rate` req/sec and a 429 on any worker pauses every worker. Wall-clock time
+    approaches the slowest MLS instead of the sum of all of them.
+    """
+    import seed
+
+    scripts_dir = Path(__file__).resolve().parent
+    fetch = load_fetch_module(scripts_dir)
+
+    start_time = datetime.now()
+    print("\n" + "=" * 80)
+    print("UNIFIED MLS PIPELINE (PARALLEL STREAMING)")
+    print("=" * 80)
+    print(f"Started: {start_time.strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"MLSs: {', '.join(mls_list)}")
+    print(f"Workers: {workers}")
+    print(f"Shared rate limit: {rate} req/sec")
+    print(f"Incremental: {incremental}")
+    print("=" * 80)
+
+    client, db = seed.connect_to_mongodb()
+    collection = db["unified_listings"]
+    seed.create_indexes(collection)
+
+    limiter = TokenBucket(rate=rate)
+
+    def worker(mls):
+        started = time.time()
+        result = fetch.stream_listings(
+            mls,
+            collection,
+            incremental=incremental,
+            limiter=limiter,
+            progress=False
+        )
+        return result + (time.time() - started,)
+
+    results = {}
+    failures = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(worker, mls): mls for mls in mls_list}
+        for future in as_completed(futures):
+            mls = futures[future]
+            try:
+                results[mls] = future.result()
+                fetched, updated, skipped, failed, unchanged, elapsed = results[mls]
+                print(f"\n[OK] {mls} done in {fetch.format_time(elapsed)}: "
+                      f"{fetched:,} fetched, {updated:,} updated, {unchanged:,} unchanged, {failed:,} failed")
+            except Exception as e:
+                failures[mls] = str(e)
+                print(f"\n[ERROR] {mls} failed: {e}")
+
+    client.close()
+
+    end_time = datetime.now()
+
+    print("\n\n" + "=" * 80)
+    print("PIPELINE COMPLETE")
+    print("=" * 80)
+    for mls in mls_list:
+        if mls in results:
+            fetched, updated, skipped, failed, unchanged, elapsed = results[mls]
+            print(f"  {mls:<22} {fetched:>8,} fetched {updated:>8,} updated {unchanged:>8,} unchanged {failed:>6,} failed  {fetch.format_time(elapsed)}")
+        else:
+            print(f"  {mls:<22} FAILED: {failures.get(mls)}")
+    print(f"Started: {start_time.strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"Ended: {end_time.strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"Duration: {end_time - start_time}")
+    print(f"MLSs processed: {len(results)}/{len(mls_list)}")
+    fetch.SPARK.print_metrics()
+    print("=" * 80 + "\n")
+
+    return not failures
+
+
+def run_pipeline(mls_list, steps, incremental=False, stream=False, partitions=0, rate=4.0, resume=False, fmt="json"):
     """Run the unified MLS pipeline"""
     project_root = Path(__file__).resolve().parents[5]
     scripts_dir = project_root / "src/scripts/mls/backend/unified"
@@ -62,6 +167,11 @@ def run_pipeline(mls_list, steps, incremental=False):
     print(f"MLSs: {', '.join(mls_list)}")
     print(f"Steps: {', '.join(steps)}")
     print(f"Incremental: {incremental}")
+    print(f"Streaming: {stream}")
+    if not stream:
+        print(f"Snapshot format: {fmt}")
+    if partitions:
+        print(f"Partitions: {partitions} @ {rate} req/sec")
     print("=" * 80)
 
     for mls in mls_list:
@@ -69,6 +179,22 @@ def run_pipeline(mls_list, steps, incremental=False):
         print(f"# Processing MLS: {mls}")
         print(f"{'#' * 80}")
 
+        # Streaming: fetch, flatten and seed in one pass
+        if stream:
+            stream_cmd = [
+                sys.executable,
+                str(scripts_dir / "unified-fetch.py"),
+                "--mls", mls,
+                "--stream"
+            ]
+            if incremental:
+                stream_cmd.append("--incremental")
+
+            if not run_command(stream_cmd, f"Stream listings from {mls} to MongoDB"):
+                print(f"\n[ERROR] Pipeline failed at stream step for {mls}")
+                return False
+            continue
+
         # Step 1: Fetch
         if "fetch" in steps:
             fetch_cmd = [
@@ -78,6 +204,11 @@ def run_pipeline(mls_list, steps, incremental=False):
             ]
             if incremental:
                 fetch_cmd.append("--incremental")
+            if partitions:
+                fetch_cmd.extend(["--partitions", str(partitions), "--rate", str(rate)])
+            if resume:
+                fetch_cmd.append("--resume")
+            fetch_cmd.extend(["--format", fmt])
 
             if not run_command(fetch_cmd, f"Fetch listings from {mls}"):
                 print(f"\n[ERROR] Pipeline failed at fetch step for {mls}")
@@ -89,7 +220,7 @@ def run_pipeline(mls_list, steps, incremental=False):
                 sys.executable,
                 str(scripts_dir / "flatten.py")
             ]
-            # flatten.py auto-detects the most recent file, so no need to specify input
+            # flatten.py auto-detects the most recent file and keeps its format
 
             if not run_command(flatten_cmd, f"Flatten listings for {mls}"):
                 print(f"\n[ERROR] Pipeline failed at flatten step for {mls}")
@@ -146,6 +277,42 @@ def main():
         action="store_true",
         help="Fetch only recent changes (last hour)"
     )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Fetch, flatten and seed page by page with no intermediate JSON files"
+    )
+    parser.add_argument(
+        "--parallel",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Stream up to N MLSs concurrently (implies --stream)"
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=4.0,
+        help="Spark requests/sec shared by all --parallel/--partitions workers (default: 4)"
+    )
+    parser.add_argument(
+        "--partitions",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Full sync only: split each MLS fetch into N time windows fetched concurrently"
+    )
+    parser.add_argument(
+        "--format",
+        choices=list(FORMATS),
+        default="json",
+        help="Snapshot format for fetch/flatten files: json, ndjson (gzip'd) or parquet (needs pyarrow)"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume the fetch step from its last checkpointed page"
+    )
 
     args = parser.parse_args()
 
@@ -165,10 +332,22 @@ def main():
     if not all(s in valid_steps for s in steps):
         print(f"[ERROR] Invalid steps. Valid options: {', '.join(valid_steps)}")
         sys.exit(1)
+    if (args.stream or args.parallel) and set(steps) != valid_steps:
+        print("[ERROR] --stream runs fetch, flatten and seed together; it cannot be combined with --steps")
+        sys.exit(1)
+    if args.parallel < 0 or args.partitions < 0 or args.rate <= 0:
+        print("[ERROR] --parallel, --partitions and --rate must be positive")
+        sys.exit(1)
+    if args.partitions and (args.incremental or args.stream or args.parallel):
+        print("[ERROR] --partitions is for full file-based syncs; it cannot be combined with --incremental, --stream or --parallel")
+        sys.exit(1)
 
     # Run pipeline
     try:
-        success = run_pipeline(mls_list, steps, args.incremental)
+        if args.parallel:
+            success = run_parallel(mls_list, args.incremental, args.parallel, args.rate)
+        else:
+            success = run_pipeline(mls_list, steps, args.incremental, args.stream, args.partitions, args.rate, args.resume, args.format)
         sys.exit(0 if success else 1)
     except KeyboardInterrupt:
         print("\n\n[WARN] Pipeline interrupted by user")
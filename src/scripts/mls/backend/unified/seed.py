@@ -5,7 +5,13 @@ Unified MLS Seed Script
 Seeds the unified_listings MongoDB collection with listings from all 8 MLSs.
 
 Features:
-- Bulk upsert operations (500 per batch)
+- Pipelined bulk upserts: several batches in flight, batch size adapts to
+  write latency (see bulk_seeder.py), throughput reported in docs/sec
+- Delta-aware: a contentHash is stored on every document and listings whose
+  hash hasn't changed are not re-written (use --force to write everything)
+- Reads .json, .ndjson.gz or .parquet snapshots (see snapshot.py)
+- Primary photos from _expand=Photos are written to `photos` in the same run
+  (see photos.py), so no per-listing /photos requests are needed
 - Geospatial indexing (for radius queries)
 - Compound indexes (for filtering by city/subdivision/MLS/PropertyType)
 - Automatic index creation
@@ -21,17 +27,25 @@ Usage:
 
     # Recreate indexes only
     python src/scripts/mls/backend/unified/seed.py --indexes-only
+
+    # Re-write every listing even if its contentHash is unchanged
+    python src/scripts/mls/backend/unified/seed.py --force
 """
 
 import os
 import json
 import time
+import hashlib
 import argparse
 from pathlib import Path
 from pymongo import MongoClient, UpdateOne, GEOSPHERE, ASCENDING, DESCENDING
-from pymongo.errors import BulkWriteError, ConnectionFailure, ServerSelectionTimeoutError
+from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
 from dotenv import load_dotenv
 
+from snapshot import find_snapshots, read_snapshot
+from bulk_seeder import BulkSeeder
+from photos import pop_photo, photo_operation, drop_cached
+
 # Load environment variables
 env_path = Path(__file__).resolve().parents[5] / ".env.local"
 load_dotenv(dotenv_path=env_path)
@@ -156,90 +170,199 @@ def simple_slugify(s: str) -> str:
     )
 
 
-def seed(input_file: Path, collection):
-    """Seed listings into unified_listings collection"""
+def content_hash(doc: dict) -> str:
+    """sha1 of the listing's canonical JSON (key order independent, _id/contentHash excluded)"""
+    payload = {k: v for k, v in doc.items() if k not in ("_id", "contentHash")}
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def normalize(raw: dict):
+    """Normalize one flattened listing and stamp its contentHash (None if unusable)"""
+    listing_key = raw.get("listingKey")
+    address = raw.get("unparsedAddress")
+    slug = raw.get("slug") or listing_key
+
+    if not listing_key or not address or not slug:
+        print(f"[WARN] Skipping listing: missing required fields")
+        return None
+
+    # Normalize fields we rely on
+    raw["listingKey"] = listing_key
+    raw["slug"] = slug
+    raw["slugAddress"] = raw.get("slugAddress") or simple_slugify(address)
+
+    # Ensure geospatial coordinates are properly formatted
+    latitude = raw.get("latitude")
+    longitude = raw.get("longitude")
+    if latitude and longitude:
+        try:
+            raw["coordinates"] = {
+                "type": "Point",
+                "coordinates": [float(longitude), float(latitude)]  # [lng, lat] order for GeoJSON
+            }
+        except (ValueError, TypeError):
+            print(f"[WARN] Invalid coordinates for {listing_key}: lat={latitude}, lng={longitude}")
+
+    # Remove Mongo _id if present to avoid duplicate key errors on upsert
+    raw.pop("_id", None)
+
+    raw["contentHash"] = content_hash(raw)
+    return raw
+
+
+def upsert_operation(doc: dict):
+    return UpdateOne({"listingKey": doc["listingKey"]}, {"$set": doc}, upsert=True)
+
+
+def drop_unchanged(collection, docs):
+    """
+    Keep only docs whose contentHash differs from the stored one
+
+    One indexed $in read per batch replaces a write (and its oplog entry) for
+    every listing that hasn't changed since the last sync.
+
+    Returns:
+        (changed_docs, unchanged_count)
+    """
+    keys = [doc["listingKey"] for doc in docs]
+    stored = {
+        d["listingKey"]: d.get("contentHash")
+        for d in collection.find({"listingKey": {"$in": keys}}, {"_id": 0, "listingKey": 1, "contentHash": 1})
+    }
+    changed = [doc for doc in docs if stored.get(doc["listingKey"]) != doc["contentHash"]]
+    return changed, len(docs) - len(changed)
+
+
+def make_seeder(collection, force=False, batch_size=500, in_flight=4, label=""):
+    """BulkSeeder for unified_listings upserts, skipping unchanged hashes unless force"""
+    prepare = None if force else (lambda docs: drop_unchanged(collection, docs))
+    return BulkSeeder(
+        collection,
+        upsert_operation,
+        batch_size=batch_size,
+        in_flight=in_flight,
+        prepare=prepare,
+        label=label
+    )
+
+
+def make_photo_seeder(collection, force=False, in_flight=2, label=""):
+    """BulkSeeder for the primary photos harvested from _expand=Photos"""
+    photos_collection = collection.database["photos"]
+    prepare = None if force else (lambda docs: drop_cached(photos_collection, docs))
+    return BulkSeeder(
+        photos_collection,
+        photo_operation,
+        in_flight=in_flight,
+        prepare=prepare,
+        label=label,
+        progress=False
+    )
+
+
+def report_photos(stats, prefix=""):
+    if stats["docs"]:
+        print(f"{prefix}[OK] Photos: {stats['written']:,} cached, {stats['unchanged']:,} unchanged, "
+              f"{stats['failed']:,} failed (harvested from _expand=Photos)")
+
+
+def seed(input_file: Path, collection, force=False, in_flight=4):
+    """Seed listings into unified_listings collection (unchanged listings skipped unless force)"""
     if not input_file.exists():
         raise Exception(f"[ERROR] Input file {input_file} does not exist")
 
     print(f">>> Loading flattened listings from {input_file}")
     try:
-        with open(input_file, encoding="utf-8") as f:
-            listings = json.load(f)
+        listings = read_snapshot(input_file)
     except Exception as e:
         raise Exception(f"[ERROR] Failed to read {input_file}: {e}")
 
     print(f">>> Processing {len(listings):,} listings...")
 
-    operations = []
+    docs = []
+    photos = []
     skipped = 0
 
     for raw in listings:
-        listing_key = raw.get("listingKey")
-        address = raw.get("unparsedAddress")
-        slug = raw.get("slug") or listing_key
-
-        if not listing_key or not address or not slug:
-            print(f"[WARN] Skipping listing: missing required fields")
+        photo = pop_photo(raw)  # Inline photos go to the photos collection, not the listing
+        doc = normalize(raw)
+        if doc is None:
             skipped += 1
             continue
+        docs.append(doc)
+        if photo:
+            photos.append(photo)
 
-        # Normalize fields we rely on
-        raw["listingKey"] = listing_key
-        raw["slug"] = slug
-        raw["slugAddress"] = raw.get("slugAddress") or simple_slugify(address)
-
-        # Ensure geospatial coordinates are properly formatted
-        latitude = raw.get("latitude")
-        longitude = raw.get("longitude")
-        if latitude and longitude:
-            try:
-                raw["coordinates"] = {
-                    "type": "Point",
-                    "coordinates": [float(longitude), float(latitude)]  # [lng, lat] order for GeoJSON
-                }
-            except (ValueError, TypeError):
-                print(f"[WARN] Invalid coordinates for {listing_key}: lat={latitude}, lng={longitude}")
-
-        # Remove Mongo _id if present to avoid duplicate key errors on upsert
-        raw.pop("_id", None)
-
-        operations.append(
-            UpdateOne(
-                {"listingKey": listing_key},
-                {"$set": raw},
-                upsert=True,
-            )
-        )
-
-    if not operations:
+    if not docs:
         raise Exception("[ERROR] No valid listings to update")
 
-    print(f">>> Upserting {len(operations):,} listings in batches...")
-    batch_size = 500
-    updated = 0
-    failed = 0
+    print(f">>> Upserting {len(docs):,} listings in batches{' (--force: ignoring contentHash)' if force else ''}...")
+    seeder = make_seeder(collection, force=force, in_flight=in_flight)
+    seeder.extend(docs)
+    stats = seeder.close()
+
+    if photos:
+        photo_seeder = make_photo_seeder(collection, force=force)
+        photo_seeder.extend(photos)
+        report_photos(photo_seeder.close())
+
+    updated, unchanged, failed = stats["written"], stats["unchanged"], stats["failed"]
+    print(f"\n[OK] Complete: Updated {updated:,} listings. Unchanged: {unchanged:,}, Skipped: {skipped}, Failed: {failed}")
+    print(f">>> {stats['docs']:,} docs in {stats['seconds']}s ({stats['docs_per_sec']:,} docs/sec, "
+          f"{stats['batches']} batches, final batch size {stats['batch_size']})")
+    if failed > 0:
+        print(f"[WARN] {failed} operations failed during seeding")
+
+    return updated, skipped, failed, unchanged
+
+
+def seed_stream(listings, collection, batch_size=500, max_pending=4, label="", force=False):
+    """
+    Seed from any iterable of flattened listings without loading it all first
 
-    for i in range(0, len(operations), batch_size):
-        chunk = operations[i : i + batch_size]
-        batch_num = i // batch_size + 1
+    Batches go to a BulkSeeder with max_pending batches in flight. The producer
+    (usually the Spark fetch) blocks once they are all busy, so memory stays at
+    a few batches no matter how many listings arrive, and the first documents
+    land while later pages are still in flight.
+
+    label prefixes the batch lines (e.g. the MLS name) when several streams
+    share one console. Unchanged listings (same contentHash) are dropped on
+    the writer threads unless force is set. Primary photos carried inline
+    (_expand=Photos) are upserted into `photos` alongside.
+
+    Returns:
+        (updated, skipped, failed, unchanged) like seed()
+    """
+    prefix = f"[{label}]" if label else ""
+    seeder = make_seeder(collection, force=force, batch_size=batch_size, in_flight=max_pending, label=label)
+    photo_seeder = make_photo_seeder(collection, force=force, label=label)
+
+    skipped = 0
+    try:
+        for raw in listings:
+            photo = pop_photo(raw)  # Inline photos go to the photos collection, not the listing
+            doc = normalize(raw)
+            if doc is None:
+                skipped += 1
+                continue
+            seeder.add(doc)
+            if photo:
+                photo_seeder.add(photo)
+    finally:
         try:
-            result = collection.bulk_write(chunk, ordered=False)
-            modified = result.modified_count or 0
-            upserted = result.upserted_count or 0
-            updated += modified + upserted
-            print(f"[Batch {batch_num}] Modified: {modified}, Upserted: {upserted}")
-        except BulkWriteError as e:
-            batch_errors = len(e.details.get("writeErrors", [])) if e.details else 1
-            failed += batch_errors
-            print(f"[Batch {batch_num}] Failed with {batch_errors} errors")
-        except Exception as e:
-            raise Exception(f"[ERROR] Batch {batch_num} failed: {e}")
-
-    print(f"\n[OK] Complete: Updated {updated:,} listings. Skipped: {skipped}, Failed: {failed}")
+            stats = seeder.close()
+        finally:
+            photo_stats = photo_seeder.close()
+
+    updated, failed, unchanged = stats["written"], stats["failed"], stats["unchanged"]
+    print(f"\n{prefix}[OK] Complete: Updated {updated:,} listings. Unchanged: {unchanged:,}, Skipped: {skipped}, Failed: {failed} "
+          f"({stats['docs_per_sec']:,} docs/sec)")
+    report_photos(photo_stats, prefix)
     if failed > 0:
         print(f"[WARN] {failed} operations failed during seeding")
 
-    return updated, skipped, failed
+    return updated, skipped, failed, unchanged
 
 
 def main():
@@ -247,7 +370,7 @@ def main():
     parser.add_argument(
         "--input",
         type=str,
-        help="Input JSON file path (default: auto-detect from local-logs)"
+        help="Input snapshot file path: .json, .ndjson.gz or .parquet (default: auto-detect from local-logs)"
     )
     parser.add_argument(
         "--indexes-only",
@@ -260,6 +383,17 @@ def main():
         default="unified_listings",
         help="MongoDB collection name (default: unified_listings)"
     )
+    parser.add_argument(
+        "--in-flight",
+        type=int,
+        default=4,
+        help="Bulk write batches in flight at once (default: 4)"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Write every listing even when its contentHash is unchanged"
+    )
 
     args = parser.parse_args()
 
@@ -286,18 +420,14 @@ def main():
         else:
             project_root = Path(__file__).resolve().parents[5]
             local_logs = project_root / "local-logs"
-            # Look for most recent flattened_unified_*_listings.json
-            candidates = sorted(
-                local_logs.glob("flattened_unified_*_listings.json"),
-                key=lambda p: p.stat().st_mtime,
-                reverse=True
-            )
+            # Look for most recent flattened_unified_*_listings snapshot in any format
+            candidates = find_snapshots(local_logs, "flattened_unified_*_listings")
             if not candidates:
                 raise Exception("[ERROR] No flattened files found. Run flatten.py first.")
             input_path = candidates[0]
 
         # Seed data
-        updated, skipped, failed = seed(input_path, collection)
+        updated, skipped, failed, unchanged = seed(input_path, collection, force=args.force, in_flight=args.in_flight)
 
         # Summary
         print("\n" + "=" * 80)
@@ -305,6 +435,7 @@ def main():
         print(f"  Collection: {args.collection}")
         print(f"  Input: {input_path}")
         print(f"  Updated: {updated:,}")
+        print(f"  Unchanged (hash match): {unchanged:,}")
         print(f"  Skipped: {skipped}")
         print(f"  Failed: {failed}")
         print("=" * 80 + "\n")
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Listing Snapshot Files
+
+Reads and writes the local-logs listing files (all_*, flattened_*, closed_*)
+in one of three formats, picked by file extension:
+
+    json     .json        - pretty-printed array (the original format)
+    ndjson   .ndjson.gz   - one compact listing per line, gzip'd
+    parquet  .parquet     - columnar, zstd compressed (needs pyarrow)
+
+Parquet is the one to use on the VPS: it is a fraction of the size and a
+reader that only needs a few fields (columns=[...]) never parses the rest.
+Nested values (Media, StandardFields, ...) and columns with mixed value types
+are stored as JSON text so every listing round-trips exactly; plain
+str/int/float/bool columns are stored natively.
+
+Parquet has no "missing key", so keys whose value is None are omitted when
+reading it back (flattened listings never carry None values anyway).
+
+Usage:
+    from snapshot import write_snapshot, read_snapshot, snapshot_path, find_snapshots
+
+    path = snapshot_path(LOCAL_LOGS_DIR / "all_GPS_listings", "parquet")
+    write_snapshot(listings, path)
+    listings = read_snapshot(path, columns=["listingKey", "listPrice"])
+    latest = find_snapshots(LOCAL_LOGS_DIR, "flattened_unified_*_listings")[0]
+"""
+
+import os
+import gzip
+import json
+from pathlib import Path
+
+FORMATS = {
+    "json": ".json",
+    "ndjson": ".ndjson.gz",
+    "parquet": ".parquet",
+}
+
+# Parquet schema metadata key listing the columns stored as JSON text
+JSON_COLUMNS_KEY = b"snapshot_json_columns"
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise Exception("[ERROR] Parquet snapshots need pyarrow (pip install pyarrow), or use --format ndjson")
+    return pyarrow, pyarrow.parquet
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Paths
+# ──────────────────────────────────────────────────────────────────────────────
+
+def snapshot_format(path):
+    """Format name for a snapshot path, from its extension"""
+    name = Path(path).name
+    for fmt, ext in FORMATS.items():
+        if name.endswith(ext):
+            return fmt
+    raise Exception(f"[ERROR] Unknown snapshot format for {name} (expected {', '.join(FORMATS.values())})")
+
+
+def snapshot_path(base, fmt="json"):
+    """base path without extension + the extension for fmt"""
+    if fmt not in FORMATS:
+        raise Exception(f"[ERROR] Unknown snapshot format '{fmt}' (expected {', '.join(FORMATS)})")
+    base = Path(base)
+    return base.with_name(base.name + FORMATS[fmt])
+
+
+def snapshot_stem(path):
+    """File name without the snapshot extension: all_GPS_listings.ndjson.gz -> all_GPS_listings"""
+    name = Path(path).name
+    return name[:-len(FORMATS[snapshot_format(path)])]
+
+
+def find_snapshots(directory, pattern):
+    """
+    Snapshot files matching pattern (no extension) in any format, newest first
+
+    find_snapshots(local_logs, "all_*_listings") matches all_GPS_listings.json,
+    all_GPS_listings.ndjson.gz and all_GPS_listings.parquet.
+    """
+    directory = Path(directory)
+    found = set()
+    for ext in FORMATS.values():
+        found.update(directory.glob(pattern + ext))
+    return sorted(found, key=lambda p: p.stat().st_mtime, reverse=True)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Write
+# ──────────────────────────────────────────────────────────────────────────────
+
+def write_snapshot(records, path):
+    """
+    Write a list of listing dicts to path in the format its extension names
+
+    The file is written to a temp name and moved into place, so a reader never
+    sees half a snapshot.
+    """
+    path = Path(path)
+    fmt = snapshot_format(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+
+    if fmt == "json":
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(records, f, indent=2)
+    elif fmt == "ndjson":
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+            for record in records:
+                f.write(json.dumps(record, separators=(",", ":"), ensure_ascii=False))
+                f.write("\n")
+    else:
+        _write_parquet(records, tmp_path)
+
+    os.replace(tmp_path, path)
+    return path
+
+
+def _column_kind(values):
+    """Arrow type name for a column, or "json" when it has to be stored as text"""
+    types = {type(v) for v in values if v is not None}
+    if not types:
+        return "null"
+    if len(types) > 1:
+        return "json"  # e.g. int and float mixed: text keeps 500000 vs 500000.0 exact
+    kind = types.pop()
+    return {str: "string", int: "int64", float: "float64", bool: "bool"}.get(kind, "json")
+
+
+def _write_parquet(records, path):
+    pa, pq = _require_pyarrow()
+
+    # Union of keys in first-seen order
+    columns = {}
+    for record in records:
+        for key in record:
+            columns.setdefault(key, None)
+
+    arrays = []
+    names = []
+    json_columns = []
+    for name in columns:
+        values = [record.get(name) for record in records]
+        kind = _column_kind(values)
+        if kind == "json":
+            json_columns.append(name)
+            values = [
+                None if v is None else json.dumps(v, separators=(",", ":"), ensure_ascii=False)
+                for v in values
+            ]
+            kind = "string"
+        arrays.append(pa.array(values, type=getattr(pa, kind)()))
+        names.append(name)
+
+    table = pa.Table.from_arrays(arrays, names=names)
+    table = table.replace_schema_metadata({JSON_COLUMNS_KEY: json.dumps(json_columns).encode("utf-8")})
+    pq.write_table(table, path, compression="zstd")
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Read
+# ──────────────────────────────────────────────────────────────────────────────
+
+def read_snapshot(path, columns=None):
+    """
+    Read a snapshot back as a list of listing dicts
+
+    Args:
+        path: Snapshot file (.json, .ndjson.gz or .parquet)
+        columns: Optional field names to keep; with parquet only these
+                 columns are read from disk
+    """
+    path = Path(path)
+    fmt = snapshot_format(path)
+
+    if fmt == "parquet":
+        return _read_parquet(path, columns)
+
+    if fmt == "json":
+        with open(path, "r", encoding="utf-8") as f:
+            records = json.load(f)
+    else:
+        records = []
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    records.append(json.loads(line))
+
+    if columns:
+        wanted = set(columns)
+        records = [{k: v for k, v in record.items() if k in wanted} for record in records]
+    return records
+
+
+def _read_parquet(path, columns=None):
+    pa, pq = _require_pyarrow()
+
+    schema = pq.read_schema(path)
+    metadata = schema.metadata or {}
+    json_columns = set(json.loads(metadata.get(JSON_COLUMNS_KEY, b"[]")))
+    if columns:
+        columns = [name for name in columns if name in schema.names]
+
+    table = pq.read_table(path, columns=columns)
+    decoded = {}
+    for name, values in table.to_pydict().items():
+        if name in json_columns:
+            values = [None if v is None else json.loads(v) for v in values]
+        decoded[name] = values
+
+    records = []
+    for i in range(table.num_rows):
+        records.append({name: values[i] for name, values in decoded.items() if values[i] is not None})
+    return records
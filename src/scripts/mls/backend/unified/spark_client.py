@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Shared Spark API Client
+
+Every script that talks to the Spark replication API goes through one
+SparkClient instead of bare requests.get():
+
+- One requests.Session with a pooled HTTPAdapter, so worker threads reuse
+  keep-alive TLS connections instead of opening one per request
+- 429 / "over rate" handling in one place: honours Retry-After, otherwise
+  exponential backoff; with a shared TokenBucket the pause applies to every
+  worker
+- Transient 5xx and network errors are retried; anything else is handed back
+  to the caller, which decides what 403/404 mean for it
+- Optional AdaptiveConcurrency (concurrency.py) caps in-flight requests and
+  tunes that cap from latency and 429s, so worker pools need no fixed sleeps
+- Request metrics (counts by status, throttles, errors, latency p50/p95/max)
+
+Usage:
+    from spark_client import SparkClient, SparkError
+
+    spark = SparkClient(ACCESS_TOKEN, pool_size=8)
+    res = spark.get(f"{BASE_URL}?_filter=...&_limit=1000")
+    data = spark.get_json(url)          # raises SparkError unless HTTP 200
+    spark.print_metrics("Spark API")
+"""
+
+import os
+import time
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from rate_limit import retry_after
+
+BASE_URL = "https://replication.sparkapi.com/v1/listings"
+
+
+class SparkError(Exception):
+    """Spark request that failed after retries (status is None for network errors)"""
+
+    def __init__(self, status, body, url=None):
+        self.status = status
+        self.body = body or ""
+        self.url = url
+        label = f"HTTP {status}" if status is not None else "Network error"
+        super().__init__(f"{label}: {self.body[:200]}")
+
+
+class SparkClient:
+    """Pooled, rate-limit-aware Spark API client (safe to share across threads)"""
+
+    def __init__(
+        self,
+        access_token=None,
+        pool_size=16,
+        timeout=15,
+        retries=3,
+        backoff_base=2.0,
+        max_backoff=60.0,
+        limiter=None,
+        concurrency=None
+    ):
+        self.access_token = access_token or os.getenv("SPARK_ACCESS_TOKEN")
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.limiter = limiter
+        self.concurrency = concurrency
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Accept": "application/json"})
+        if self.access_token:
+            self.session.headers["Authorization"] = f"Bearer {self.access_token}"
+
+        self._lock = threading.Lock()
+        self._latencies = []
+        self._statuses = {}
+        self._throttled = 0
+        self._errors = 0
+
+    # ──────────────────────────────────────────────────────────────────────
+    # Requests
+    # ──────────────────────────────────────────────────────────────────────
+
+    def get(self, url, params=None, timeout=None, retries=None, limiter=None):
+        """
+        GET with pooling, rate limiting and retries
+
+        Returns the final requests.Response for any status other than a 429
+        (callers check status_code). Raises SparkError when still throttled
+        after all retries, or on repeated network errors.
+        """
+        if not self.access_token:
+            raise Exception("[ERROR] SPARK_ACCESS_TOKEN is missing in .env.local")
+
+        limiter = limiter or self.limiter
+        concurrency = self.concurrency
+        retries = retries or self.retries
+        timeout = timeout or self.timeout
+        response = None
+
+        for attempt in range(retries):
+            if limiter:
+                limiter.acquire()
+            if concurrency:
+                concurrency.acquire()
+
+            started = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, timeout=timeout)
+            except requests.RequestException as e:
+                seconds = time.perf_counter() - started
+                if concurrency:
+                    concurrency.release(seconds, error=True)
+                self._record(None, seconds)
+                if attempt == retries - 1:
+                    raise SparkError(None, str(e), url)
+                time.sleep(self._backoff(attempt))
+                continue
+
+            seconds = time.perf_counter() - started
+            throttled = self._is_throttled(response)
+            if concurrency:
+                concurrency.release(seconds, throttled=throttled, error=response.status_code >= 500)
+            self._record(response.status_code, seconds)
+
+            if throttled:
+                wait = retry_after(response, self._backoff(attempt))
+                with self._lock:
+                    self._throttled += 1
+                if attempt == retries - 1:
+                    print(f"[WARN] Spark rate limited, giving up (attempt {attempt + 1}/{retries})")
+                    break
+                print(f"[WARN] Spark rate limited, waiting {wait:.0f}s (attempt {attempt + 1}/{retries})")
+                if limiter:
+                    limiter.backoff(wait)  # Pause every worker sharing the limiter
+                if concurrency:
+                    concurrency.backoff(wait)  # ...and every worker gated by the controller
+                if not limiter and not concurrency:
+                    time.sleep(wait)
+                continue
+
+            if response.status_code >= 500 and attempt < retries - 1:
+                time.sleep(self._backoff(attempt))
+                continue
+
+            return response
+
+        raise SparkError(
+            response.status_code if response is not None else None,
+            "Max retries reached (rate limited)",
+            url
+        )
+
+    def get_json(self, url, params=None, **kwargs):
+        """GET and decode JSON; raises SparkError unless HTTP 200"""
+        response = self.get(url, params=params, **kwargs)
+        if response.status_code != 200:
+            raise SparkError(response.status_code, response.text, url)
+        return response.json()
+
+    def _is_throttled(self, response):
+        if response.status_code == 429:
+            return True
+        return response.status_code != 200 and "over rate" in response.text.lower()
+
+    def _backoff(self, attempt):
+        return min(self.max_backoff, self.backoff_base * (2 ** attempt))
+
+    # ──────────────────────────────────────────────────────────────────────
+    # Metrics
+    # ──────────────────────────────────────────────────────────────────────
+
+    def _record(self, status, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+            if status is None:
+                self._errors += 1
+            else:
+                self._statuses[status] = self._statuses.get(status, 0) + 1
+
+    def metrics(self):
+        """Snapshot of request counts and latency percentiles (milliseconds)"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            statuses = dict(self._statuses)
+            throttled = self._throttled
+            errors = self._errors
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            idx = min(len(latencies) - 1, int(round(p * (len(latencies) - 1))))
+            return round(latencies[idx] * 1000, 1)
+
+        metrics = {
+            "requests": len(latencies),
+            "by_status": {str(k): v for k, v in sorted(statuses.items())},
+            "throttled": throttled,
+            "network_errors": errors,
+            "latency_ms_p50": percentile(0.50),
+            "latency_ms_p95": percentile(0.95),
+            "latency_ms_max": percentile(1.0),
+            "total_request_seconds": round(sum(latencies), 1),
+        }
+        if self.concurrency:
+            metrics["concurrency"] = self.concurrency.snapshot()
+        return metrics
+
+    def print_metrics(self, label="Spark API"):
+        m = self.metrics()
+        statuses = ", ".join(f"{k}: {v:,}" for k, v in m["by_status"].items()) or "none"
+        print(f"{label}: {m['requests']:,} requests ({statuses}) | "
+              f"throttled {m['throttled']:,} | errors {m['network_errors']:,} | "
+              f"p50 {m['latency_ms_p50']}ms p95 {m['latency_ms_p95']}ms max {m['latency_ms_max']}ms")
+        if "concurrency" in m:
+            c = m["concurrency"]
+            print(f"{label} concurrency: limit {c['limit']} (peak {c['peak']}) | "
+                  f"+{c['increases']} increases | {c['throttles']} throttles | {c['spikes']} latency spikes")
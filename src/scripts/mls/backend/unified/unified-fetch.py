@@ -10,6 +10,7 @@ Features:
 - Multi-MLS support (GPS, CRMLS, FlexMLS, etc.)
 - Incremental updates via ModificationTimestamp
 - Total count verification
+- Time-sliced partitions fetched concurrently for big full pulls
 - RESO-compliant field mapping
 
 Usage:
@@ -21,18 +22,31 @@ Usage:
 
     # Incremental update (last hour only)
     python src/scripts/mls/backend/unified-fetch.py --incremental
+
+    # Stream straight into MongoDB (fetch -> flatten -> seed, no JSON files)
+    python src/scripts/mls/backend/unified-fetch.py --mls GPS --stream
+
+    # Pick up a crashed/killed run from its last committed page
+    python src/scripts/mls/backend/unified-fetch.py --mls CRMLS --resume
+
+    # Full pull split into 8 ModificationTimestamp windows fetched concurrently
+    python src/scripts/mls/backend/unified-fetch.py --mls CRMLS --partitions 8 -y
 """
 
 import os
-import json
-import requests
 import time
 import argparse
 import sys
 from pathlib import Path
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 
+from rate_limit import TokenBucket
+from checkpoint import PageCheckpoint
+from spark_client import SparkClient, SparkError
+from snapshot import FORMATS, snapshot_path, write_snapshot
+
 # Load environment variables
 env_path = Path(__file__).resolve().parents[5] / ".env.local"
 load_dotenv(dotenv_path=env_path)
@@ -41,7 +55,10 @@ load_dotenv(dotenv_path=env_path)
 BASE_URL = "https://replication.sparkapi.com/v1/listings"
 ACCESS_TOKEN = os.getenv("SPARK_ACCESS_TOKEN")
 LOCAL_LOGS_DIR = Path(__file__).resolve().parents[5] / "local-logs"
+# One pooled client for every request (partition/MLS worker threads share it)
+SPARK = SparkClient(ACCESS_TOKEN, pool_size=16)
 LOCAL_LOGS_DIR.mkdir(parents=True, exist_ok=True)
+CHECKPOINT_DIR = LOCAL_LOGS_DIR / "checkpoints"
 
 # MLS ID Mapping (from Diego's email - all 8 associations)
 MLS_IDS = {
@@ -55,6 +72,13 @@ MLS_IDS = {
     "ITECH": "20200630203206752718000000"
 }
 
+# Expansions requested on every production pull. Photos carries the primary
+# photo metadata that seed.py writes to the photos collection (photos.py).
+DEFAULT_EXPANSIONS = ["Media", "OpenHouses", "VirtualTours", "Photos"]
+
+# Earliest ModificationTimestamp a partitioned pull looks back to
+PARTITION_FLOOR = datetime(2000, 1, 1)
+
 
 def clean_data(obj):
     """Remove null, empty, and masked fields"""
@@ -119,12 +143,12 @@ def print_progress_bar(current, total, bar_length=50, prefix="Progress", start_t
         print()
 
 
-def get_total_count(headers, filter_query):
+def get_total_count(filter_query, limiter=None):
     """Get total record count before fetching (per Diego's example)"""
     count_url = f"{BASE_URL}?_filter={filter_query}&_pagination=count"
 
     try:
-        response = requests.get(count_url, headers=headers, timeout=10)
+        response = SPARK.get(count_url, timeout=10, limiter=limiter)
         if response.status_code == 200:
             data = response.json()
             total_rows = data.get("D", {}).get("Pagination", {}).get("TotalRows", 0)
@@ -137,51 +161,25 @@ def get_total_count(headers, filter_query):
         return None
 
 
-def fetch_listings(
-    mls_ids=None,
+def build_filter(
+    mls_ids,
     property_types=["A", "B", "C", "D"],
     statuses=["Active"],
     incremental=False,
     start_time=None,
-    end_time=None,
-    batch_size=500,
-    expansions=None
+    end_time=None
 ):
     """
-    Fetch listings from Spark Replication API
-
-    Args:
-        mls_ids: List of MLS names (e.g., ["GPS", "CRMLS"]) or None for all
-        property_types: Property type codes (A=Residential, B=Lease, C=Multi-family, D=Land)
-        statuses: StandardStatus values (Active, Pending, Closed, Expired)
-        incremental: Use ModificationTimestamp for incremental updates
-        start_time: Start of time window (ISO format)
-        end_time: End of time window (ISO format)
-        batch_size: Records per request (max 1000 for replication API)
-        expansions: List of expansions (e.g., ["Photos", "OpenHouses"])
+    Build the Spark _filter expression for a replication pull
 
     Returns:
-        List of listing dictionaries
+        Filter string (e.g. "MlsId Eq '...' And (PropertyType Eq 'A' Or ...)")
     """
-
-    if not ACCESS_TOKEN:
-        raise Exception("[ERROR] SPARK_ACCESS_TOKEN is missing in .env.local")
-
-    headers = {
-        "Authorization": f"Bearer {ACCESS_TOKEN}",
-        "Accept": "application/json"
-    }
-
-    # Default to all MLSs if none specified
-    if mls_ids is None:
-        mls_ids = list(MLS_IDS.keys())
-
     # Validate MLS IDs
     for mls_name in mls_ids:
         if mls_name not in MLS_IDS:
             raise ValueError(f"Unknown MLS: {mls_name}. Available: {list(MLS_IDS.keys())}")
 
-    # Build filter
     filter_parts = []
 
     # MLS filter
@@ -215,7 +213,48 @@ def fetch_listings(
         # Spark uses 'bt' (between) operator for timestamp ranges
         filter_parts.append(f"ModificationTimestamp bt {start_iso},{end_iso}")
 
-    combined_filter = " And ".join(filter_parts)
+    return " And ".join(filter_parts)
+
+
+def iter_listing_pages(
+    mls_ids=None,
+    property_types=["A", "B", "C", "D"],
+    statuses=["Active"],
+    incremental=False,
+    start_time=None,
+    end_time=None,
+    batch_size=500,
+    expansions=None,
+    limiter=None,
+    progress=True,
+    label=None,
+    checkpoint=None
+):
+    """
+    Fetch listings from Spark Replication API one page at a time
+
+    Same arguments as fetch_listings(). Yields each page as a list of cleaned
+    listing dictionaries as soon as it arrives, so callers can process a pull
+    of any size without holding it all in memory.
+
+    Extra args:
+        limiter: Shared rate_limit.TokenBucket. Every request acquires a token
+                 and a 429 pauses all workers sharing it. Without one, pages
+                 are spaced by a fixed 0.2s courtesy sleep.
+        progress: Draw the progress bar. Pass False when several MLSs are
+                  fetched concurrently; page lines are then MLS-prefixed.
+        label: Prefix for log lines (defaults to the MLS names)
+        checkpoint: checkpoint.PageCheckpoint. Every page is committed to it
+                    before being yielded. If it was load()ed from a previous
+                    run, the spooled listings are yielded first and paging
+                    continues from the stored SkipToken with the stored query.
+    """
+
+    # Default to all MLSs if none specified
+    if mls_ids is None:
+        mls_ids = list(MLS_IDS.keys())
+
+    combined_filter = build_filter(mls_ids, property_types, statuses, incremental, start_time, end_time)
 
     # Build base URL
     url_params = [
@@ -226,115 +265,351 @@ def fetch_listings(
     if expansions:
         url_params.append(f"_expand={','.join(expansions)}")
 
+    resumed = checkpoint is not None and checkpoint.state is not None
+    if resumed:
+        # Reuse the interrupted run's exact query so its SkipToken stays valid
+        combined_filter = checkpoint.state["query"]["filter"]
+        url_params = checkpoint.state["query"]["params"]
+    elif checkpoint is not None:
+        checkpoint.begin({"filter": combined_filter, "params": url_params})
+
     # Get total count first (Diego's recommendation)
     print(f"\n>>> Fetching from MLS(s): {', '.join(mls_ids)}")
     print(f">>> Filter: {combined_filter}\n")
 
-    total_count = get_total_count(headers, combined_filter)
+    total_count = get_total_count(combined_filter, limiter)
     if total_count is not None:
         print(f">>> Total records to fetch: {total_count:,}\n")
 
     # Fetch listings using skiptoken pagination
-    all_listings = []
+    fetched = 0
     skiptoken = ""  # Start with empty string (per Diego's guidance)
     page = 1
-    retries = 3
+    complete = False
+    label = label or ', '.join(mls_ids)
+    show_bar = progress and total_count
+
+    if resumed:
+        state = checkpoint.state
+        print(f">>> Resuming from checkpoint: page {state['page'] + 1}, {state['fetched']:,} listings spooled\n")
+        for spooled in checkpoint.replay(batch_size):
+            fetched += len(spooled)
+            yield spooled
+        skiptoken = state["skiptoken"]
+        page = state["page"] + 1
+        complete = state["complete"]
+
     fetch_start_time = time.time()
 
     # Show initial progress bar if we have total count
-    if total_count:
-        print_progress_bar(0, total_count, prefix=f"Fetching {', '.join(mls_ids)}", start_time=fetch_start_time)
+    if show_bar:
+        print_progress_bar(fetched, total_count, prefix=f"Fetching {label}", start_time=fetch_start_time)
 
-    while True:
+    while not complete:
         # Build URL with skiptoken
         url = f"{BASE_URL}?{'&'.join(url_params)}&_skiptoken={skiptoken}"
 
-        # Initialize variables before retry loop
-        batch = []
-        new_skiptoken = None
-        success = False
+        # SparkClient handles 429/Retry-After, backoff and transient errors
+        try:
+            data = SPARK.get_json(url, limiter=limiter)
+        except SparkError as e:
+            raise Exception(f"[{label}][Page {page}] {e}")
 
-        for attempt in range(retries):
-            try:
-                response = requests.get(url, headers=headers, timeout=15)
-
-                if response.status_code == 200:
-                    data = response.json()
-                    response_data = data.get("D", {})
-                    batch = response_data.get("Results", [])
-
-                    # CRITICAL: Get SkipToken from API response (not from listing ID!)
-                    new_skiptoken = response_data.get("SkipToken")
-
-                    if not batch:
-                        print(f"[Page {page}] No more results. Fetch complete.\n")
-                        success = True
-                        break
-
-                    # Clean and add to results
-                    cleaned_batch = [clean_data(listing) for listing in batch]
-                    all_listings.extend(cleaned_batch)
-
-                    # Update progress bar
-                    if total_count:
-                        print_progress_bar(len(all_listings), total_count, prefix=f"Fetching {', '.join(mls_ids)}", start_time=fetch_start_time)
-                    else:
-                        print(f"[Page {page}] Fetched {len(batch)} listings (Total: {len(all_listings):,})")
-
-                    # Check for end condition (per Diego's REPLICATION_GUIDE.md)
-                    if not new_skiptoken or new_skiptoken == skiptoken:
-                        print(f"[Page {page}] SkipToken unchanged. Fetch complete.\n")
-                        success = True
-                        break
-
-                    skiptoken = new_skiptoken
-                    success = True
-                    break
-
-                elif response.status_code == 429:
-                    wait_time = 3 + (attempt * 2)
-                    print(f"[Page {page}] Rate limited. Waiting {wait_time}s...")
-                    time.sleep(wait_time)
+        response_data = data.get("D", {})
+        batch = response_data.get("Results", [])
 
-                else:
-                    error_msg = f"HTTP {response.status_code}: {response.text[:200]}"
-                    raise Exception(error_msg)
+        # CRITICAL: Get SkipToken from API response (not from listing ID!)
+        new_skiptoken = response_data.get("SkipToken")
+
+        if not batch:
+            print(f"[Page {page}] No more results. Fetch complete.\n")
+            if checkpoint is not None:
+                checkpoint.commit(page, skiptoken, [], complete=True)
+            break
+
+        # Check for end condition (per Diego's REPLICATION_GUIDE.md)
+        done = not new_skiptoken or new_skiptoken == skiptoken
+        skiptoken = new_skiptoken
 
-            except requests.RequestException as e:
-                print(f"[Page {page}] Request error: {e}")
-                if attempt == retries - 1:
-                    raise Exception(f"Max retries reached: {e}")
-                time.sleep(2 ** attempt)
+        # Clean and hand the page to the caller
+        cleaned_batch = [clean_data(listing) for listing in batch]
+        fetched += len(cleaned_batch)
 
-        # Break if request failed or no batch
-        if not success or not batch:
+        # Commit before handing it on, so a crash after this point can resume
+        if checkpoint is not None:
+            checkpoint.commit(page, skiptoken, cleaned_batch, complete=done)
+
+        # Update progress bar
+        if show_bar:
+            print_progress_bar(fetched, total_count, prefix=f"Fetching {label}", start_time=fetch_start_time)
+        elif progress:
+            print(f"[Page {page}] Fetched {len(batch)} listings (Total: {fetched:,})")
+        else:
+            of_total = f"/{total_count:,}" if total_count else ""
+            print(f"[{label}][Page {page}] Fetched {len(batch)} listings (Total: {fetched:,}{of_total})")
+
+        yield cleaned_batch
+
+        if done:
+            print(f"[Page {page}] SkipToken unchanged. Fetch complete.\n")
             break
 
         page += 1
-        time.sleep(0.2)  # Rate limiting courtesy
+        if not limiter:
+            time.sleep(0.2)  # Rate limiting courtesy
 
     # Verify count
     if total_count is not None:
-        if len(all_listings) != total_count:
-            print(f"[WARN] Count mismatch! Expected {total_count:,}, got {len(all_listings):,}")
+        if fetched != total_count:
+            print(f"[WARN] {label}: Count mismatch! Expected {total_count:,}, got {fetched:,}")
         else:
-            print(f"[OK] Count verified: {len(all_listings):,} records")
+            print(f"[OK] {label}: Count verified: {fetched:,} records")
+
+
+def fetch_listings(
+    mls_ids=None,
+    property_types=["A", "B", "C", "D"],
+    statuses=["Active"],
+    incremental=False,
+    start_time=None,
+    end_time=None,
+    batch_size=500,
+    expansions=None,
+    limiter=None,
+    progress=True,
+    label=None,
+    checkpoint=None
+):
+    """
+    Fetch listings from Spark Replication API
+
+    Args:
+        mls_ids: List of MLS names (e.g., ["GPS", "CRMLS"]) or None for all
+        property_types: Property type codes (A=Residential, B=Lease, C=Multi-family, D=Land)
+        statuses: StandardStatus values (Active, Pending, Closed, Expired)
+        incremental: Use ModificationTimestamp for incremental updates
+        start_time: Start of time window (ISO format)
+        end_time: End of time window (ISO format)
+        batch_size: Records per request (max 1000 for replication API)
+        expansions: List of expansions (e.g., ["Photos", "OpenHouses"])
+        limiter / progress / label / checkpoint: See iter_listing_pages()
 
+    Returns:
+        List of listing dictionaries
+    """
+    all_listings = []
+    for page in iter_listing_pages(
+        mls_ids=mls_ids,
+        property_types=property_types,
+        statuses=statuses,
+        incremental=incremental,
+        start_time=start_time,
+        end_time=end_time,
+        batch_size=batch_size,
+        expansions=expansions,
+        limiter=limiter,
+        progress=progress,
+        label=label,
+        checkpoint=checkpoint
+    ):
+        all_listings.extend(page)
     return all_listings
 
 
-def save_to_file(listings, mls_names, incremental=False):
-    """Save listings to JSON file"""
+def listing_key(listing):
+    """ListingKey of a raw (unflattened) Spark listing"""
+    return listing.get("StandardFields", {}).get("ListingKey") or listing.get("Id")
+
+
+def plan_partitions(mls_ids, property_types, statuses, partitions, limiter=None):
+    """
+    Split a full pull into disjoint ModificationTimestamp windows
+
+    Starts with one window from PARTITION_FLOOR to tomorrow and repeatedly
+    bisects the window holding the most records (by get_total_count) until
+    there are `partitions` non-empty windows. Window ends stop 1ms short of the
+    next start so no listing falls in two windows.
+
+    Returns:
+        List of (start, end, count) tuples ordered oldest to newest
+    """
+    one_ms = timedelta(milliseconds=1)
+
+    def count(start, end):
+        query = build_filter(mls_ids, property_types, statuses, start_time=start, end_time=end)
+        total = get_total_count(query, limiter)
+        if total is None:
+            raise Exception(f"[ERROR] Could not count partition {start.isoformat()} - {end.isoformat()}")
+        return total
+
+    start = PARTITION_FLOOR
+    # End in the future so listings modified during the pull still land in the last window
+    end = (datetime.utcnow() + timedelta(days=1)).replace(microsecond=0)
+    windows = [(start, end, count(start, end))]
+
+    for _ in range(partitions * 6):
+        windows = [w for w in windows if w[2] > 0]
+        if len(windows) >= partitions or not windows:
+            break
+
+        idx = max(range(len(windows)), key=lambda i: windows[i][2])
+        w_start, w_end, w_count = windows[idx]
+        if w_end - w_start < timedelta(minutes=2):
+            break  # Can't usefully split any further
+
+        mid = (w_start + (w_end - w_start) / 2).replace(microsecond=0)
+        left = count(w_start, mid - one_ms)
+        windows[idx:idx + 1] = [(w_start, mid - one_ms, left), (mid, w_end, w_count - left)]
+
+    return windows
+
+
+def fetch_partitioned(
+    mls_ids,
+    property_types=["A", "B", "C", "D"],
+    statuses=["Active"],
+    batch_size=500,
+    expansions=None,
+    partitions=8,
+    limiter=None
+):
+    """
+    Full pull split into time-sliced partitions fetched concurrently
+
+    Each window from plan_partitions() runs its own SkipToken chain on a
+    worker thread; all of them share one TokenBucket so the account-wide rate
+    limit holds. Each partition's fetched count is checked against its planned
+    count, and results are merged in window order (oldest to newest), so the
+    output is the same no matter which partition finishes first. A listing
+    modified mid-pull can show up in two windows; the newer copy wins.
+
+    Returns:
+        List of listing dictionaries
+    """
+    if limiter is None:
+        limiter = TokenBucket()
+
+    label = ', '.join(mls_ids)
+    print(f"\n>>> Planning {partitions} partitions for {label}...")
+    windows = plan_partitions(mls_ids, property_types, statuses, partitions, limiter)
+    for i, (start, end, expected) in enumerate(windows, 1):
+        print(f"    p{i}: {start.isoformat()} -> {end.isoformat()}  ({expected:,} records)")
+
+    results = [None] * len(windows)
+    with ThreadPoolExecutor(max_workers=max(1, len(windows))) as executor:
+        futures = {
+            executor.submit(
+                fetch_listings,
+                mls_ids=mls_ids,
+                property_types=property_types,
+                statuses=statuses,
+                start_time=start,
+                end_time=end,
+                batch_size=batch_size,
+                expansions=expansions,
+                limiter=limiter,
+                progress=False,
+                label=f"{label} p{i + 1}/{len(windows)}"
+            ): i
+            for i, (start, end, _) in enumerate(windows)
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+
+    # Per-partition count check
+    mismatches = 0
+    for i, ((start, end, expected), listings) in enumerate(zip(windows, results), 1):
+        if len(listings) != expected:
+            mismatches += 1
+            print(f"[WARN] p{i}: expected {expected:,}, got {len(listings):,}")
+    if not mismatches:
+        print(f"[OK] All {len(windows)} partitions match their planned counts")
+
+    # Deterministic merge: window order, later (newer) copy of a ListingKey wins
+    merged = {}
+    unkeyed = []
+    for listings in results:
+        for listing in listings:
+            key = listing_key(listing)
+            if key:
+                merged[key] = listing
+            else:
+                unkeyed.append(listing)
+
+    duplicates = sum(len(r) for r in results) - len(merged) - len(unkeyed)
+    if duplicates:
+        print(f">>> Dropped {duplicates:,} duplicate listing(s) modified during the pull")
+
+    return list(merged.values()) + unkeyed
+
+
+def stream_listings(
+    mls_name,
+    collection,
+    statuses=["Active"],
+    incremental=False,
+    batch_size=500,
+    expansions=DEFAULT_EXPANSIONS,
+    limiter=None,
+    progress=True,
+    force=False
+):
+    """
+    Streaming pipeline: fetch -> flatten -> seed without intermediate files
+
+    Each Spark page is cleaned, flattened and handed to seed.seed_stream(), which
+    writes bounded bulk batches to MongoDB while later pages are still being
+    fetched. Peak memory is a few pages regardless of how big the MLS is.
+
+    Safe to run for several MLSs at once from a thread pool as long as they
+    share one limiter (see run-pipeline.py --parallel). Listings whose
+    contentHash is unchanged are not re-written unless force is set.
+
+    Returns:
+        (fetched, updated, skipped, failed, unchanged)
+    """
+    import flatten
+    import seed
+
+    fetched = 0
+
+    def counted(pages):
+        nonlocal fetched
+        for page in pages:
+            fetched += len(page)
+            yield page
+
+    pages = iter_listing_pages(
+        mls_ids=[mls_name],
+        statuses=statuses,
+        incremental=incremental,
+        batch_size=batch_size,
+        expansions=expansions,
+        limiter=limiter,
+        progress=progress
+    )
+    flattened = (
+        flat
+        for page in counted(pages)
+        for flat in map(flatten.flatten_listing, page)
+        if flat
+    )
+    label = "" if progress else mls_name
+    updated, skipped, failed, unchanged = seed.seed_stream(flattened, collection, batch_size=500, label=label, force=force)
+    return fetched, updated, skipped, failed, unchanged
+
+
+def save_to_file(listings, mls_names, incremental=False, fmt="json"):
+    """Save listings to a snapshot file (json, ndjson or parquet; see snapshot.py)"""
     if incremental:
-        filename = f"incremental_{'_'.join(mls_names)}_listings.json"
+        filename = f"incremental_{'_'.join(mls_names)}_listings"
     else:
-        filename = f"all_{'_'.join(mls_names)}_listings.json"
+        filename = f"all_{'_'.join(mls_names)}_listings"
 
-    output_file = LOCAL_LOGS_DIR / filename
+    output_file = snapshot_path(LOCAL_LOGS_DIR / filename, fmt)
 
     try:
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(listings, f, indent=2)
+        write_snapshot(listings, output_file)
 
         print(f"\n>>> Saved {len(listings):,} listings to: {output_file}")
         return output_file
@@ -387,9 +662,46 @@ def main():
         default=500,
         help="Records per API request (max 1000)"
     )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Flatten and seed each page into unified_listings as it arrives (no JSON files)"
+    )
+    parser.add_argument(
+        "--partitions",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Split a full pull into N ModificationTimestamp windows fetched concurrently"
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=4.0,
+        help="Spark requests/sec shared by all partition workers (default: 4)"
+    )
+    parser.add_argument(
+        "--format",
+        choices=list(FORMATS),
+        default="json",
+        help="Snapshot file format: json (default), ndjson (gzip'd) or parquet (needs pyarrow)"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="With --stream: write every listing even when its contentHash is unchanged"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume each MLS from its last checkpointed page instead of starting over"
+    )
 
     args = parser.parse_args()
 
+    if args.partitions and (args.incremental or args.stream):
+        parser.error("--partitions is for full file-based pulls; drop --incremental/--stream")
+
     # Determine MLS list to process
     if args.mls:
         mls_list = args.mls
@@ -401,10 +713,18 @@ def main():
         print("Unified MLS Fetch - Spark Replication API")
         print("=" * 80)
         print(f"Mode: {'Auto-confirm (--yes)' if args.yes else 'Interactive prompts'}")
+        print(f"Output: {'Streaming to MongoDB' if args.stream else f'{args.format} files'}")
         print(f"MLSs to fetch: {', '.join(mls_list)}")
         print(f"Total MLSs: {len(mls_list)}")
         print("=" * 80 + "\n")
 
+        collection = None
+        if args.stream:
+            import seed
+            client, db = seed.connect_to_mongodb()
+            collection = db["unified_listings"]
+            seed.create_indexes(collection)
+
         total_fetched = 0
         completed_mls = []
         skipped_mls = []
@@ -422,22 +742,74 @@ def main():
                     skipped_mls.append(mls_name)
                     continue
 
+            # Stream this MLS straight into MongoDB
+            if args.stream:
+                try:
+                    fetched, updated, skipped, failed, unchanged = stream_listings(
+                        mls_name,
+                        collection,
+                        statuses=args.status,
+                        incremental=args.incremental,
+                        batch_size=args.batch_size,
+                        expansions=DEFAULT_EXPANSIONS,
+                        force=args.force
+                    )
+                    total_fetched += fetched
+                    completed_mls.append(mls_name)
+
+                    print("\n" + "-" * 80)
+                    print(f"{mls_name} Summary:")
+                    print(f"  Fetched: {fetched:,}")
+                    print(f"  Updated: {updated:,}")
+                    print(f"  Unchanged: {unchanged:,}")
+                    print(f"  Skipped: {skipped:,}")
+                    print(f"  Failed: {failed:,}")
+                    print("-" * 80)
+                except Exception as e:
+                    print(f"\n[ERROR] Failed to stream {mls_name}: {e}")
+                    skipped_mls.append(mls_name)
+                continue
+
             # Fetch from this MLS
+            checkpoint = None
             try:
-                listings = fetch_listings(
-                    mls_ids=[mls_name],  # Single MLS at a time
-                    statuses=args.status,
-                    incremental=args.incremental,
-                    batch_size=args.batch_size,
-                    expansions=["Media", "OpenHouses", "VirtualTours"]
-                )
+                if args.partitions > 1:
+                    listings = fetch_partitioned(
+                        mls_ids=[mls_name],
+                        statuses=args.status,
+                        batch_size=args.batch_size,
+                        expansions=DEFAULT_EXPANSIONS,
+                        partitions=args.partitions,
+                        limiter=TokenBucket(rate=args.rate)
+                    )
+                else:
+                    # Every page is checkpointed so a failed run can --resume
+                    mode = "incremental" if args.incremental else "all"
+                    checkpoint = PageCheckpoint(CHECKPOINT_DIR, f"{mode}_{mls_name}_{'_'.join(args.status)}")
+                    if args.resume and not checkpoint.load():
+                        print(f"[WARN] No checkpoint for {mls_name}; starting from the first page")
+
+                    listings = fetch_listings(
+                        mls_ids=[mls_name],  # Single MLS at a time
+                        statuses=args.status,
+                        incremental=args.incremental,
+                        batch_size=args.batch_size,
+                        expansions=DEFAULT_EXPANSIONS,
+                        checkpoint=checkpoint
+                    )
 
                 if not listings:
                     print(f"\n[WARN] No listings fetched from {mls_name}")
+                    if checkpoint:
+                        checkpoint.clear()
                     continue
 
                 # Save to individual MLS file
-                output_file = save_to_file(listings, [mls_name], args.incremental)
+                output_file = save_to_file(listings, [mls_name], args.incremental, args.format)
+                if checkpoint and checkpoint.state["complete"]:
+                    checkpoint.clear()
+                elif checkpoint:
+                    print(f"[WARN] {mls_name} stopped before the last page; checkpoint kept for --resume")
 
                 # Track progress
                 total_fetched += len(listings)
@@ -452,6 +824,8 @@ def main():
 
             except Exception as e:
                 print(f"\n[ERROR] Failed to fetch {mls_name}: {e}")
+                if checkpoint and checkpoint.state:
+                    print(f"[*] Checkpoint kept at page {checkpoint.state['page']}; rerun with --resume to continue")
                 skipped_mls.append(mls_name)
                 continue
 
@@ -466,6 +840,7 @@ def main():
             print(f"Skipped: {len(skipped_mls)} MLSs")
             print(f"  - {', '.join(skipped_mls)}")
         print(f"Total listings fetched: {total_fetched:,}")
+        SPARK.print_metrics()
         print("=" * 80 + "\n")
 
     except Exception as e:
@@ -7,25 +7,37 @@ Moves Closed/Sold listings to a separate collection.
 
 Features:
 - Checks status changes for all Active/Pending/Hold/ComingSoon listings
+- Bulk reconciliation: pages whole MLSs from Spark (_select'd to 3 fields),
+  diffs in memory and applies all changes with bulk_write
 - Moves Closed/Sold listings to closed_listings collection
+- Buffered StatusWriter: ordered=False bulk writes, batched copy-then-delete
+  moves with idempotent retry
 - Updates status timestamps
-- Rate limiting and batch processing
 - Detailed logging
 
 Usage:
+    # Bulk reconciliation (default)
     python src/scripts/mls/backend/unified/update-status.py
+
+    # Legacy: one Spark request per listing
+    python src/scripts/mls/backend/unified/update-status.py --per-listing
 """
 
 import os
 import json
 import time
-import requests
+import argparse
+import threading
 from pathlib import Path
 from datetime import datetime, timezone
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 
+from spark_client import SparkClient, SparkError
+from concurrency import AdaptiveConcurrency
+
 # ──────────────────────────────────────────────────────────────────────────────
 # 🔧 ENV & CONFIG
 # ──────────────────────────────────────────────────────────────────────────────
@@ -40,14 +52,24 @@ BASE_URL = "https://replication.sparkapi.com/v1/listings"
 if not ACCESS_TOKEN or not MONGO_URI:
     raise ValueError("❌ Missing SPARK_ACCESS_TOKEN or MONGODB_URI in .env.local")
 
-HEADERS = {
-    "Authorization": f"Bearer {ACCESS_TOKEN}",
-    "Accept": "application/json",
-}
+# Per-listing workers: in-flight requests tuned from latency and 429s (AIMD),
+# starting from last run's limit; replaces the fixed sleeps and batch rests
+CONCURRENCY = AdaptiveConcurrency("update-status", initial=5, maximum=16)
+
+# Pooled keep-alive connections shared by the worker threads
+SPARK = SparkClient(ACCESS_TOKEN, pool_size=CONCURRENCY.maximum, concurrency=CONCURRENCY)
 
 LOG_DIR = Path(__file__).resolve().parents[5] / "local-logs" / "status-logs"
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 
+# Local statuses we keep reconciling against Spark
+ACTIVE_STATUSES = ["Active", "Pending", "Hold", "ComingSoon"]
+STATUS_FIELDS = "ListingKey,StandardStatus,StatusChangeTimestamp"
+PAGE_SIZE = 1000          # Spark replication max
+LOOKUP_BATCH_SIZE = 50    # ListingKeys OR'ed into one lookup request
+WRITE_BATCH_SIZE = 1000   # Operations per bulk_write
+WRITE_RETRIES = 3         # Attempts per batch on transient Mongo errors
+
 # ──────────────────────────────────────────────────────────────────────────────
 # 🗃️ DATABASE
 # ──────────────────────────────────────────────────────────────────────────────
@@ -69,155 +91,277 @@ def fetch_listing_status(listing_key: str, mls_id: str):
     Uses MlsId filter to ensure we query the correct MLS association.
     """
     # Use filter approach (Diego's method) for multi-MLS support
-    url = f"{BASE_URL}?_filter=MlsId Eq '{mls_id}' And ListingKey Eq '{listing_key}'&_select=ListingKey,StandardStatus,StatusChangeTimestamp&_limit=1"
+    url = f"{BASE_URL}?_filter=MlsId Eq '{mls_id}' And ListingKey Eq '{listing_key}'&_select={STATUS_FIELDS}&_limit=1"
 
-    for attempt in range(3):
-        try:
-            res = requests.get(url, headers=HEADERS, timeout=15)
-            if res.status_code == 200:
-                data = res.json().get("D", {}).get("Results", [])
-                if data:
-                    return data[0].get("StandardFields", {})
-                return None  # No results = listing removed/off-market
-            elif res.status_code in (403, 404):
-                return None  # Listing removed/off-market
-            elif res.status_code == 429:
-                wait = 3 + attempt * 2
-                print(f"⏳ Rate limited on {listing_key}, waiting {wait}s...")
-                time.sleep(wait)
-            else:
-                print(f"⚠️ HTTP {res.status_code}: {res.text[:120]}")
-        except requests.RequestException as e:
-            print(f"⚠️ Network error for {listing_key}: {e}")
-        time.sleep(2 + attempt)
-    return None
+    try:
+        res = SPARK.get(url)
+    except SparkError as e:
+        print(f"⚠️ Spark error for {listing_key}: {e}")
+        return None
+
+    if res.status_code == 200:
+        data = res.json().get("D", {}).get("Results", [])
+        if data:
+            return data[0].get("StandardFields", {})
+        return None  # No results = listing removed/off-market
+    elif res.status_code not in (403, 404):
+        print(f"⚠️ HTTP {res.status_code}: {res.text[:120]}")
+    return None  # 403/404 = listing removed/off-market
 
 # ──────────────────────────────────────────────────────────────────────────────
-# 🔁 CHECK & UPDATE SINGLE LISTING
+# ⚖️ DECIDE: LOCAL VS SPARK
 # ──────────────────────────────────────────────────────────────────────────────
 
-def check_listing(listing):
-    """Compare Spark vs local StatusChangeTimestamp and update if newer."""
-    listing_key = str(listing.get("listingKey"))
-    mls_id = str(listing.get("mlsId"))
-    mls_source = listing.get("mlsSource", "UNKNOWN")
-
-    if not listing_key or len(listing_key) < 20 or not mls_id:
-        return f"⚠️ Skipping invalid key: {listing_key} (mlsId: {mls_id})"
-
-    local_status = listing.get("standardStatus")
-    local_ts = listing.get("statusChangeTimestamp")
+def decide(listing, spark):
+    """
+    Compare one local listing with its Spark status fields.
+
+    Returns (kind, fields) where kind is one of:
+        "offmarket"  not found in Spark → mark OffMarket
+        "sold"       now Closed → move to closed_listings (fields overlay the full doc)
+        "status"     any other status change (Active → Pending, etc.)
+        "timestamp"  same status, newer StatusChangeTimestamp
+        "unchanged"  nothing to do (fields is None)
+    """
+    checked = datetime.now(timezone.utc).isoformat()
 
-    spark = fetch_listing_status(listing_key, mls_id)
     if not spark:
         # Listing not found in Spark API = OffMarket or removed
-        collection.update_one(
-            {"listingKey": listing_key},
-            {"$set": {
-                "standardStatus": "OffMarket",
-                "statusLastChecked": datetime.now(timezone.utc).isoformat(),
-            }},
-        )
-        return f"❌ [{mls_source}] {listing_key} appears OffMarket or removed"
+        return "offmarket", {"standardStatus": "OffMarket", "statusLastChecked": checked}
 
+    local_status = listing.get("standardStatus")
+    local_ts = listing.get("statusChangeTimestamp")
     spark_status = spark.get("StandardStatus")
     spark_ts = spark.get("StatusChangeTimestamp")
 
     # Status changed?
     if spark_status != local_status:
-        # CLOSED/SOLD → Move to closed_listings collection
+        fields = {
+            "standardStatus": spark_status,
+            "statusChangeTimestamp": spark_ts or local_ts,
+            "statusLastChecked": checked,
+        }
         if spark_status == "Closed":
-            full_listing = collection.find_one({"listingKey": listing_key})
-            if full_listing:
-                full_listing["standardStatus"] = spark_status
-                full_listing["statusChangeTimestamp"] = spark_ts or full_listing.get("statusChangeTimestamp")
-                full_listing["statusLastChecked"] = datetime.now(timezone.utc).isoformat()
-                full_listing["closedDate"] = datetime.now(timezone.utc).isoformat()
-                full_listing.pop("_id", None)  # Remove _id to avoid duplicate key error
-
-                closed_collection.update_one(
-                    {"listingKey": listing_key},
-                    {"$set": full_listing},
-                    upsert=True
-                )
-                collection.delete_one({"listingKey": listing_key})
-                return f"🏠💰 [{mls_source}] {listing_key}: {local_status} → SOLD (moved to closed_listings)"
-        else:
-            # Other status changes (Active → Pending, etc.)
-            collection.update_one(
-                {"listingKey": listing_key},
-                {"$set": {
-                    "standardStatus": spark_status,
-                    "statusChangeTimestamp": spark_ts or local_ts,
-                    "statusLastChecked": datetime.now(timezone.utc).isoformat(),
-                }},
-            )
-            return f"🔄 [{mls_source}] {listing_key}: {local_status} → {spark_status}"
+            fields["closedDate"] = checked
+            return "sold", fields
+        return "status", fields
 
     # Timestamp changed but status same?
     if spark_ts and local_ts:
         try:
             spark_dt = datetime.fromisoformat(spark_ts.replace("Z", "+00:00"))
             local_dt = datetime.fromisoformat(local_ts.replace("Z", "+00:00"))
-
             if spark_dt > local_dt:
-                collection.update_one(
-                    {"listingKey": listing_key},
-                    {"$set": {
-                        "statusChangeTimestamp": spark_ts,
-                        "statusLastChecked": datetime.now(timezone.utc).isoformat(),
-                    }},
-                )
-                return f"🔁 [{mls_source}] {listing_key}: timestamp updated"
+                return "timestamp", {"statusChangeTimestamp": spark_ts, "statusLastChecked": checked}
         except Exception:
             pass
 
-    # No changes
+    return "unchanged", None
+
+
+def describe(kind, listing, fields):
+    """Log line for a decision (the emoji prefixes drive the summary counters)"""
+    listing_key = listing.get("listingKey")
+    mls_source = listing.get("mlsSource", "UNKNOWN")
+    local_status = listing.get("standardStatus")
+
+    if kind == "offmarket":
+        return f"❌ [{mls_source}] {listing_key} appears OffMarket or removed"
+    if kind == "sold":
+        return f"🏠💰 [{mls_source}] {listing_key}: {local_status} → SOLD (moved to closed_listings)"
+    if kind == "status":
+        return f"🔄 [{mls_source}] {listing_key}: {local_status} → {fields['standardStatus']}"
+    if kind == "timestamp":
+        return f"🔁 [{mls_source}] {listing_key}: timestamp updated"
     return f"✅ [{mls_source}] {listing_key}: unchanged"
 
+
+def is_valid(listing):
+    listing_key = str(listing.get("listingKey"))
+    return bool(listing_key) and len(listing_key) >= 20 and bool(listing.get("mlsId"))
+
 # ──────────────────────────────────────────────────────────────────────────────
-# 🚀 MAIN EXECUTION WITH BATCH REST
+# 💾 BUFFERED WRITER
 # ──────────────────────────────────────────────────────────────────────────────
 
-def main():
-    print("=" * 80)
-    print("Unified Status Update - Check All MLSs for Status Changes")
-    print("=" * 80)
+class StatusWriter:
+    """
+    Buffers status decisions and writes them in bulk (thread-safe).
+
+    - offmarket / status / timestamp → UpdateOne $set on unified_listings
+      (clearing contentHash so seed.py does not treat the doc as unchanged),
+      flushed as ordered=False bulk_write batches of WRITE_BATCH_SIZE
+    - sold → batched move: read the full docs with one $in query, upsert them
+      into closed_listings with one bulk_write, then delete_many only the keys
+      that were copied
+
+    Every step is idempotent ($set / upsert by listingKey, delete by key), so a
+    batch that hits a transient Mongo error is simply retried, and a crash
+    between copy and delete is repaired by the next run re-moving the listing.
+    """
 
-    active_statuses = ["Active", "Pending", "Hold", "ComingSoon"]
-    query = {"standardStatus": {"$in": active_statuses}}
+    def __init__(self, batch_size=WRITE_BATCH_SIZE, retries=WRITE_RETRIES):
+        self.batch_size = batch_size
+        self.retries = retries
+        self.lock = threading.Lock()
+        self.updates = []
+        self.sold = {}
+        self.stats = {"updated": 0, "failed": 0, "moved": 0, "move_failed": 0, "batches": 0}
+
+    def add(self, kind, listing_key, fields):
+        """Queue one decision from decide(); flushes when a buffer fills"""
+        if kind == "unchanged":
+            return
+
+        updates = sold = None
+        with self.lock:
+            if kind == "sold":
+                self.sold[listing_key] = fields
+                if len(self.sold) >= self.batch_size:
+                    sold, self.sold = self.sold, {}
+            else:
+                # Drop the seed's contentHash so the next fetch re-writes this doc
+                self.updates.append(UpdateOne(
+                    {"listingKey": listing_key},
+                    {"$set": fields, "$unset": {"contentHash": ""}}
+                ))
+                if len(self.updates) >= self.batch_size:
+                    updates, self.updates = self.updates, []
+
+        # Write outside the lock so other workers keep queueing
+        if updates:
+            self._write_updates(updates)
+        if sold:
+            self._move_sold(sold)
+
+    def flush(self):
+        with self.lock:
+            updates, self.updates = self.updates, []
+            sold, self.sold = self.sold, {}
+        if updates:
+            self._write_updates(updates)
+        if sold:
+            self._move_sold(sold)
+
+    def close(self):
+        """Flush everything and return the write stats"""
+        self.flush()
+        s = self.stats
+        print(f"💾 unified_listings: {s['updated']:,} updated, {s['failed']:,} failed | "
+              f"closed_listings: {s['moved']:,} moved, {s['move_failed']:,} failed | "
+              f"{s['batches']:,} bulk batches")
+        return dict(s)
+
+    def _count(self, **deltas):
+        with self.lock:
+            for key, value in deltas.items():
+                self.stats[key] += value
+
+    def _write_updates(self, operations):
+        for attempt in range(self.retries):
+            try:
+                result = collection.bulk_write(operations, ordered=False)
+                self._count(updated=result.modified_count or 0, batches=1)
+                return
+            except BulkWriteError as e:
+                # Per-document errors (validation, etc.) won't succeed on retry
+                details = e.details or {}
+                self._count(
+                    updated=details.get("nModified", 0),
+                    failed=len(details.get("writeErrors", [])),
+                    batches=1
+                )
+                return
+            except PyMongoError as e:
+                print(f"⚠️ unified_listings batch failed (attempt {attempt + 1}/{self.retries}): {e}")
+                time.sleep(2 ** attempt)
+        self._count(failed=len(operations))
+
+    def _move_sold(self, overlay):
+        """Copy sold listings to closed_listings, then delete the copied ones"""
+        pending = dict(overlay)
+        for attempt in range(self.retries):
+            try:
+                docs = list(collection.find({"listingKey": {"$in": list(pending)}}))
+                found = {doc["listingKey"] for doc in docs}
+
+                # Not in unified_listings any more: already moved by an earlier attempt
+                for key in set(pending) - found:
+                    pending.pop(key)
+
+                ops = []
+                keys = []
+                for doc in docs:
+                    doc.pop("_id", None)  # Remove _id to avoid duplicate key error
+                    doc.pop("contentHash", None)  # Hash no longer matches once status fields change
+                    doc.update(pending[doc["listingKey"]])
+                    ops.append(UpdateOne({"listingKey": doc["listingKey"]}, {"$set": doc}, upsert=True))
+                    keys.append(doc["listingKey"])
+
+                if not ops:
+                    break
+
+                rejected = []
+                try:
+                    closed_collection.bulk_write(ops, ordered=False)
+                    copied = keys
+                except BulkWriteError as e:
+                    # Per-document errors won't succeed on retry: count them now, like _write_updates
+                    bad = {err["index"] for err in (e.details or {}).get("writeErrors", [])}
+                    copied = [k for idx, k in enumerate(keys) if idx not in bad]
+                    rejected = [k for idx, k in enumerate(keys) if idx in bad]
+
+                if copied:
+                    deleted = collection.delete_many({"listingKey": {"$in": copied}}).deleted_count
+                    self._count(moved=deleted)
+                for key in copied + rejected:
+                    pending.pop(key, None)
+                if rejected:
+                    self._count(move_failed=len(rejected))
+                    print(f"⚠️ closed_listings rejected {len(rejected):,} sold listings; left in unified_listings")
+                self._count(batches=1)
+
+                if not pending:
+                    break
+            except PyMongoError as e:
+                print(f"⚠️ closed_listings move failed (attempt {attempt + 1}/{self.retries}): {e}")
+                time.sleep(2 ** attempt)
+
+        if pending:
+            self._count(move_failed=len(pending))
+            print(f"⚠️ {len(pending):,} sold listings not moved; they will be retried next run")
 
-    listings = list(collection.find(query, {
-        "listingKey": 1,
-        "mlsId": 1,
-        "mlsSource": 1,
-        "standardStatus": 1,
-        "statusChangeTimestamp": 1
-    }))
+# ──────────────────────────────────────────────────────────────────────────────
+# 🔁 CHECK & UPDATE SINGLE LISTING (legacy --per-listing mode)
+# ──────────────────────────────────────────────────────────────────────────────
 
-    total = len(listings)
-    print(f"\n🔍 Checking Spark status for {total:,} listings ({', '.join(active_statuses)})")
+def check_listing(listing, writer):
+    """Compare Spark vs local StatusChangeTimestamp and queue any change on writer."""
+    listing_key = str(listing.get("listingKey"))
+    mls_id = str(listing.get("mlsId"))
 
-    # MLS breakdown
-    mls_counts = {}
-    for listing in listings:
-        mls = listing.get("mlsSource", "UNKNOWN")
-        mls_counts[mls] = mls_counts.get(mls, 0) + 1
+    if not is_valid(listing):
+        return f"⚠️ Skipping invalid key: {listing_key} (mlsId: {mls_id})"
+
+    spark = fetch_listing_status(listing_key, mls_id)
+    kind, fields = decide(listing, spark)
+    writer.add(kind, listing_key, fields)
+    return describe(kind, listing, fields)
 
-    print("\nMLS Breakdown:")
-    for mls, count in sorted(mls_counts.items(), key=lambda x: x[1], reverse=True):
-        print(f"  {mls.ljust(25)}: {count:,}")
-    print()
 
+def run_per_listing(listings):
+    """One Spark request per listing, as many in flight as CONCURRENCY allows (the original mode)"""
+    total = len(listings)
     changed = 0
     removed = 0
     sold = 0
     checked = 0
-    batch_size = 1000
+    progress_every = 1000
     start_time = time.time()
+    writer = StatusWriter()
 
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = {executor.submit(check_listing, l): l for l in listings}
+    with ThreadPoolExecutor(max_workers=CONCURRENCY.maximum) as executor:
+        futures = {executor.submit(check_listing, l, writer): l for l in listings}
 
         for i, future in enumerate(as_completed(futures), 1):
             try:
@@ -232,19 +376,171 @@ def main():
                     removed += 1
 
                 print(f"[{i:,}/{total:,}] {result}")
-                time.sleep(0.18)  # Micro-throttle to avoid rate limits
 
             except Exception as e:
                 print(f"❌ Worker error: {e}")
 
-            # ─── BATCH PAUSE ─────────────────────────────────────────────────────
-            if i % batch_size == 0:
+            # ─── PROGRESS ────────────────────────────────────────────────────────
+            if i % progress_every == 0:
                 elapsed = time.time() - start_time
                 rate = i / elapsed if elapsed > 0 else 0
-                print(f"\n😴 Processed {i:,} listings — resting for 60 seconds to avoid rate limits...")
-                print(f"   Rate: {rate:.1f} listings/sec | Elapsed: {elapsed/60:.1f} min")
-                time.sleep(60)
-                print("✅ Resuming updates...\n")
+                c = CONCURRENCY.snapshot()
+                print(f"\n📈 Processed {i:,} listings | Rate: {rate:.1f} listings/sec | "
+                      f"Elapsed: {elapsed/60:.1f} min | Concurrency: {c['limit']} (peak {c['peak']})\n")
+
+    stats = writer.close()
+    return checked, changed, stats["moved"], removed
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 📦 BULK RECONCILIATION (default mode)
+# ──────────────────────────────────────────────────────────────────────────────
+
+def iter_status_pages(filter_query):
+    """SkipToken-page the status fields of every listing matching a filter"""
+    skiptoken = ""
+    while True:
+        url = f"{BASE_URL}?_limit={PAGE_SIZE}&_select={STATUS_FIELDS}&_filter={filter_query}&_skiptoken={skiptoken}"
+        data = SPARK.get_json(url).get("D", {})
+        results = data.get("Results", [])
+        if not results:
+            return
+        yield [r.get("StandardFields", {}) for r in results]
+
+        new_skiptoken = data.get("SkipToken")
+        if not new_skiptoken or new_skiptoken == skiptoken:
+            return
+        skiptoken = new_skiptoken
+
+
+def fetch_mls_statuses(mls_id, listing_keys):
+    """
+    Spark status fields for a set of local listings in one MLS.
+
+    1. Page every listing in the MLS that Spark still has in ACTIVE_STATUSES
+    2. Keys not seen there changed status (or vanished): look them up in
+       OR-batched ListingKey filters of LOOKUP_BATCH_SIZE
+
+    Returns (found, looked_up): found maps ListingKey → StandardFields; keys
+    missing from it are gone from Spark. Raises if Spark can't be read, so a
+    failed MLS is never mistaken for "everything went OffMarket".
+    """
+    wanted = set(listing_keys)
+    found = {}
+
+    status_filter = " Or ".join(f"StandardStatus Eq '{s}'" for s in ACTIVE_STATUSES)
+    for page in iter_status_pages(f"MlsId Eq '{mls_id}' And ({status_filter})"):
+        for fields in page:
+            key = fields.get("ListingKey")
+            if key in wanted:
+                found[key] = fields
+
+    missing = sorted(wanted - found.keys())
+    for i in range(0, len(missing), LOOKUP_BATCH_SIZE):
+        chunk = missing[i:i + LOOKUP_BATCH_SIZE]
+        key_filter = " Or ".join(f"ListingKey Eq '{k}'" for k in chunk)
+        for page in iter_status_pages(f"MlsId Eq '{mls_id}' And ({key_filter})"):
+            for fields in page:
+                key = fields.get("ListingKey")
+                if key in wanted:
+                    found[key] = fields
+
+    return found, len(missing)
+
+
+def run_bulk(listings):
+    """Reconcile every MLS with a handful of paged requests and bulk writes"""
+    by_mls = {}
+    invalid = 0
+    for listing in listings:
+        if not is_valid(listing):
+            invalid += 1
+            continue
+        listing["listingKey"] = str(listing["listingKey"])
+        by_mls.setdefault(str(listing["mlsId"]), []).append(listing)
+
+    if invalid:
+        print(f"⚠️ Skipping {invalid:,} listings with invalid listingKey/mlsId")
+
+    writer = StatusWriter()
+    changed = 0
+    removed = 0
+    checked = 0
+    for mls_id, group in by_mls.items():
+        mls_source = group[0].get("mlsSource", "UNKNOWN")
+        mls_start = time.time()
+        print(f"🔍 [{mls_source}] Reconciling {len(group):,} listings...")
+
+        try:
+            found, looked_up = fetch_mls_statuses(mls_id, [l["listingKey"] for l in group])
+        except Exception as e:
+            print(f"❌ [{mls_source}] Could not read Spark statuses, leaving this MLS untouched: {e}")
+            continue
+
+        counts = {}
+        for listing in group:
+            kind, fields = decide(listing, found.get(listing["listingKey"]))
+            counts[kind] = counts.get(kind, 0) + 1
+            if kind != "unchanged":
+                print(describe(kind, listing, fields))
+                writer.add(kind, listing["listingKey"], fields)
+        checked += len(group)
+        changed += counts.get("status", 0) + counts.get("timestamp", 0)
+        removed += counts.get("offmarket", 0)
+
+        summary = ", ".join(f"{k}: {v:,}" for k, v in sorted(counts.items()))
+        print(f"   [{mls_source}] {summary} | {looked_up:,} key lookups | {time.time() - mls_start:.0f}s\n")
+
+    stats = writer.close()
+    return checked, changed, stats["moved"], removed
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 🚀 MAIN EXECUTION
+# ──────────────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile listing statuses with Spark")
+    parser.add_argument(
+        "--per-listing",
+        action="store_true",
+        help="Legacy mode: one Spark request per listing (slow; hours for all MLSs)"
+    )
+    args = parser.parse_args()
+    mode = "per-listing" if args.per_listing else "bulk"
+
+    print("=" * 80)
+    print("Unified Status Update - Check All MLSs for Status Changes")
+    print(f"Mode: {mode}")
+    print("=" * 80)
+
+    query = {"standardStatus": {"$in": ACTIVE_STATUSES}}
+
+    listings = list(collection.find(query, {
+        "listingKey": 1,
+        "mlsId": 1,
+        "mlsSource": 1,
+        "standardStatus": 1,
+        "statusChangeTimestamp": 1
+    }))
+
+    total = len(listings)
+    print(f"\n🔍 Checking Spark status for {total:,} listings ({', '.join(ACTIVE_STATUSES)})")
+
+    # MLS breakdown
+    mls_counts = {}
+    for listing in listings:
+        mls = listing.get("mlsSource", "UNKNOWN")
+        mls_counts[mls] = mls_counts.get(mls, 0) + 1
+
+    print("\nMLS Breakdown:")
+    for mls, count in sorted(mls_counts.items(), key=lambda x: x[1], reverse=True):
+        print(f"  {mls.ljust(25)}: {count:,}")
+    print()
+
+    start_time = time.time()
+    if args.per_listing:
+        checked, changed, sold, removed = run_per_listing(listings)
+    else:
+        checked, changed, sold, removed = run_bulk(listings)
 
     # Summary
     elapsed_total = time.time() - start_time
@@ -257,11 +553,13 @@ def main():
     print(f"OffMarket/Removed:    {removed:,}")
     print(f"Unchanged:            {(checked - changed - sold - removed):,}")
     print(f"Total time:           {elapsed_total/60:.1f} minutes")
+    SPARK.print_metrics()
     print("=" * 80)
 
     # Save log
     log = {
         "timestamp": datetime.now(timezone.utc).isoformat(),
+        "mode": mode,
         "total_checked": checked,
         "status_updated": changed,
         "sold_moved_to_closed": sold,
@@ -269,6 +567,7 @@ def main():
         "unchanged": checked - changed - sold - removed,
         "elapsed_seconds": elapsed_total,
         "mls_breakdown": mls_counts,
+        "spark_metrics": SPARK.metrics(),
     }
 
     log_path = LOG_DIR / f"status_update_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"